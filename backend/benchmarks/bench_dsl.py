@@ -0,0 +1,105 @@
+"""
+Format compact (`dsl.py`) contre JSON pour la sortie du LLM de géométrie.
+
+Hors ligne : pour chaque plan du corpus, vérifie l'aller-retour plan -> DSL -> plan
+et compte les tokens de sortie des deux formats (tokenizer de `litellm.token_counter`).
+Avec `--live`, lance en plus le vrai outil sur les prompts de `check_guide_retrieval`
+dans les deux formats et mesure la latence de bout en bout (clés API nécessaires).
+
+Usage (depuis `backend/`, avec un .env valide) :
+    python -m benchmarks.bench_dsl [--live]
+"""
+import asyncio
+import json
+import sys
+import time
+
+import litellm
+
+from src.features.tools.geometry_2d.dsl import parse_dsl, plan_to_dsl
+from src.features.tools.geometry_2d.models import Geometry2DInput
+from src.features.tools.geometry_2d.tool import Geometry2DTool
+
+from .check_guide_retrieval import FIXTURES
+from .plans import build_plan
+
+TOKENIZER_MODEL = "gpt-4o"
+
+FIXTURE_PLANS = {
+    "triangle + cercle circonscrit": build_plan(17),
+    "grand plan (100 étapes)": build_plan(100),
+    "intersections": {"construction_steps": [
+        {"type": "def_point_coords", "id": "O", "coords": [0, 0]},
+        {"type": "def_point_coords", "id": "A", "coords": [3, 0]},
+        {"type": "def_point_coords", "id": "B", "coords": [-4, 2]},
+        {"type": "def_point_coords", "id": "C", "coords": [4, 3]},
+        {"type": "def_circle_by_center_point", "id": "c", "center": "O", "through_point": "A"},
+        {"type": "find_intersection_LC", "ids": ["I", "J"], "line_points": ["B", "C"],
+         "circle_def": {"by_center_point": ["O", "A"]}},
+        {"type": "def_line_by_points", "id": "d", "through": ["B", "C"]},
+        {"type": "draw_circles", "circle_ids": ["c"], "style": {"color": "blue"}},
+        {"type": "draw_lines", "line_ids": ["d"]},
+        {"type": "draw_points", "point_ids": ["O", "A", "I", "J"]},
+        {"type": "label_points", "custom_labels": {"I": {"position": "above left"}, "J": {"position": "below"}}},
+    ]},
+    "rotation et texte": {"figure_config": {"x_range": [-6, 6], "y_range": [-6, 6], "grid": True},
+                          "construction_steps": [
+        {"type": "def_point_coords", "id": "O", "coords": [0, 0]},
+        {"type": "def_point_coords", "id": "A", "coords": [2, 1]},
+        {"type": "def_point_coords", "id": "B", "coords": [4, 1]},
+        {"type": "def_point_coords", "id": "C", "coords": [3, 3]},
+        {"type": "def_points_by_rotation", "new_ids": ["A1", "B1", "C1"], "points_to_transform": ["A", "B", "C"],
+         "by": {"center": "O", "angle": 90}},
+        {"type": "draw_polygon", "point_ids": ["A", "B", "C"]},
+        {"type": "draw_polygon", "point_ids": ["A1", "B1", "C1"], "style": {"color": "red", "pattern": "dashed"}},
+        {"type": "calculate_length", "id": "l", "between_points": ["A", "B"]},
+        {"type": "draw_text", "coords": [-5, 5], "display_calculation": {"id_of_calculation": "l",
+                                                                         "format_template": "AB = {} cm"}},
+        {"type": "draw_points", "point_ids": ["O", "A", "B", "C", "A1", "B1", "C1"]},
+        {"type": "label_points", "point_ids": ["O", "A", "B", "C", "A1", "B1", "C1"]},
+    ]},
+}
+
+
+def count_tokens(text: str) -> int:
+    return litellm.token_counter(model=TOKENIZER_MODEL, text=text)
+
+
+def offline() -> bool:
+    print(f"{'plan':>30} | {'JSON':>6} | {'DSL':>6} | {'gain':>5} | aller-retour")
+    ok = True
+    for name, raw in FIXTURE_PLANS.items():
+        plan = Geometry2DInput.model_validate(raw)
+        as_json = plan.model_dump_json(exclude_defaults=True)
+        as_dsl = plan_to_dsl(plan)
+        same = Geometry2DInput.model_validate(parse_dsl(as_dsl)).model_dump() == plan.model_dump()
+        ok &= same
+        json_tokens, dsl_tokens = count_tokens(as_json), count_tokens(as_dsl)
+        print(f"{name:>30} | {json_tokens:>6} | {dsl_tokens:>6} | {1 - dsl_tokens / json_tokens:>5.0%} | "
+              f"{'ok' if same else 'DIFFÉRENT'}")
+    return ok
+
+
+async def live():
+    tool = Geometry2DTool()
+    tool.response_schema = False  # Comparaison à prompt égal
+    print(f"\n{'format':>6} | {'succès':>6} | {'latence moy. (s)':>16}")
+    for plan_format in ("json", "dsl"):
+        tool.plan_format = plan_format
+        durations, successes = [], 0
+        for prompt, _ in FIXTURES:
+            start = time.perf_counter()
+            try:
+                await tool.generate_plan(prompt)
+                successes += 1
+            except Exception as e:
+                print(f"  échec ({plan_format}) : {prompt} -> {e}")
+            durations.append(time.perf_counter() - start)
+        print(f"{plan_format:>6} | {successes:>3}/{len(FIXTURES):<2} | {sum(durations) / len(durations):>16.2f}")
+
+
+if __name__ == "__main__":
+    round_trip_ok = offline()
+    if "--live" in sys.argv:
+        asyncio.run(live())
+    sys.exit(0 if round_trip_ok else 1)
@@ -0,0 +1,66 @@
+"""
+Latence de bout en bout de `NeuclidChat.ainvoke` avec et sans hedging,
+contre le faux serveur LLM local (`fake_llm_server`).
+
+Modèle principal `openai/flaky` (rapide, mais 4 % des réponses en 3 s),
+secours `openai/steady` (0,3 s). Sans hedging, la queue du principal se voit
+dans le p99 ; avec, la requête doublée après le p95 observé la coupe.
+
+Usage (depuis `backend/`, avec un .env valide) :
+    python -m benchmarks.bench_hedging [requêtes]
+"""
+import asyncio
+import os
+import sys
+import time
+
+from langchain_core.messages import HumanMessage
+
+from src.core.llm import NeuclidChat, latency_tracker
+
+from .fake_llm_server import start_in_thread
+
+WARMUP = 20           # Requêtes pour apprendre le p95 du modèle principal
+CONCURRENCY = 10
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def run(llm: NeuclidChat, count: int):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await llm.ainvoke([HumanMessage(content="Trace le segment [AB]")])
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(count)))
+    return latencies
+
+
+async def main(count: int):
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    server, api_base = start_in_thread()
+    try:
+        settings = dict(model="openai/flaky", fallback_model_name="openai/steady",
+                        api_base=api_base, fallback_api_base=api_base,
+                        hedge_min_delay=0.2, request_deadline=30)
+        print(f"{'mode':>10} | {'p50 (s)':>8} | {'p99 (s)':>8} | {'max (s)':>8}")
+        for label, hedge in (("direct", False), ("hedging", True)):
+            llm = NeuclidChat(**settings, hedge_requests=hedge)
+            latency_tracker._samples.clear()
+            await run(llm, WARMUP)
+            latencies = await run(llm, count)
+            print(f"{label:>10} | {percentile(latencies, 0.5):>8.2f} | "
+                  f"{percentile(latencies, 0.99):>8.2f} | {max(latencies):>8.2f}")
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
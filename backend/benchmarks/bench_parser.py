@@ -0,0 +1,137 @@
+"""
+Benchmark de `extract_json_from_text` sur un corpus de sorties LLM « sales ».
+
+Compare l'ancienne extraction (json.loads -> regex non gourmande -> json_repair)
+au scanner linéaire d'accolades équilibrées + orjson. Les sorties reprennent les
+défauts vus en prod : bloc ```json, blabla autour, accolades dans les labels,
+virgule traînante, réponse tronquée, deux blocs de code.
+
+Ce corpus est synthétique : s'y ajoutent les vraies sorties de plan enregistrées
+par `llm_replay` (`LLM_BACKEND=record python -m benchmarks.bench_replay --record`),
+lues dans `LLM_RECORDINGS_PATH` ou dans le fichier JSONL passé en argument. Pour
+elles, « ok » veut dire : un objet avec `construction_steps`.
+
+Usage (depuis `backend/`, avec un .env valide) :
+    python -m benchmarks.bench_parser [enregistrements.jsonl]
+"""
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+import json_repair
+
+from src.config import settings
+from src.utils.parser import extract_json_from_text
+
+from .plans import build_plan
+
+SIZES = (17, 170, 850)  # ~2 KB, ~20 KB, ~100 KB
+MIN_DURATION = 0.3
+MAX_RECORDED = 20  # Sorties enregistrées mesurées au plus (les premières, sans doublon)
+
+
+# --- Ancienne implémentation (référence) -------------------------------------
+def legacy_extract_json_from_text(text):
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    match = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.DOTALL)
+    if match:
+        try:
+            return json.loads(match.group(1))
+        except json.JSONDecodeError:
+            pass
+    target_text = match.group(1) if match else text
+    decoded = json_repair.loads(target_text)
+    if isinstance(decoded, (dict, list)):
+        return decoded
+    raise ValueError("Parsed result is not a JSON object or list.")
+
+
+# --- Corpus ----------------------------------------------------------------------
+def build_corpus(num_steps):
+    """(nom, texte brut, dict attendu) pour chaque défaut typique."""
+    plan = build_plan(num_steps)
+    plan["construction_steps"][0]["label"] = "$\\{A\\}$"
+    raw = json.dumps(plan, indent=2)
+    trailing = raw[:-1].rstrip() + ",\n}"
+    fenced_plan = build_plan(num_steps)
+    fenced_plan["construction_steps"][0]["label"] = "} ```"
+    fenced_raw = json.dumps(fenced_plan, indent=2)
+    return [
+        ("json pur", raw, plan),
+        ("bloc ```json", f"```json\n{raw}\n```", plan),
+        ("prose autour", f"Voici la construction demandée :\n\n```json\n{raw}\n```\n\nN'hésitez pas !", plan),
+        ("sans bloc", f"Bien sûr. {raw} J'espère que ça aide.", plan),
+        ("fence dans label", f"```json\n{fenced_raw}\n```", fenced_plan),
+        ("deux blocs", f"Exemple : ```json\n{{\"note\": [1]}}\n```\nPlan : ```json\n{raw}\n```", plan),
+        ("virgule traînante", f"```json\n{trailing}\n```", plan),
+    ]
+
+
+def recorded_corpus(path: Path):
+    """(nom, texte brut, None) pour chaque sortie de plan JSON enregistrée (format DSL ignoré)."""
+    if not path.exists():
+        return []
+    corpus, seen = [], set()
+    with path.open(encoding="utf-8") as source:
+        for line in source:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            content = entry.get("content") or ""
+            if "construction_steps" not in content or content in seen:
+                continue
+            seen.add(content)
+            corpus.append((f"enregistré {len(corpus) + 1}", content, None))
+            if len(corpus) >= MAX_RECORDED:
+                break
+    return corpus
+
+
+def _rate(func, text) -> float:
+    runs, start = 0, time.perf_counter()
+    while True:
+        try:
+            func(text)
+        except Exception:
+            pass
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_DURATION:
+            return elapsed / runs
+
+
+def _verdict(func, text, expected) -> str:
+    try:
+        result = func(text)
+    except Exception:
+        return "échec"
+    if expected is None:  # Sortie enregistrée : pas de référence, on attend un plan
+        return "ok" if isinstance(result, dict) and "construction_steps" in result else "faux"
+    return "ok" if result == expected else "faux"
+
+
+def _report(name, text, expected):
+    legacy = _rate(legacy_extract_json_from_text, text) * 1000
+    current = _rate(extract_json_from_text, text) * 1000
+    verdicts = f"{_verdict(legacy_extract_json_from_text, text, expected)} / {_verdict(extract_json_from_text, text, expected)}"
+    print(f"{len(text) // 1024:>6}KB | {name:<18} | {legacy:>12.3f} | {current:>12.3f} | {legacy / current:>5.1f}x | {verdicts}")
+
+
+if __name__ == "__main__":
+    recordings_path = Path(sys.argv[1]) if len(sys.argv) > 1 else settings.LLM_RECORDINGS_PATH
+    print(f"{'taille':>8} | {'cas':<18} | {'ancien (ms)':>12} | {'actuel (ms)':>12} | {'gain':>6} | ancien / actuel")
+    for size in SIZES:
+        for case in build_corpus(size):
+            _report(*case)
+    recorded = recorded_corpus(recordings_path)
+    for case in recorded:
+        _report(*case)
+    if not recorded:
+        print(f"\nAucune sortie de plan enregistrée dans {recordings_path} : corpus synthétique seul.")
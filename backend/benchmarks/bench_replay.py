@@ -0,0 +1,94 @@
+"""
+Test de charge du pipeline `/generate` sans appels LLM réels (`llm_replay.py`).
+
+1. Enregistrer une fois les réponses (vraies clés API) :
+       LLM_BACKEND=record python -m benchmarks.bench_replay --record
+2. Rejouer autant de fois que voulu, hors ligne et à l'identique :
+       LLM_BACKEND=replay python -m benchmarks.bench_replay [requêtes] [concurrence]
+   (latence synthétique : LLM_REPLAY_LATENCY=recorded|lognormal|none)
+
+Les prompts sont ceux de `check_guide_retrieval`. Affiche la latence de bout en bout
+(p50 / p95 / p99) et le temps moyen par étape (`metrics_sink`). Avec `--plan-only`,
+s'arrête au plan validé (sans lualatex).
+
+Usage (depuis `backend/`, avec un .env valide) :
+    python -m benchmarks.bench_replay [--record] [--plan-only] [requêtes] [concurrence]
+"""
+import asyncio
+import sys
+import time
+
+from src.config import settings
+from src.core.llm_client import llm_client
+from src.core.metrics import metrics_sink, track_request
+from src.core.startup import register_application_tools
+from src.services.generation import generation_service
+
+from .bench_hedging import percentile
+from .check_guide_retrieval import FIXTURES
+
+PROMPTS = [prompt for prompt, _ in FIXTURES]
+
+
+async def one(prompt: str, plan_only: bool):
+    if not plan_only:
+        await generation_service.generate(prompt)
+        return
+    with track_request():
+        tool, speculative_plan = await generation_service._route(prompt)
+        if speculative_plan is not None:
+            await speculative_plan
+        else:
+            await tool.generate_plan(prompt)
+
+
+async def run(count: int, concurrency: int, plan_only: bool):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def timed(prompt: str):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await one(prompt, plan_only)
+            except Exception as e:
+                failures += 1
+                print(f"  échec : {prompt} -> {e}")
+                return
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(timed(PROMPTS[i % len(PROMPTS)]) for i in range(count)))
+    return latencies, failures
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    record, plan_only = "--record" in sys.argv, "--plan-only" in sys.argv
+    expected = "record" if record else "replay"
+    if settings.LLM_BACKEND != expected:
+        sys.exit(f"LLM_BACKEND={settings.LLM_BACKEND} : lancer avec LLM_BACKEND={expected}.")
+
+    register_application_tools()
+    # Plan cache désactivé : chaque requête repasse par le routeur et le LLM
+    generation_service.plan_cache = None
+    count = int(args[0]) if args else (len(PROMPTS) if record else 100)
+    concurrency = int(args[1]) if len(args) > 1 else (1 if record else 10)
+
+    latencies, failures = asyncio.run(run(count, concurrency, plan_only))
+    print(f"\n{settings.LLM_BACKEND} ({settings.LLM_REPLAY_LATENCY}) : {len(latencies)} ok, {failures} échec(s), "
+          f"concurrence {concurrency}")
+    if latencies:
+        print(f"p50 {percentile(latencies, 0.5):.2f}s | p95 {percentile(latencies, 0.95):.2f}s | "
+              f"p99 {percentile(latencies, 0.99):.2f}s")
+    print(f"\n{'étape':>16} | {'moy. (s)':>8} | {'p95 (s)':>8}")
+    for name, stage in metrics_sink.snapshot()["stages"].items():
+        print(f"{name:>16} | {stage['mean_seconds']:>8.3f} | {stage['p95_seconds']:>8.3f}")
+    print(f"\nclient LLM : {llm_client.snapshot()}")
+    for name, snapshot in generation_service.snapshot()["tools"].items():
+        if snapshot:
+            print(f"{name} : {snapshot}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Micro-benchmark du débit de traduction (étapes/seconde) de TkzEuclideTranslator,
+selon l'état du cache de fragments (`TranslationCache`) :
+  - sans cache : traduction brute, rien n'est haché ;
+  - à froid : cache neuf à chaque passe (calcul des clés `_step_cache_key` + écritures) ;
+  - à chaud : cache déjà rempli par le même plan (que des succès, ex: rendu d'un plan en cache).
+L'écart sans cache / à froid est le coût des clés ; à chaud / sans cache, le gain du cache.
+
+Usage (depuis `backend/`, avec un .env valide) :
+    python -m benchmarks.bench_translation
+"""
+import time
+from typing import Callable, Optional
+
+from src.features.tools.geometry_2d.models import Geometry2DInput
+from src.features.tools.geometry_2d.translator import TkzEuclideTranslator, TranslationCache
+
+from .plans import build_plan
+
+SIZES = (10, 100, 1_000, 5_000)
+MIN_DURATION = 0.5  # secondes de mesure minimum par taille et par mode
+
+
+def bench(data: Geometry2DInput, make_cache: Callable[[], Optional[TranslationCache]]) -> float:
+    steps = len(data.construction_steps)
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        TkzEuclideTranslator(data, show_axes=False, show_grid=False, cache=make_cache()).translate()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_DURATION:
+            return steps * runs / elapsed
+
+
+def warm_cache(data: Geometry2DInput) -> TranslationCache:
+    cache = TranslationCache()
+    TkzEuclideTranslator(data, show_axes=False, show_grid=False, cache=cache).translate()
+    return cache
+
+
+if __name__ == "__main__":
+    print(f"{'étapes':>8} | {'sans cache':>12} | {'à froid':>12} | {'à chaud':>12}   (étapes/s)")
+    for size in SIZES:
+        data = Geometry2DInput.model_validate(build_plan(size))
+        warm = warm_cache(data)
+        no_cache = bench(data, lambda: None)
+        cold = bench(data, TranslationCache)
+        hot = bench(data, lambda: warm)
+        print(f"{size:>8} | {no_cache:>12,.0f} | {cold:>12,.0f} | {hot:>12,.0f}")
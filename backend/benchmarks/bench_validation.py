@@ -0,0 +1,107 @@
+"""
+Benchmark du validateur de dépendances `check_id_dependencies`.
+
+Compare l'implémentation actuelle (rôles des champs précalculés par classe,
+lecture directe des attributs) à l'ancienne (model_dump + classification des clés
+à chaque étape), sur des plans de 10 à 10 000 étapes.
+
+Usage (depuis `backend/`, avec un .env valide) :
+    python -m benchmarks.bench_validation
+"""
+import time
+
+from src.features.tools.geometry_2d.models import Geometry2DInput, check_step_dependencies
+
+from .plans import build_plan
+
+SIZES = (10, 100, 1_000, 10_000)
+MIN_DURATION = 0.5
+
+# --- Ancienne implémentation (référence) -------------------------------------
+ALWAYS_CREATION_KEYS = {'id', 'ids', 'tangency_point_id', 'tangency_point_ids',
+                        'line_id', 'new_ids', 'point_on_line_id', 'point_on_line_ids'}
+LINE_CREATION_TYPES = {'def_tangents_from_point'}
+DATA_KEYS = {'type', 'style', 'label', 'text', 'unit', 'color',
+             'thickness', 'pattern', 'fill_color', 'position',
+             'radius', 'semi_major_axis', 'semi_minor_axis', 'angle',
+             'start_angle', 'end_angle', 'arrow_spec', 'triangle_type',
+             'center_type', 'on_segments', 'num_sides', 'build_method',
+             'name_prefix', 'base_points', 'derived_points',
+             'base_origin', 'base_width', 'base_height', 'depth_vector'}
+
+
+def legacy_collect_step_ids(step):
+    step_dict = step.model_dump(exclude_unset=True)
+    step_type = step_dict.get('type', '')
+    created = []
+    for key in ALWAYS_CREATION_KEYS:
+        if key in step_dict:
+            value = step_dict[key]
+            created.extend(value) if isinstance(value, (list, tuple)) else created.append(value)
+    if step_type == 'def_regular_polygon':
+        prefix, num_sides = step_dict.get('name_prefix', ''), step_dict.get('num_sides', 0)
+        if prefix and num_sides > 0:
+            created.extend(f"{prefix}{k+1}" for k in range(num_sides))
+    if step_type == 'def_perspective_cuboid':
+        created.extend(step_dict.get('base_points', ()))
+        created.extend(step_dict.get('derived_points', ()))
+    if 'line_ids' in step_dict and step_type in LINE_CREATION_TYPES:
+        created.extend(step_dict['line_ids'])
+
+    deps = []
+    for key, value in step_dict.items():
+        if key in DATA_KEYS or key in ALWAYS_CREATION_KEYS:
+            continue
+        if key == 'line_ids' and step_type in LINE_CREATION_TYPES:
+            continue
+        if key == 'custom_labels' and isinstance(value, dict):
+            deps.extend(value.keys())
+            continue
+        if key == 'circle_def' and isinstance(value, dict):
+            if value.get('by_center_point'):
+                deps.extend(value['by_center_point'])
+            if value.get('by_center_radius'):
+                deps.extend(i for i in value['by_center_radius'] if isinstance(i, str))
+            continue
+        if isinstance(value, str):
+            deps.append(value)
+        elif isinstance(value, (list, tuple)):
+            if value and isinstance(value[0], (list, tuple)):
+                for sub in value:
+                    deps.extend(i for i in sub if isinstance(i, str))
+            else:
+                deps.extend(i for i in value if isinstance(i, str))
+    return created, deps
+
+
+def legacy_check_step_dependencies(steps):
+    defined_ids = set()
+    for i, step in enumerate(steps):
+        created, deps = legacy_collect_step_ids(step)
+        for dep_id in set(deps):
+            if dep_id not in defined_ids:
+                raise ValueError(f"ID de dépendance non défini : '{dep_id}' (étape {i+1})")
+        for new_id in created:
+            if new_id in defined_ids:
+                raise ValueError(f"ID '{new_id}' redéfini à l'étape {i+1}.")
+            defined_ids.add(new_id)
+
+
+# --- Mesure --------------------------------------------------------------------
+def _rate(func, steps) -> float:
+    runs, start = 0, time.perf_counter()
+    while True:
+        func(steps)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_DURATION:
+            return elapsed / runs
+
+
+if __name__ == "__main__":
+    print(f"{'étapes':>8} | {'ancien (ms)':>12} | {'actuel (ms)':>12} | {'gain':>6}")
+    for size in SIZES:
+        steps = Geometry2DInput.model_validate(build_plan(size)).construction_steps
+        legacy = _rate(legacy_check_step_dependencies, steps) * 1000
+        current = _rate(check_step_dependencies, steps) * 1000
+        print(f"{len(steps):>8} | {legacy:>12.3f} | {current:>12.3f} | {legacy / current:>5.1f}x")
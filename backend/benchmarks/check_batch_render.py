@@ -0,0 +1,61 @@
+"""
+Contrôle du rendu groupé des variantes (`generate_geometry_2d_batch`) : deux
+variantes qui diffèrent par les axes et la grille sont compilées ensemble, et
+chacune doit garder les siens. Le code LaTeX de chaque figure est comparé à
+celui du rendu seul (`generate_geometry_2d`), et son image aussi, pixel par
+pixel : une figure ne doit rien hériter de la précédente dans le document commun
+(la première variante est répétée en fin de lot pour le vérifier).
+
+Usage (depuis `backend/`, avec un .env valide et lualatex installé) :
+    python -m benchmarks.check_batch_render
+"""
+import sys
+
+from PIL import Image, ImageChops
+
+from src.features.tools.geometry_2d.models import Geometry2DInput
+from src.features.tools.geometry_2d.translator import generate_geometry_2d, generate_geometry_2d_batch
+
+from .plans import build_plan
+
+AXES = r"\tkzDrawX \tkzDrawY"
+GRID = r"\tkzGrid"
+
+
+def variant(axes: bool, grid: bool) -> Geometry2DInput:
+    plan = build_plan(10)
+    plan["figure_config"] = {**plan.get("figure_config", {}), "axes": axes, "grid": grid}
+    return Geometry2DInput.model_validate(plan)
+
+
+def same_image(first, second) -> bool:
+    with Image.open(first) as a, Image.open(second) as b:
+        if a.size != b.size:
+            return False
+        return ImageChops.difference(a.convert("RGB"), b.convert("RGB")).getbbox() is None
+
+
+def main() -> int:
+    plans = [variant(axes=True, grid=False), variant(axes=False, grid=True), variant(axes=True, grid=False)]
+    failures = []
+    outputs = generate_geometry_2d_batch(plans, cache=None)
+    for number, (plan, (image_path, latex_code, _)) in enumerate(zip(plans, outputs), start=1):
+        cfg = plan.figure_config
+        if (AXES in latex_code) != cfg.axes or (GRID in latex_code) != cfg.grid:
+            failures.append(f"variante {number} : axes={cfg.axes}, grid={cfg.grid} non respectés")
+        single_path, single_code, _ = generate_geometry_2d(plan, show_axes=cfg.axes, show_grid=cfg.grid, cache=None)
+        if single_code != latex_code:
+            failures.append(f"variante {number} : code LaTeX différent du rendu seul")
+        if not image_path.exists():
+            failures.append(f"variante {number} : image manquante ({image_path})")
+        elif not same_image(image_path, single_path):
+            failures.append(f"variante {number} : image différente du rendu seul")
+
+    for failure in failures:
+        print(f"✗ {failure}")
+    print(f"{len(failures)} problème(s) sur {len(plans)} variante(s) rendues ensemble.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
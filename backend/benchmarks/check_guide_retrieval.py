@@ -0,0 +1,77 @@
+"""
+Contrôle de précision du guide réduit (`guide_index.GuideRetriever`).
+
+Pour chaque prompt du jeu de fixtures, on vérifie que les briques nécessaires à
+la figure sont bien documentées dans l'extrait envoyé au LLM (rappel), et on
+mesure la taille du prompt par rapport au guide complet.
+
+Usage (depuis `backend/`, avec un .env valide) :
+    python -m benchmarks.check_guide_retrieval [budget]
+"""
+import sys
+from pathlib import Path
+
+from src.config import settings
+from src.features.tools.geometry_2d.guide_index import ALWAYS_ON_STEPS, GuideRetriever, estimate_tokens
+
+GUIDE_PATH = Path(__file__).resolve().parent.parent / "src" / "features" / "tools" / "geometry_2d" / "guide.md"
+
+# Seuil en dessous duquel le script sort en erreur
+MIN_RECALL = 0.9
+
+# (prompt, briques attendues en plus de ALWAYS_ON_STEPS)
+FIXTURES = [
+    ("Trace le segment [AB] de longueur 5 cm", ["calculate_length"]),
+    ("Place le milieu M du segment [AB]", ["def_midpoint"]),
+    ("Construis la médiatrice du segment [AB]", ["def_mediator", "draw_lines"]),
+    ("Trace le cercle circonscrit au triangle ABC", ["def_circle_circumscribed", "draw_circles"]),
+    ("Trace le cercle inscrit dans le triangle ABC", ["def_circle_inscribed", "draw_circles"]),
+    ("Dessine un hexagone régulier de centre O", ["def_regular_polygon"]),
+    ("Dessine un carré ABCD et ses diagonales", ["def_square"]),
+    ("Trace la droite parallèle à (AB) passant par C", ["def_parallel_line", "draw_lines"]),
+    ("Trace la perpendiculaire à (AB) passant par C et marque l'angle droit",
+     ["def_perpendicular_line", "mark_right_angle"]),
+    ("Trace la hauteur issue de A et son pied H sur (BC)", ["def_projection_point", "mark_right_angle"]),
+    ("Place l'intersection I des droites (AB) et (CD)", ["find_intersection_LL"]),
+    ("Trouve les points d'intersection de deux cercles", ["find_intersection_CC"]),
+    ("Trace la bissectrice de l'angle BAC", ["def_angle_bisector"]),
+    ("Trace les tangentes au cercle issues du point P", ["def_tangents_from_point"]),
+    ("Construis l'image du triangle ABC par la rotation de centre O et d'angle 90°", ["def_points_by_rotation"]),
+    ("Construis le symétrique du point A par rapport au point O", ["def_points_by_symmetry"]),
+    ("Trace l'image de ABC par la translation de vecteur AB", ["def_points_by_translation"]),
+    ("Dessine un secteur angulaire de centre O entre A et B", ["draw_sector_by_points"]),
+    ("Trace un arc de cercle de centre O de A à B", ["draw_arc_by_points"]),
+    ("Dessine une ellipse de centre O", ["draw_ellipse"]),
+    ("Code les segments égaux [AM] et [MB]", ["mark_segments"]),
+    ("Marque l'angle ABC et affiche sa mesure", ["mark_internal_angle", "calculate_angle_by_points"]),
+    ("Place le centre de gravité du triangle ABC", ["def_triangle_center"]),
+    ("Dessine un parallélogramme ABCD", ["def_parallelogram"]),
+    ("Draw a circle with diameter AB", ["def_circle_by_diameter", "draw_circles"]),
+    ("Draw the vector AB", ["draw_vector"]),
+]
+
+
+def main(budget: int) -> int:
+    retriever = GuideRetriever(GUIDE_PATH.read_text(encoding="utf-8"))
+    core_tokens = estimate_tokens(retriever.core)
+    recalls, sizes = [], []
+    print(f"{'rappel':>6} | {'tokens':>6} | prompt  (briques manquantes)")
+    for prompt, expected in FIXTURES:
+        expected = set(expected) | set(ALWAYS_ON_STEPS)
+        found = set(retriever.selected_step_types(prompt, budget))
+        missing = sorted(expected - found)
+        recall = 1 - len(missing) / len(expected)
+        tokens = core_tokens + estimate_tokens(retriever.build_excerpt(prompt, budget))
+        recalls.append(recall)
+        sizes.append(tokens)
+        print(f"{recall:>6.0%} | {tokens:>6} | {prompt}" + (f"  ({', '.join(missing)})" if missing else ""))
+
+    mean_recall = sum(recalls) / len(recalls)
+    mean_tokens = sum(sizes) / len(sizes)
+    print(f"\nRappel moyen : {mean_recall:.1%} | prompt moyen : ~{mean_tokens:.0f} tokens "
+          f"(guide complet : ~{retriever.full_tokens}, soit -{1 - mean_tokens / retriever.full_tokens:.0%})")
+    return 0 if mean_recall >= MIN_RECALL else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else settings.GEOMETRY_GUIDE_TOKEN_BUDGET))
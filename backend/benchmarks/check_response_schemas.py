@@ -0,0 +1,88 @@
+"""
+Contrôle hors ligne des schémas envoyés en `response_format` : chacun est converti
+comme le fait LiteLLM pour Gemini (`_build_vertex_schema`), puis on vérifie que
+Gemini l'accepterait et qu'il contraint encore les étapes :
+  - tout ARRAY a un `items`, tout OBJECT a des propriétés ;
+  - sans sélection de briques, chaque brique garde son schéma détaillé ;
+  - avec sélection, les briques de l'extrait gardent le leur.
+
+Usage (depuis `backend/`, avec un .env valide) :
+    python -m benchmarks.check_response_schemas
+"""
+import copy
+import sys
+from typing import Any, Dict, List
+
+from litellm.llms.vertex_ai.common_utils import _build_vertex_schema
+
+from src.core.router_tools import RouterDecision
+from src.features.tools.geometry_2d.guide_index import STEP_TYPES
+from src.features.tools.geometry_2d.models import Geometry2DInput
+from src.features.tools.geometry_2d.patch import PlanPatch
+from src.features.tools.geometry_2d.repair import PlanRepair
+from src.utils.schema import has_free_form_objects, trim_schema
+
+def gemini_problems(schema: Dict[str, Any], path: str = "") -> List[str]:
+    """ARRAY sans `items` et OBJECT sans propriétés (refusés ou non contraints par Gemini)."""
+    problems = []
+    if isinstance(schema, dict):
+        kind = str(schema.get("type", "")).lower()
+        if kind == "array" and not schema.get("items"):
+            problems.append(f"{path or '/'} : ARRAY sans items")
+        if kind == "object" and not schema.get("properties"):
+            problems.append(f"{path or '/'} : OBJECT sans propriétés")
+        for key, value in schema.items():
+            problems += gemini_problems(value, f"{path}/{key}")
+    elif isinstance(schema, list):
+        for index, value in enumerate(schema):
+            problems += gemini_problems(value, f"{path}[{index}]")
+    return problems
+
+
+def detailed_steps(schema: Dict[str, Any]) -> List[str]:
+    """Briques dont le schéma détaillé a survécu à `trim_schema`."""
+    variants = schema["properties"]["construction_steps"]["items"]["anyOf"]
+    found = []
+    for variant in variants:
+        variant = schema.get("$defs", {}).get(variant.get("$ref", "").rsplit("/", 1)[-1], variant)
+        tag = variant.get("properties", {}).get("type", {})
+        if len(variant.get("properties", {})) > 1 and "const" in tag:
+            found.append(tag["const"])
+        elif len(variant.get("properties", {})) > 1 and len(tag.get("enum", [])) == 1:
+            found.append(tag["enum"][0])
+    return sorted(found)
+
+
+def check(name: str, schema: Dict[str, Any]) -> List[str]:
+    converted = _build_vertex_schema(copy.deepcopy(schema), add_property_ordering=True)
+    return [f"{name} : {problem}" for problem in gemini_problems(converted)]
+
+
+def main() -> int:
+    failures = []
+    full = trim_schema(Geometry2DInput, 24, None)
+    failures += check("Geometry2DInput (toutes les briques)", full)
+    missing = sorted(set(STEP_TYPES) - set(detailed_steps(full)))
+    if missing:
+        failures.append(f"Geometry2DInput (toutes les briques) : briques sans schéma détaillé {missing}")
+
+    selected = ["def_point_coords", "def_midpoint", "draw_segments"]
+    trimmed = trim_schema(Geometry2DInput, 24, selected)
+    failures += check("Geometry2DInput (extrait)", trimmed)
+    if not set(selected) <= set(detailed_steps(trimmed)):
+        failures.append(f"Geometry2DInput (extrait) : {selected} attendues en détail, {detailed_steps(trimmed)}")
+
+    failures += check("RouterDecision", trim_schema(RouterDecision))
+    # Patch et réparation : objets libres, jamais envoyés en `response_format`
+    for model_class in (PlanPatch, PlanRepair):
+        if not has_free_form_objects(trim_schema(model_class)):
+            failures.append(f"{model_class.__name__} : plus d'objet libre, le schéma pourrait être réactivé")
+
+    for failure in failures:
+        print(f"✗ {failure}")
+    print(f"{len(failures)} problème(s) sur les schémas ({len(STEP_TYPES)} briques).")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Faux serveur LLM compatible OpenAI (`POST /v1/chat/completions`), pour tester
+le hedging, les timeouts et le streaming de `NeuclidChat` sans fournisseur réel.
+
+La latence dépend du modèle demandé (`LATENCY_PROFILES`) : par exemple
+`openai/flaky` répond vite la plupart du temps mais a une longue queue.
+
+Usage :
+    python -m benchmarks.fake_llm_server [port]
+puis `NeuclidChat(model="openai/flaky", api_base="http://127.0.0.1:8900/v1", ...)`.
+"""
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# modèle -> (latence habituelle, probabilité de queue, latence de queue), en secondes
+LATENCY_PROFILES = {
+    "fast": (0.05, 0.0, 0.0),
+    "steady": (0.3, 0.0, 0.0),
+    "flaky": (0.1, 0.04, 3.0),
+    "slow": (5.0, 0.0, 0.0),
+}
+DEFAULT_PROFILE = (0.1, 0.0, 0.0)
+
+# Réponse renvoyée : un plan valide minimal, découpé en morceaux pour le streaming
+ANSWER = json.dumps({
+    "construction_steps": [
+        {"type": "def_point_coords", "id": "def_A", "points": {"A": [0, 0]}},
+        {"type": "def_point_coords", "id": "def_B", "points": {"B": [4, 0]}},
+        {"type": "draw_segments", "id": "draw_AB", "segments": [["A", "B"]]},
+    ]
+})
+CHUNK_SIZE = 16
+CHUNK_DELAY = 0.005
+
+app = FastAPI(title="Fake LLM")
+
+
+def sample_latency(model: str, rng: random.Random = random.Random()) -> float:
+    base, tail_probability, tail = LATENCY_PROFILES.get(model.split("/")[-1], DEFAULT_PROFILE)
+    if rng.random() < tail_probability:
+        return tail
+    return base * rng.uniform(0.8, 1.2)
+
+
+def _chunk(model: str, request_id: str, delta: dict, finish_reason=None) -> str:
+    payload = {
+        "id": request_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake")
+    request_id = f"chatcmpl-{uuid.uuid4().hex}"
+    await asyncio.sleep(sample_latency(model))
+
+    if body.get("stream"):
+        async def events():
+            yield _chunk(model, request_id, {"role": "assistant", "content": ""})
+            for start in range(0, len(ANSWER), CHUNK_SIZE):
+                yield _chunk(model, request_id, {"content": ANSWER[start:start + CHUNK_SIZE]})
+                await asyncio.sleep(CHUNK_DELAY)
+            yield _chunk(model, request_id, {}, "stop")
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return JSONResponse({
+        "id": request_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": len(ANSWER) // 4, "total_tokens": 10 + len(ANSWER) // 4},
+    })
+
+
+def start_in_thread(port: int = 8900) -> Tuple[uvicorn.Server, str]:
+    """Lance le serveur en tâche de fond ; renvoie (serveur, api_base). `server.should_exit = True` pour l'arrêter."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}/v1"
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=int(sys.argv[1]) if len(sys.argv) > 1 else 8900)
@@ -0,0 +1,46 @@
+"""
+Plans de construction synthétiques pour les benchmarks.
+Chaque bloc est une petite figure complète (triangle, médiatrice, cercle circonscrit,
+annotations) dont les IDs sont suffixés pour rester uniques.
+"""
+from typing import Any, Dict, List
+
+
+def _block(k: int) -> List[Dict[str, Any]]:
+    a, b, c, m, o = f"A{k}", f"B{k}", f"C{k}", f"M{k}", f"O{k}"
+    x = float(k % 7)
+    return [
+        {"type": "def_point_coords", "id": a, "coords": [x, 0.0]},
+        {"type": "def_point_coords", "id": b, "coords": [x + 4.0, 0.0]},
+        {"type": "def_point_coords", "id": c, "coords": [x + 1.0, 3.0]},
+        {"type": "def_midpoint", "id": m, "of_segment": [a, b]},
+        {"type": "def_line_by_points", "id": f"d{k}", "through": [a, b]},
+        {"type": "def_mediator", "id": f"med{k}", "of_segment": [a, b]},
+        {"type": "def_circle_circumscribed", "id": f"c{k}", "through_points": [a, b, c]},
+        {"type": "def_triangle_center", "id": o, "from_triangle_points": [a, b, c], "center_type": "centroid"},
+        {"type": "calculate_length", "id": f"len{k}", "between_points": [a, b]},
+        {"type": "draw_polygon", "point_ids": [a, b, c], "style": {"color": "blue", "thickness": "thick"}},
+        {"type": "draw_lines", "line_ids": [f"med{k}"], "style": {"color": "red", "pattern": "dashed"}},
+        {"type": "draw_circles", "circle_ids": [f"c{k}"]},
+        {"type": "draw_segments", "segments": [[c, m]], "style": {"color": "gray"}},
+        {"type": "mark_segments", "on_segments": [[a, m], [m, b]], "style": {"mark_type": "||"}},
+        {"type": "mark_internal_angle", "points": [b, a, c], "label": "\\alpha"},
+        {"type": "draw_points", "point_ids": [a, b, c, m, o]},
+        {"type": "label_points", "point_ids": [a, b, c, m, o]},
+    ]
+
+
+STEPS_PER_BLOCK = len(_block(0))
+
+
+def build_plan(num_steps: int) -> Dict[str, Any]:
+    """Retourne un dict `Geometry2DInput` d'environ `num_steps` étapes."""
+    steps: List[Dict[str, Any]] = []
+    k = 0
+    while len(steps) < num_steps:
+        steps.extend(_block(k))
+        k += 1
+    return {
+        "figure_config": {"x_range": [-1, 12], "y_range": [-2, 5]},
+        "construction_steps": steps,
+    }
@@ -1,9 +1,11 @@
 import logging
+from typing import List, Optional, Union
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, Field
 
 from src.services.generation import generation_service
 from src.core.base_tool import ToolResult
+from src.config import settings
 
 router = APIRouter(tags=["Generation"])
 
@@ -12,29 +14,45 @@ log = logging.getLogger(__name__)
 # --- Schema de la requête ---
 class GenerateRequest(BaseModel):
     prompt: str = Field(..., description="La description naturelle de ce que l'utilisateur veut tracer.")
+    previous_result_id: Optional[str] = Field(
+        None, description="`result_id` d'un résultat précédent : le prompt le modifie au lieu de repartir de zéro."
+    )
+    variants: int = Field(
+        1, ge=1, le=settings.GENERATION_MAX_VARIANTS,
+        description="Nombre de variantes (ex: 4 pour une grille) ; au-delà de 1, la réponse est une liste."
+    )
+    use_plan_cache: bool = Field(
+        True, description="False pour replanifier un prompt déjà en cache (le nouveau plan remplace l'ancien)."
+    )
 
 # --- Endpoint ---
-@router.post("/generate", response_model=ToolResult)
+@router.post("/generate", response_model=Union[ToolResult, List[ToolResult]])
 async def generate_content(request: GenerateRequest, http_request: Request):
     """
     Endpoint unique et intelligent.
     1. Reçoit le prompt.
     2. Route vers le bon outil (Géométrie, Graphe, etc.).
-    3. Exécute et renvoie le résultat complet.
+    3. Exécute et renvoie le résultat complet (une liste avec `variants` > 1).
     """
     try:
         # Appel au service orchestrateur
-        result: ToolResult = await generation_service.generate(request.prompt)
+        if request.variants > 1:
+            if request.previous_result_id:
+                raise ValueError("variants cannot be combined with previous_result_id.")
+            results = await generation_service.generate_variants(request.prompt, request.variants)
+        else:
+            results = [await generation_service.generate(
+                request.prompt, request.previous_result_id, use_plan_cache=request.use_plan_cache
+            )]
 
         # Construction de l'URL complète pour l'image
         # result.image_url contient pour l'instant juste le nom du fichier (ex: figure_123.png)
         base_url = str(http_request.base_url).rstrip("/")
-        full_url = f"{base_url}/static/{result.image_url}"
-        
-        # Mise à jour du résultat avec l'URL complète
-        result.image_url = full_url
+        for result in results:
+            # Mise à jour du résultat avec l'URL complète
+            result.image_url = f"{base_url}/static/{result.image_url}"
 
-        return result
+        return results if request.variants > 1 else results[0]
 
     except ValueError as ve:
         # Erreur de validation ou de routage (ex: outil introuvable)
@@ -43,4 +61,10 @@ async def generate_content(request: GenerateRequest, http_request: Request):
         
     except Exception as e:
         log.error(f"Server Error: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Une erreur interne est survenue lors de la génération.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Une erreur interne est survenue lors de la génération.")
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Compteurs depuis le démarrage : temps par étape, routage, client LLM, et ceux de chaque outil (réparations, tiers)."""
+    return generation_service.snapshot()
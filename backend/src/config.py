@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from typing import List, Union, Optional
+from typing import Dict, List, Literal, Union, Optional
 
 from pydantic import AnyHttpUrl, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -45,6 +45,76 @@ class Settings(BaseSettings):
     ANTHROPIC_API_KEY: str | None = None
     GEMINI_API_KEY: str | None = None
 
+    # --- Router ---
+    # Confiance minimale du routeur local (TF-IDF) pour se passer de l'appel LLM
+    ROUTER_LOCAL_CONFIDENCE: float = 0.6
+    # Lance l'outil le plus probable en même temps que le routeur LLM (annulé s'il se trompe)
+    SPECULATIVE_GENERATION: bool = True
+
+    # --- Geometry 2D ---
+    # Budget (tokens estimés) des sections de guide.md choisies selon le prompt ; 0 = guide complet
+    GEOMETRY_GUIDE_TOKEN_BUDGET: int = 5000
+    # Tours de réparation ciblée d'un plan invalide (seules les étapes fautives repartent au LLM) ; 0 = désactivé
+    GEOMETRY_REPAIR_ROUNDS: int = 2
+    # Décodage contraint par le schéma JSON du plan (fournisseurs compatibles) ; au-delà de
+    # GEOMETRY_SCHEMA_MAX_VARIANTS briques, seules celles de l'extrait du guide gardent leur schéma détaillé
+    GEOMETRY_RESPONSE_SCHEMA: bool = True
+    GEOMETRY_SCHEMA_MAX_VARIANTS: int = 24
+    # Format de sortie du LLM : JSON, ou format compact une-ligne-par-étape (~3x moins de tokens, cf. dsl.py)
+    GEOMETRY_PLAN_FORMAT: Literal["json", "dsl"] = "json"
+    # Modèle choisi selon la complexité estimée du prompt (complexity.py), escalade si le plan reste invalide
+    GEOMETRY_MODEL_TIERING: bool = True
+    GEOMETRY_MODEL_TIERS: Dict[str, str] = {
+        "fast": "gemini/gemini-2.5-flash-lite",
+        "standard": "gemini/gemini-2.5-flash",
+        "strong": "gemini/gemini-2.5-pro",
+    }
+    # Course de K générations en parallèle (températures différentes, le tier au-dessus pour la dernière) :
+    # le premier plan valide et non dégénéré gagne, les autres sont annulés ; 1 = désactivé
+    GEOMETRY_RACE_CANDIDATES: int = 1
+    GEOMETRY_RACE_TEMPERATURES: List[float] = [0.1, 0.5, 0.9]
+
+    # --- Client LLM commun (llm_client.py) ---
+    # Limites par modèle, en requêtes et tokens par minute ("*" = tout autre modèle), ex :
+    # {"gemini/gemini-2.5-flash": {"rpm": 1000, "tpm": 1000000}} ; vide = pas de file d'attente
+    LLM_RATE_LIMITS: Dict[str, Dict[str, int]] = {}
+    # Backoff des erreurs transitoires (un `Retry-After` du fournisseur a priorité)
+    LLM_RETRY_BASE_DELAY: float = 0.5
+    LLM_RETRY_MAX_DELAY: float = 20.0
+    # Pool HTTP keep-alive partagé par tous les appels
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_SECONDS: float = 60.0
+    LLM_HTTP_TIMEOUT: float = 120.0
+    # Backend LLM (llm_replay.py) : appels réels, enregistrés dans LLM_RECORDINGS_PATH, ou rejoués
+    # sans réseau (tests de charge, benchmarks reproductibles)
+    LLM_BACKEND: Literal["live", "record", "replay"] = "live"
+    LLM_RECORDINGS_PATH: Path = TEMP_BUILD_DIR / "llm_recordings.jsonl"
+    # Latence du rejeu : celle enregistrée, une loi log-normale (médiane / sigma du premier token,
+    # puis débit en tokens/s) ou aucune
+    LLM_REPLAY_LATENCY: Literal["recorded", "lognormal", "none"] = "recorded"
+    LLM_REPLAY_TTFT_MEDIAN: float = 1.0
+    LLM_REPLAY_TTFT_SIGMA: float = 0.5
+    LLM_REPLAY_TOKENS_PER_SECOND: float = 150.0
+    LLM_REPLAY_SEED: Optional[int] = 0
+
+    # --- Plan cache (prompt aux espaces compactés -> plan validé) ---
+    PLAN_CACHE_ENABLED: bool = True
+    PLAN_CACHE_MAX_ENTRIES: int = 2000
+    PLAN_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    # Fichier SQLite pour survivre aux redémarrages (None = mémoire seule)
+    PLAN_CACHE_PATH: Optional[Path] = TEMP_BUILD_DIR / "plan_cache.sqlite3"
+
+    # --- Résultats précédents (mode édition : `previous_result_id` sur /generate) ---
+    RESULT_STORE_MAX_ENTRIES: int = 5000
+    RESULT_STORE_TTL_SECONDS: int = 24 * 3600
+    RESULT_STORE_PATH: Optional[Path] = TEMP_BUILD_DIR / "results.sqlite3"
+
+    # --- Variantes (`variants` sur /generate : un seul routage, N plans, une seule compilation) ---
+    GENERATION_MAX_VARIANTS: int = 4
+    # Température des variantes au-delà de la première (qui garde celle de l'outil)
+    GENERATION_VARIANT_TEMPERATURE: float = 0.7
+
     # Pydantic configuration to read the .env file
     model_config = SettingsConfigDict(
         env_file=".env",
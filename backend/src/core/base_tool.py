@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Type, Any, Dict, Optional
+from typing import Type, Any, Dict, List, Optional, Tuple
 from pathlib import Path
 from pydantic import BaseModel, Field
 
@@ -14,6 +14,7 @@ class ToolResult(BaseModel):
     latex_code: str = ""
     json_content: Dict[str, Any] # Le JSON intermédiaire (Geometry2DInput)
     metadata: Dict[str, Any] = Field(default_factory=dict)
+    result_id: Optional[str] = None # À renvoyer en `previous_result_id` pour modifier ce résultat
 
 # --- The Contract ---
 class BaseTool(ABC):
@@ -36,6 +37,14 @@ class BaseTool(ABC):
         """
         pass
 
+    @property
+    def examples(self) -> List[str]:
+        """
+        Optional sample requests / keywords (any language) for this tool.
+        They feed the local intent classifier that routes without calling the LLM.
+        """
+        return []
+
     @property
     @abstractmethod
     def input_model(self) -> Type[BaseModel]:
@@ -48,4 +57,41 @@ class BaseTool(ABC):
         The main execution logic:
         Prompt -> LLM (Specific) -> JSON -> Validation -> LaTeX -> Image
         """
-        pass
\ No newline at end of file
+        pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Tool-specific counters since startup (repairs, tiers...), for monitoring. Empty by default."""
+        return {}
+
+    # --- Optional: plan / render split (enables the plan cache) ---
+    @property
+    def cache_version(self) -> Optional[str]:
+        """
+        Version of everything that shapes the plan (model, system prompt...).
+        A cached plan is reused only if this value did not change.
+        None (default) = the tool's plans are never cached.
+        """
+        return None
+
+    async def generate_plan(self, user_prompt: str, context: Optional[Dict] = None) -> Tuple[BaseModel, Dict[str, Any]]:
+        """
+        Prompt -> LLM -> validated plan (`input_model`). Returns (plan, generation metadata).
+        `context["previous_plan"]` (a plan of this tool) turns the call into an edit of that plan.
+        `context["temperature"]` overrides the sampling temperature (used for variants).
+        """
+        raise NotImplementedError(f"Tool '{self.name}' does not expose its plan.")
+
+    async def render(self, plan: BaseModel, metadata: Optional[Dict[str, Any]] = None) -> ToolResult:
+        """Validated plan -> LaTeX -> Image, without any LLM call."""
+        raise NotImplementedError(f"Tool '{self.name}' does not expose its plan.")
+
+    async def render_batch(
+        self, plans: List[BaseModel], metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> List[ToolResult]:
+        """
+        Several validated plans -> one result each (e.g. variants of one prompt).
+        Default: one `render` per plan; tools override it to share a single compilation.
+        An override may drop plans that fail to render, as long as at least one result remains.
+        """
+        metadatas = metadatas or [{} for _ in plans]
+        return [await self.render(plan, metadata) for plan, metadata in zip(plans, metadatas)]
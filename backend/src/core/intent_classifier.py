@@ -0,0 +1,79 @@
+import logging
+import math
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from src.core.base_tool import BaseTool
+from src.utils.text import tokenize
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class IntentPrediction:
+    """Résultat du routage local."""
+    tool_name: str
+    confidence: float
+    reason: str
+
+
+class LocalIntentClassifier:
+    """
+    Routeur local (sans appel réseau) : TF-IDF construit à partir de la
+    `description` et des `examples` de chaque outil du registre.
+
+    La confiance est la part du score total qui revient au meilleur outil ;
+    seuls les mots connus d'au moins un outil comptent (un 'ABC' ou un '3' ne dit
+    rien de l'outil). Aucun mot connu -> pas de prédiction, le LLM tranchera.
+    """
+    def __init__(self, tools: List[BaseTool]):
+        self.tool_names = [tool.name for tool in tools]
+        documents = [tokenize(" ".join([tool.description, *tool.examples])) for tool in tools]
+
+        doc_freq = Counter(word for doc in documents for word in set(doc))
+        count = len(documents)
+        # IDF lissé : un mot partagé par tous les outils garde un petit poids
+        self.idf = {word: math.log(1 + count / freq) for word, freq in doc_freq.items()}
+
+        self.vectors: List[Dict[str, float]] = []
+        for doc in documents:
+            weights = {word: tf * self.idf[word] for word, tf in Counter(doc).items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            self.vectors.append({word: w / norm for word, w in weights.items()})
+
+    def scores(self, prompt: str) -> List[Tuple[str, float]]:
+        """Similarité cosinus prompt/outil, triée par score décroissant."""
+        words = Counter(word for word in tokenize(prompt) if word in self.idf)
+        if not words:
+            return []
+        query = {word: tf * self.idf[word] for word, tf in words.items()}
+        norm = math.sqrt(sum(w * w for w in query.values()))
+        ranked = [
+            (name, sum(weight * vector.get(word, 0.0) for word, weight in query.items()) / norm)
+            for name, vector in zip(self.tool_names, self.vectors)
+        ]
+        return sorted(ranked, key=lambda item: item[1], reverse=True)
+
+    def predict(self, prompt: str) -> Optional[IntentPrediction]:
+        ranked = self.scores(prompt)
+        total = sum(score for _, score in ranked)
+        if not ranked or total <= 0:
+            return None
+        best_name, best_score = ranked[0]
+        return IntentPrediction(best_name, best_score / total, "tf-idf")
+
+
+def route_locally(tools: List[BaseTool], prompt: str,
+                  classifier: Optional[LocalIntentClassifier]) -> Optional[IntentPrediction]:
+    """
+    Étage local du routeur : un seul outil enregistré -> c'est lui ; sinon le
+    classifieur TF-IDF. Renvoie None si rien ne se dégage (prompt hors vocabulaire).
+    """
+    if not tools:
+        return None
+    if len(tools) == 1:
+        return IntentPrediction(tools[0].name, 1.0, "single tool")
+    if classifier is None:
+        return None
+    return classifier.predict(prompt)
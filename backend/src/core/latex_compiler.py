@@ -3,9 +3,11 @@ import uuid
 import subprocess
 import pypdfium2 as pdfium
 from pathlib import Path
+from typing import Iterable, List, TextIO, Union
 from PIL import Image, ImageChops
 
 from src.config import settings
+from src.core import metrics
 
 log = logging.getLogger(__name__)
 
@@ -29,13 +31,34 @@ log = logging.getLogger(__name__)
 # \end{document}
 # """
 
-def compile_latex_to_image(full_latex_code: str, output_format: str = "png", dpi: int = 300) -> Path:
+def write_latex_source(source: Union[str, Iterable[str]], sink: TextIO) -> None:
+    """
+    Writes LaTeX source into any text sink (file, pipe, worker stdin...).
+    `source` is either the full code or an iterable of chunks (e.g. a translator
+    generator), which is consumed lazily so the document is never held as one string.
+    """
+    if isinstance(source, str):
+        sink.write(source)
+        return
+    for chunk in source:
+        sink.write(chunk)
+
+
+def compile_latex_to_image(full_latex_code: Union[str, Iterable[str]], output_format: str = "png", dpi: int = 300) -> Path:
+    """Compiles a one-page LaTeX document to an image (see `compile_latex_to_images`)."""
+    return compile_latex_to_images(full_latex_code, output_format, dpi)[0]
+
+
+def compile_latex_to_images(full_latex_code: Union[str, Iterable[str]], output_format: str = "png", dpi: int = 300) -> List[Path]:
     """
     Compiles LaTeX code to an image (PNG).
     Pipeline: LaTeX Code -> .tex -> .pdf (via lualatex) -> .png (via pypdfium2).
     Compile un code LaTeX COMPLET (incluant \documentclass et \begin{document}) en image.
     Ce compilateur est 'agnostique' : il ne sait pas si c'est de la géo ou de la chimie.
     Il exécute juste ce qu'on lui donne.
+    Le code peut aussi être un itérable de morceaux, écrit au fil de l'eau sur le disque.
+    Un document de plusieurs pages (ex: variantes d'une figure) donne une image par page,
+    pour un seul process lualatex.
     """
     # 1. Setup paths using our centralized settings
     build_dir = settings.TEMP_BUILD_DIR
@@ -46,10 +69,7 @@ def compile_latex_to_image(full_latex_code: str, output_format: str = "png", dpi
     pdf_file = build_dir / f"{filename}.pdf"
     final_image_path = build_dir / f"{filename}.{output_format}"
 
-    # 2. Write .tex file
-    source_file.write_text(full_latex_code, encoding='utf-8')
-
-    # 3. Compile to PDF using lualatex
+    # 2. lualatex command (the .tex file is written inside the try block below)
     compile_cmd = [
         "lualatex",
         "--interaction=nonstopmode",
@@ -59,33 +79,47 @@ def compile_latex_to_image(full_latex_code: str, output_format: str = "png", dpi
     ]
 
     try:
-        process = subprocess.run(
-            compile_cmd, 
-            capture_output=True,
-            text=True, 
-            check=False, 
-            encoding='utf-8', 
-            timeout=60
-            )
+        # 3. Write .tex file (streamed chunk by chunk when given an iterable),
+        #    then compile to PDF using lualatex
+        #    (un itérable paresseux est traduit pendant l'écriture : l'étape compte comme traduction)
+        with metrics.stage("translation"), source_file.open("w", encoding="utf-8") as sink:
+            write_latex_source(full_latex_code, sink)
+
+        with metrics.stage("compile"):
+            try:
+                process = subprocess.run(
+                    compile_cmd,
+                    capture_output=True,
+                    text=True,
+                    check=False,
+                    encoding='utf-8',
+                    timeout=60
+                    )
+            except FileNotFoundError:
+                # Seul l'exécutable manquant : un .tex / .pdf introuvable garde sa propre erreur
+                raise RuntimeError("Command 'lualatex' not found. Please install a LaTeX distribution.")
         
         if process.returncode != 0:
             log.error("LaTeX Compilation Failed.")
             raise RuntimeError(f"LaTeX Error:\n{process.stdout}")
 
-        # 4. Convert PDF to Image
-        pdf_doc = pdfium.PdfDocument(pdf_file)
-        page = pdf_doc[0]
-        image_raw = page.render(scale=dpi/72).to_pil()
-        
-        # 5. Crop whitespace
-        image_cropped = _crop_image(image_raw)
-        image_cropped.save(final_image_path)
-        
-        log.info(f"✅ Generated image: {final_image_path.name}")
-        return final_image_path
+        # 4. Convert PDF to Image(s)
+        with metrics.stage("rasterise"):
+            pdf_doc = pdfium.PdfDocument(pdf_file)
+            image_paths = []
+            for index in range(len(pdf_doc)):
+                image_raw = pdf_doc[index].render(scale=dpi/72).to_pil()
+                image_path = final_image_path if index == 0 else build_dir / f"{filename}-{index + 1}.{output_format}"
+
+                # 5. Crop whitespace
+                image_cropped = _crop_image(image_raw)
+                image_cropped.save(image_path)
+                image_paths.append(image_path)
+            pdf_doc.close()
+
+        log.info(f"✅ Generated image(s): {', '.join(path.name for path in image_paths)}")
+        return image_paths
 
-    except FileNotFoundError:
-        raise RuntimeError("Command 'lualatex' not found. Please install a LaTeX distribution.")
     except Exception as e:
         log.error(f"Compilation error: {e}")
         raise e
@@ -1,19 +1,114 @@
+import asyncio
 import logging
-from typing import Any, List, Optional, Iterator
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Iterator, Tuple, TypeVar
 
 import litellm
-from langchain_core.callbacks.manager import CallbackManagerForLLMRun
+from litellm.utils import supports_prompt_caching, supports_response_schema
+from langchain_core.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import AIMessage, BaseMessage, AIMessageChunk
 from langchain_core.outputs import ChatGeneration, ChatResult, ChatGenerationChunk
 from pydantic import Field
 
+from src.core import metrics
+from src.core.llm_client import RETRYABLE_ERRORS, llm_client
+
 log = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+@lru_cache(maxsize=None)
+def model_supports_prompt_caching(model: str) -> bool:
+    """Asks LiteLLM's model map once per model (unknown models -> False)."""
+    try:
+        return supports_prompt_caching(model=model)
+    except Exception:
+        return False
+
+
+@lru_cache(maxsize=None)
+def model_supports_response_schema(model: str) -> bool:
+    """Decoding constrained by a JSON schema (`response_format`), per LiteLLM's model map."""
+    try:
+        return supports_response_schema(model=model)
+    except Exception:
+        return False
+
+
+def _response_format(schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "json_schema", "json_schema": {"name": "neuclid_output", "schema": schema, "strict": False}}
+
+
+def _with_cache_control(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Marks a system message as a cacheable prefix (Anthropic/Gemini style `cache_control`)."""
+    if message["role"] != "system" or not isinstance(message["content"], str):
+        return message
+    return {
+        "role": "system",
+        "content": [{"type": "text", "text": message["content"], "cache_control": {"type": "ephemeral"}}],
+    }
+
+
+def _without_cache_control(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverse de `_with_cache_control`, pour un modèle de secours qui ne le gère pas."""
+    content = message["content"]
+    if isinstance(content, list) and len(content) == 1 and "cache_control" in content[0]:
+        return {"role": message["role"], "content": content[0]["text"]}
+    return message
+
+
+class LatencyTracker:
+    """
+    Latences récentes (fenêtre glissante) par modèle, pour décider quand doubler
+    une requête : au-delà du p95 observé, la réponse est probablement « dans la queue ».
+    """
+    def __init__(self, window: int = 200, min_samples: int = 10):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float):
+        self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model: str, q: float) -> Optional[float]:
+        samples = self._samples.get(model)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def hedge_delay(self, model: str, minimum: float) -> Optional[float]:
+        """p95 observé (au moins `minimum`), None tant que le modèle n'a pas `min_samples` mesures."""
+        p95 = self.percentile(model, 0.95)
+        return max(p95, minimum) if p95 is not None else None
+
+
+latency_tracker = LatencyTracker()
+
+
+def _first_chunk_key(model: str) -> str:
+    """Clé du temps jusqu'au premier token (streaming), distinct de la durée totale."""
+    return f"{model}#first_chunk"
+
+
+async def _with_deadline(awaitable: Awaitable[T], timeout: Optional[float]) -> T:
+    """`asyncio.wait_for` avec un message explicite (None = pas de limite)."""
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        log.error(f"LLM request exceeded its deadline (remaining budget: {timeout:.1f}s).")
+        raise TimeoutError("LLM request deadline exceeded.")
+
+
 # --- NEUCLID CHAT WRAPPER ---
 class NeuclidChat(BaseChatModel):
     """
-    A robust custom wrapper around `litellm.completion`.
+    A robust custom wrapper around `litellm.completion` / `litellm.acompletion`.
     
     This class implements LangChain's BaseChatModel interface, making it
     compatible with the LangChain ecosystem.
@@ -27,6 +122,29 @@ class NeuclidChat(BaseChatModel):
     fallback_model_name: Optional[str] = None
     """Optional fallback model if the primary one fails."""
 
+    api_base: Optional[str] = None
+    """Optional endpoint override (self-hosted / OpenAI-compatible server, local fake server in benchmarks)."""
+
+    fallback_api_base: Optional[str] = None
+    """Endpoint override for the fallback model."""
+
+    hedge_requests: bool = True
+    """Async calls: if the primary is slower than its usual p95, race the fallback model against it.
+    No hedging until `latency_tracker` has enough latencies of the primary (a cold start doubles nothing)."""
+
+    hedge_min_delay: float = 1.0
+    """Never hedge earlier than this (s), even for a very fast model."""
+
+    request_deadline: Optional[float] = 120.0
+    """Overall deadline (s) of an async call, hedging and fallback included (None = no limit)."""
+
+    response_schema: Optional[Dict[str, Any]] = None
+    """JSON schema of the expected answer, sent as `response_format` to the models that support it
+    (can also be passed per call: `llm.ainvoke(messages, response_schema=...)`)."""
+
+    cache_system_prompt: bool = False
+    """Mark the first system message (the static prefix) for provider-side prompt caching, where LiteLLM supports it."""
+
     class Config:
         """Configuration to allow 'model' alias."""
         populate_by_name = True
@@ -35,54 +153,111 @@ class NeuclidChat(BaseChatModel):
     def _llm_type(self) -> str:
         return "neuclid_chat_wrapper"
 
-    def _generate(
+    def _prepare_call(
         self,
         messages: List[BaseMessage],
-        stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        stop: Optional[List[str]],
+        response_schema: Optional[Dict[str, Any]] = None,
         **kwargs: Any,
-    ) -> ChatResult:
-        """
-        Main method calling LiteLLM.
-        Converts LangChain messages to LiteLLM dicts, calls API, and converts back.
-        """
-        # 1. Convert LangChain messages to LiteLLM dicts
+    ) -> Dict[str, Any]:
+        """Converts LangChain messages to LiteLLM dicts and builds the call arguments."""
         message_dicts = []
         for msg in messages:
             role = "user" if msg.type == "human" else msg.type
             message_dicts.append({"role": role, "content": msg.content})
+        if self.cache_system_prompt and model_supports_prompt_caching(self.model_name):
+            # Seul le premier message système (le préfixe statique) est marqué
+            first_system = next((i for i, m in enumerate(message_dicts) if m["role"] == "system"), None)
+            if first_system is not None:
+                message_dicts[first_system] = _with_cache_control(message_dicts[first_system])
 
-        # 2. Prepare arguments
-        current_model = self.model_name
         litellm_kwargs = {
-            "model": current_model,
+            "model": self.model_name,
             "messages": message_dicts,
             "temperature": self.temperature,
             **kwargs,
         }
         if stop:
             litellm_kwargs["stop"] = stop
+        if self.api_base:
+            litellm_kwargs["api_base"] = self.api_base
+        response_schema = response_schema or self.response_schema
+        if response_schema is not None:
+            # Gardé pour le modèle de secours, retiré si le modèle principal ne sait pas l'utiliser
+            litellm_kwargs["response_schema"] = response_schema
+        return litellm_kwargs
+
+    @staticmethod
+    def _call_kwargs(call_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Final LiteLLM arguments: `response_schema` becomes a `response_format` if the model supports it."""
+        if "response_schema" not in call_kwargs:
+            return call_kwargs
+        call_kwargs = dict(call_kwargs)
+        schema = call_kwargs.pop("response_schema")
+        if model_supports_response_schema(call_kwargs["model"]):
+            call_kwargs["response_format"] = _response_format(schema)
+        return call_kwargs
+
+    def _fallback_kwargs(self, litellm_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Arguments for the fallback model (same messages, more retries)."""
+        messages = litellm_kwargs["messages"]
+        if not model_supports_prompt_caching(self.fallback_model_name):
+            messages = [_without_cache_control(message) for message in messages]
+        fallback_kwargs = {
+            "model": self.fallback_model_name,
+            "messages": messages,
+            "temperature": litellm_kwargs.get("temperature", self.temperature),
+            "stop": litellm_kwargs.get("stop"),
+            "num_retries": 5,
+        }
+        if "response_schema" in litellm_kwargs:
+            fallback_kwargs["response_schema"] = litellm_kwargs["response_schema"]
+        if self.fallback_api_base:
+            fallback_kwargs["api_base"] = self.fallback_api_base
+        return fallback_kwargs
+
+    @staticmethod
+    def _to_chat_result(response: Any) -> ChatResult:
+        """Validates the LiteLLM response and converts it back to LangChain format."""
+        if not response.choices or not response.choices[0].message or response.choices[0].message.content is None:
+            finish_reason = response.choices[0].finish_reason if response.choices else "unknown"
+            error_msg = f"LLM API response received but content is empty. Finish Reason: {finish_reason}"
+            log.error(error_msg)
+            raise ValueError(error_msg)
+        
+        content = response.choices[0].message.content
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        """
+        Main method calling LiteLLM.
+        Converts LangChain messages to LiteLLM dicts, calls API, and converts back.
+        """
+        litellm_kwargs = self._prepare_call(messages, stop, **kwargs)
+        current_model = self.model_name
 
-        # 3. Call LiteLLM with robust error handling
         log.debug(f"Calling litellm.completion with: {litellm_kwargs}")
         
         try:
-             response = litellm.completion(
-                    **litellm_kwargs,
+             # Même file d'attente par modèle et mêmes retries que les appels async
+             response = llm_client.completion(
+                    **self._call_kwargs(litellm_kwargs),
                     num_retries=3
                 )
-        except (litellm.InternalServerError, litellm.ServiceUnavailableError, litellm.RateLimitError) as e:
+        except RETRYABLE_ERRORS as e:
             log.warning(f"Error with primary model '{current_model}': {e}. Trying fallback.")
             if self.fallback_model_name:
                 try:
                     log.info(f"Switching to fallback model: {self.fallback_model_name}")
-                    response = litellm.completion(
-                        model=self.fallback_model_name,
-                        messages=message_dicts,
-                        temperature=self.temperature,
-                        stop=stop,
-                        num_retries=5
-                    )
+                    metrics.record_llm_event("fallbacks")
+                    current_model = self.fallback_model_name
+                    response = llm_client.completion(**self._call_kwargs(self._fallback_kwargs(litellm_kwargs)))
                 except Exception as fallback_e:
                     log.error(f"Fallback model also failed: {fallback_e}", exc_info=True)
                     raise fallback_e
@@ -92,13 +267,253 @@ class NeuclidChat(BaseChatModel):
              log.error(f"Unexpected error in litellm.completion: {e}", exc_info=True)
              raise e
 
-        # 4. Validation
-        if not response.choices or not response.choices[0].message or response.choices[0].message.content is None:
-            finish_reason = response.choices[0].finish_reason if response.choices else "unknown"
-            error_msg = f"LLM API response received but content is empty. Finish Reason: {finish_reason}"
-            log.error(error_msg)
-            raise ValueError(error_msg)
-        
-        # 5. Convert back to LangChain format
-        content = response.choices[0].message.content
-        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
\ No newline at end of file
+        metrics.record_llm_usage(current_model, getattr(response, "usage", None))
+        return self._to_chat_result(response)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        """
+        Native async version of `_generate` (litellm.acompletion).
+        Used by `ainvoke`: the event loop stays free while the provider answers,
+        so one worker can keep many LLM calls in flight.
+        With a fallback model, the call is hedged (see `_hedged`).
+        """
+        litellm_kwargs = self._prepare_call(messages, stop, **kwargs)
+        log.debug(f"Calling litellm.acompletion with: {litellm_kwargs}")
+
+        async def attempt(call_kwargs: Dict[str, Any]) -> ChatResult:
+            started = time.perf_counter()
+            response = await llm_client.acompletion(**self._call_kwargs(call_kwargs))
+            metrics.record_llm_usage(call_kwargs["model"], getattr(response, "usage", None))
+            result = self._to_chat_result(response)
+            latency_tracker.record(call_kwargs["model"], time.perf_counter() - started)
+            return result
+
+        return await _with_deadline(self._hedged(attempt, litellm_kwargs), self.request_deadline)
+
+    async def _hedged(
+        self,
+        attempt: Callable[[Dict[str, Any]], Awaitable[T]],
+        litellm_kwargs: Dict[str, Any],
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+        latency_key: Optional[str] = None,
+    ) -> T:
+        """
+        Runs `attempt` on the primary model. Without an answer after the primary's
+        p95 latency (`latency_tracker`), the same request is fired at the fallback
+        model and the first valid answer wins; the other call is cancelled and awaited
+        (`discard` cleans up a loser that finished anyway). Until the primary's p95 is
+        known, the call is not hedged.
+        A transient error of the primary still switches to the fallback, as before.
+        """
+        primary_kwargs = {**litellm_kwargs, "num_retries": 3}
+        if not self.fallback_model_name:
+            return await attempt(primary_kwargs)
+
+        fallback_kwargs = self._fallback_kwargs(litellm_kwargs)
+        primary = asyncio.create_task(attempt(primary_kwargs))
+        tasks = [primary]
+        winner = None
+        try:
+            delay = None
+            if self.hedge_requests:
+                delay = latency_tracker.hedge_delay(latency_key or self.model_name, self.hedge_min_delay)
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+
+            if done:
+                error = primary.exception()
+                if error is None:
+                    winner = primary
+                    return primary.result()
+                if not isinstance(error, RETRYABLE_ERRORS):
+                    log.error(f"Unexpected error in litellm.acompletion: {error}", exc_info=error)
+                    raise error
+                log.warning(f"Error with primary model '{self.model_name}': {error}. Trying fallback.")
+                log.info(f"Switching to fallback model: {self.fallback_model_name}")
+                metrics.record_llm_event("fallbacks")
+                return await attempt(fallback_kwargs)
+
+            log.info(f"Primary model '{self.model_name}' slower than {delay:.1f}s, "
+                     f"hedging with '{self.fallback_model_name}'.")
+            metrics.record_llm_event("hedges")
+            fallback = asyncio.create_task(attempt(fallback_kwargs))
+            tasks.append(fallback)
+            pending = {primary, fallback}
+            errors = []
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in (primary, fallback) if task in done and task.exception() is None]
+                errors.extend(task.exception() for task in done if task.exception() is not None)
+                if winners:
+                    winner = winners[0]
+                    model = self.model_name if winners[0] is primary else self.fallback_model_name
+                    log.info(f"Hedged request answered first by '{model}'.")
+                    return winners[0].result()
+            log.error(f"Primary and fallback models both failed: {errors}")
+            raise errors[0]
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            # Un perdant peut finir avant que l'annulation ne l'atteigne : on l'attend, et son
+            # résultat (ex: un flux ouvert) est rendu à `discard` plutôt que laissé en l'air
+            outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+            if discard:
+                for task, outcome in zip(tasks, outcomes):
+                    if task is not winner and not isinstance(outcome, BaseException):
+                        await discard(outcome)
+
+    def _open_stream(self, litellm_kwargs: Dict[str, Any]) -> Tuple[Any, str]:
+        """Opens a LiteLLM stream, with the same fallback rules as `_generate`. Returns (stream, model)."""
+        try:
+            return llm_client.completion(**self._call_kwargs(litellm_kwargs), stream=True, num_retries=3), self.model_name
+        except RETRYABLE_ERRORS as e:
+            if not self.fallback_model_name:
+                raise e
+            log.warning(f"Error with primary model '{self.model_name}': {e}. Streaming from fallback.")
+            metrics.record_llm_event("fallbacks")
+            fallback_kwargs = self._call_kwargs(self._fallback_kwargs(litellm_kwargs))
+            return llm_client.completion(**fallback_kwargs, stream=True), self.fallback_model_name
+
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        """Text delta of a LiteLLM stream chunk ('' for role/usage-only chunks)."""
+        if not chunk.choices:
+            return ""
+        return chunk.choices[0].delta.content or ""
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        """
+        Streams the completion token by token (`llm.stream(...)`).
+        The fallback model only kicks in if the stream cannot be opened.
+        """
+        litellm_kwargs = self._prepare_call(messages, stop, **kwargs)
+        log.debug(f"Streaming litellm.completion with: {litellm_kwargs}")
+        response, model = self._open_stream(litellm_kwargs)
+        received, usage = [], None
+        try:
+            for chunk in response:
+                usage = getattr(chunk, "usage", None) or usage
+                text = self._chunk_text(chunk)
+                if not text:
+                    continue
+                received.append(text)
+                if run_manager:
+                    run_manager.on_llm_new_token(text)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+        finally:
+            _close_stream(response)
+            _record_stream_usage(model, litellm_kwargs["messages"], "".join(received), usage)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """
+        Native async streaming (`llm.astream(...)`).
+        The time to first token is hedged like `_agenerate`; the overall deadline
+        covers the whole stream. Breaking out of the loop closes the provider
+        stream: no tokens are paid for once the caller has what it needs.
+        """
+        litellm_kwargs = self._prepare_call(messages, stop, **kwargs)
+        log.debug(f"Streaming litellm.acompletion with: {litellm_kwargs}")
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + self.request_deadline if self.request_deadline else None
+
+        def remaining() -> Optional[float]:
+            return None if deadline_at is None else max(deadline_at - loop.time(), 0.0)
+
+        async def first_chunk(call_kwargs: Dict[str, Any]) -> Tuple[Any, AsyncIterator[Any], Optional[str], str]:
+            started = time.perf_counter()
+            response = await llm_client.acompletion(**self._call_kwargs(call_kwargs), stream=True)
+            iterator = response.__aiter__()
+            try:
+                async for chunk in iterator:
+                    text = self._chunk_text(chunk)
+                    if text:
+                        latency_tracker.record(_first_chunk_key(call_kwargs["model"]), time.perf_counter() - started)
+                        return response, iterator, text, call_kwargs["model"]
+            except BaseException:
+                await _aclose_stream(response)
+                raise
+            return response, iterator, None, call_kwargs["model"]
+
+        async def discard(opened: Tuple[Any, AsyncIterator[Any], Optional[str], str]):
+            await _aclose_stream(opened[0])
+
+        response, iterator, text, model = await _with_deadline(
+            self._hedged(first_chunk, litellm_kwargs, discard, _first_chunk_key(self.model_name)),
+            remaining(),
+        )
+        received, usage = [], None
+        try:
+            while text is not None:
+                if text:
+                    received.append(text)
+                    if run_manager:
+                        await run_manager.on_llm_new_token(text)
+                    yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+                try:
+                    chunk = await _with_deadline(iterator.__anext__(), remaining())
+                except StopAsyncIteration:
+                    break
+                usage = getattr(chunk, "usage", None) or usage
+                text = self._chunk_text(chunk)
+        finally:
+            await _aclose_stream(response)
+            _record_stream_usage(model, litellm_kwargs["messages"], "".join(received), usage)
+
+
+def _record_stream_usage(model: str, messages: List[Dict[str, Any]], text: str, usage: Any):
+    """Tokens d'un stream : bilan du fournisseur s'il est arrivé, sinon comptés localement (stream coupé)."""
+    if not metrics.is_tracking():
+        return
+    if usage is not None:
+        metrics.record_llm_usage(model, usage)
+        return
+    try:
+        usage = {
+            "prompt_tokens": litellm.token_counter(model=model, messages=messages),
+            "completion_tokens": litellm.token_counter(model=model, text=text) if text else 0,
+        }
+    except Exception as e:
+        log.debug(f"Could not count stream tokens: {e}")
+        return
+    metrics.record_llm_usage(model, usage, estimated=True)
+
+
+def _close_stream(response: Any):
+    """Best effort : ferme la connexion HTTP sous-jacente d'un stream LiteLLM."""
+    close = getattr(getattr(response, "completion_stream", None), "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception as e:
+            log.debug(f"Could not close LLM stream: {e}")
+
+
+async def _aclose_stream(response: Any):
+    """Version async de `_close_stream`."""
+    stream = getattr(response, "completion_stream", None)
+    close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+    if callable(close):
+        try:
+            result = close()
+            if hasattr(result, "__await__"):
+                await result
+        except Exception as e:
+            log.debug(f"Could not close LLM stream: {e}")
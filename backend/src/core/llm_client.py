@@ -0,0 +1,379 @@
+"""
+Couche client commune à toutes les instances `NeuclidChat` (routeur, outils) :
+
+- un pool de connexions HTTP keep-alive partagé par le process (`install_http_clients`,
+  appelé au démarrage de l'API) : passé explicitement (`client=`) aux appels Gemini /
+  Vertex, et via `litellm.aclient_session` aux fournisseurs compatibles OpenAI ;
+- des seaux à jetons par modèle (requêtes/min et tokens/min, cf. `LLM_RATE_LIMITS`) :
+  les appels attendent leur tour, dans l'ordre d'arrivée, au lieu d'enchaîner les 429 ;
+- des retries qui respectent `Retry-After` et mettent en pause tout le modèle, pas
+  seulement l'appel refusé.
+
+Les appels synchrones (`completion`) passent par les mêmes seaux et les mêmes retries
+que les appels async (`acompletion`) : ils attendent avec `time.sleep`, dans leur thread.
+"""
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import httpx
+import litellm
+from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler, HTTPHandler
+
+from src.config import settings
+from src.core import metrics
+from src.core.llm_replay import LLMRecordings, build_recordings
+
+log = logging.getLogger(__name__)
+
+# Erreurs transitoires du fournisseur (réessayées ici, puis bascule sur le modèle de secours)
+RETRYABLE_ERRORS = (litellm.InternalServerError, litellm.ServiceUnavailableError, litellm.RateLimitError)
+
+
+# Réserve d'un seau plein, en secondes de débit : une rafale ne vide pas la minute d'un coup
+BURST_SECONDS = 10.0
+
+
+class TokenBucket:
+    """
+    Seau à jetons : `rate` jetons par seconde, au plus `capacity` en réserve.
+    Chaque appel réserve ses jetons dès son arrivée (le solde peut passer sous zéro)
+    puis attend que la dette soit résorbée : l'ordre d'arrivée est respecté, et le
+    même seau sert aux appels async et aux appels synchrones (verrou de thread).
+    """
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(self.rate * BURST_SECONDS, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def debit(self, amount: float):
+        """Consommation constatée après coup (pas d'attente) ; négatif = rendu."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+    def pause(self, seconds: float):
+        """Le fournisseur a demandé d'attendre : plus rien ne part avant `seconds`."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _reserve(self, amount: float) -> float:
+        """Prend `amount` jetons ; renvoie l'attente avant de pouvoir partir."""
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            debt = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(debt, self.paused_until - time.monotonic(), 0.0)
+
+    def _pause_left(self) -> float:
+        with self._lock:
+            return max(self.paused_until - time.monotonic(), 0.0)
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Réserve `amount` jetons et attend son tour ; renvoie le temps attendu."""
+        amount = min(amount, self.capacity)  # Une requête énorme passe quand le seau est plein
+        started = time.monotonic()
+        wait = self._reserve(amount)
+        try:
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self._pause_left()  # Pause demandée pendant l'attente
+        except asyncio.CancelledError:
+            self.debit(-amount)  # Appel abandonné : ses jetons reviennent au seau
+            raise
+        return time.monotonic() - started
+
+    def acquire_sync(self, amount: float = 1.0) -> float:
+        """`acquire` pour un appel synchrone (bloque le thread appelant)."""
+        amount = min(amount, self.capacity)
+        started = time.monotonic()
+        wait = self._reserve(amount)
+        while wait > 0:
+            time.sleep(wait)
+            wait = self._pause_left()
+        return time.monotonic() - started
+
+
+class ModelLimiter:
+    """Limites d'un modèle : requêtes/min et tokens/min (chacune optionnelle)."""
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        waited = 0.0
+        if self.requests:
+            waited += await self.requests.acquire(1)
+        if self.tokens:
+            waited += await self.tokens.acquire(estimated_tokens)
+        return waited
+
+    def acquire_sync(self, estimated_tokens: int) -> float:
+        waited = 0.0
+        if self.requests:
+            waited += self.requests.acquire_sync(1)
+        if self.tokens:
+            waited += self.tokens.acquire_sync(estimated_tokens)
+        return waited
+
+    def debit_tokens(self, amount: int):
+        if self.tokens and amount > 0:
+            self.tokens.debit(amount)
+
+    def pause(self, seconds: float):
+        for bucket in (self.requests, self.tokens):
+            if bucket:
+                bucket.pause(seconds)
+
+
+def estimate_prompt_tokens(messages: Any) -> int:
+    """~4 caractères par token : suffit pour doser le seau, la consommation réelle est recalée ensuite."""
+    total = 0
+    for message in messages or []:
+        content = message.get("content") if isinstance(message, dict) else message
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        total += len(str(content or ""))
+    return total // 4 + 1
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Délai demandé par le fournisseur (`retry-after-ms` / `retry-after`, secondes ou date HTTP)."""
+    headers = getattr(error, "litellm_response_headers", None)
+    if headers is None:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            when = email.utils.parsedate_to_datetime(value)
+            return max(when.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class LLMClient:
+    """Point de passage de tous les appels à LiteLLM, sync et async (rate limit + retries)."""
+    def __init__(
+        self,
+        rate_limits: Dict[str, Dict[str, int]],
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        recordings: Optional[LLMRecordings] = None,
+    ):
+        self.rate_limits = rate_limits
+        # Backend d'enregistrement / rejeu (`LLM_BACKEND`), None = appels réels
+        self.recordings = recordings
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._limiters: Dict[str, Optional[ModelLimiter]] = {}
+        self._limiters_lock = threading.Lock()
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "queued_seconds": 0.0}
+
+    def limiter(self, model: str) -> Optional[ModelLimiter]:
+        """Limites du modèle (ou celles de '*'), None si aucune n'est configurée."""
+        with self._limiters_lock:
+            if model not in self._limiters:
+                limits = self.rate_limits.get(model) or self.rate_limits.get("*")
+                self._limiters[model] = ModelLimiter(limits.get("rpm"), limits.get("tpm")) if limits else None
+            return self._limiters[model]
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        requested = retry_after_seconds(error)
+        if requested is not None:
+            return min(requested, self.max_delay)
+        # Backoff exponentiel avec gigue (évite que les appels refusés repartent ensemble)
+        return min(self.base_delay * 2 ** attempt, self.max_delay) * random.uniform(0.5, 1.0)
+
+    def _queued(self, model: str, waited: float):
+        if waited > 0.05:
+            self.stats["queued_seconds"] += waited
+            log.debug(f"LLM call to '{model}' queued {waited:.2f}s by the rate limiter.")
+
+    def _retry_delay(
+        self, model: str, limiter: Optional[ModelLimiter], attempt: int, num_retries: int, error: Exception
+    ) -> float:
+        """Délai avant la tentative `attempt + 1` (relève `error` quand il n'en reste plus)."""
+        if attempt >= num_retries:
+            raise error
+        delay = self._backoff(attempt, error)
+        if isinstance(error, litellm.RateLimitError):
+            self.stats["rate_limited"] += 1
+            if limiter:
+                limiter.pause(delay)  # Tout le modèle attend, pas seulement cet appel
+        self.stats["retries"] += 1
+        metrics.record_llm_event("retries")
+        log.warning(f"Transient error from '{model}' ({type(error).__name__}), "
+                    f"retry {attempt + 1}/{num_retries} in {delay:.1f}s.")
+        return delay
+
+    @staticmethod
+    def _settle(limiter: Optional[ModelLimiter], estimated: int, response: Any, kwargs: Dict[str, Any]):
+        """Recalage du seau de tokens sur la consommation réelle (réponses non streamées)."""
+        usage = getattr(response, "usage", None)
+        if limiter and usage is not None and not kwargs.get("stream"):
+            actual = int(getattr(usage, "total_tokens", 0) or 0)
+            limiter.debit_tokens(actual - estimated)
+
+    @staticmethod
+    def _estimate(kwargs: Dict[str, Any]) -> int:
+        return estimate_prompt_tokens(kwargs.get("messages")) + int(kwargs.get("max_tokens") or 0)
+
+    async def acompletion(self, num_retries: int = 3, **kwargs: Any) -> Any:
+        """
+        `litellm.acompletion` derrière le seau à jetons du modèle, avec `num_retries`
+        tentatives supplémentaires sur les erreurs transitoires (LiteLLM n'en fait aucune).
+        """
+        model = kwargs["model"]
+        limiter = self.limiter(model)
+        estimated = self._estimate(kwargs)
+        self.stats["calls"] += 1
+        attempt = 0
+        while True:
+            if limiter:
+                self._queued(model, await limiter.acquire(estimated))
+            try:
+                response = await self._send(**kwargs)
+            except RETRYABLE_ERRORS as e:
+                delay = self._retry_delay(model, limiter, attempt, num_retries, e)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._settle(limiter, estimated, response, kwargs)
+            return response
+
+    def completion(self, num_retries: int = 3, **kwargs: Any) -> Any:
+        """
+        `litellm.completion` (chemins synchrones de `NeuclidChat`) : mêmes seaux et mêmes
+        retries que `acompletion`, les attentes bloquent le thread appelant.
+        """
+        if self.recordings is not None:
+            # Le rejeu est async ; un appel synchrone partirait sur le réseau sans prévenir
+            raise RuntimeError(f"LLM_BACKEND={self.recordings.mode} only supports async LLM calls.")
+        model = kwargs["model"]
+        limiter = self.limiter(model)
+        estimated = self._estimate(kwargs)
+        self.stats["calls"] += 1
+        attempt = 0
+        while True:
+            if limiter:
+                self._queued(model, limiter.acquire_sync(estimated))
+            try:
+                response = litellm.completion(**kwargs, **_pooled_client(model, sync=True), num_retries=0)
+            except RETRYABLE_ERRORS as e:
+                delay = self._retry_delay(model, limiter, attempt, num_retries, e)
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._settle(limiter, estimated, response, kwargs)
+            return response
+
+    async def _send(self, **kwargs: Any) -> Any:
+        if self.recordings is not None:
+            return await self.recordings.acompletion(self._live, **kwargs)
+        return await self._live(**kwargs)
+
+    @staticmethod
+    async def _live(**kwargs: Any) -> Any:
+        return await litellm.acompletion(**kwargs, **_pooled_client(kwargs["model"], sync=False), num_retries=0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot = {**self.stats, "queued_seconds": round(self.stats["queued_seconds"], 2)}
+        if self.recordings is not None:
+            snapshot["recordings"] = self.recordings.snapshot()
+        return snapshot
+
+
+# Fournisseurs LiteLLM dont le client HTTP se passe par `client=` (Gemini / Vertex)
+HANDLER_PROVIDERS = ("gemini", "vertex_ai", "vertex_ai_beta")
+
+_http_clients: Dict[str, Any] = {}
+
+
+class _PooledAsyncHandler(AsyncHTTPHandler):
+    """Client HTTP async de LiteLLM, posé sur le pool du process au lieu d'un client à lui."""
+    def __init__(self, client: httpx.AsyncClient):
+        self._pool = client
+        super().__init__(timeout=client.timeout)
+
+    def create_client(self, *args: Any, **kwargs: Any) -> httpx.AsyncClient:
+        return self._pool
+
+
+@lru_cache(maxsize=None)
+def _uses_handler(model: str) -> bool:
+    try:
+        return litellm.get_llm_provider(model)[1] in HANDLER_PROVIDERS
+    except Exception:
+        return False
+
+
+def _pooled_client(model: str, sync: bool) -> Dict[str, Any]:
+    """`client=` à passer à LiteLLM pour ce modèle (vide : pool pas installé, ou fournisseur OpenAI)."""
+    handler = _http_clients.get("handler_sync" if sync else "handler_async")
+    if handler is None or not _uses_handler(model):
+        return {}
+    return {"client": handler}
+
+
+def install_http_clients():
+    """
+    Pool keep-alive partagé par tous les appels LiteLLM du process : Gemini / Vertex
+    le reçoivent en `client=` (cf. `_pooled_client`), les fournisseurs compatibles
+    OpenAI via `litellm.aclient_session`. À appeler une fois, depuis la boucle de l'API.
+    """
+    limits = httpx.Limits(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_KEEPALIVE_SECONDS,
+    )
+    timeout = httpx.Timeout(settings.LLM_HTTP_TIMEOUT, connect=10.0)
+    async_client = httpx.AsyncClient(limits=limits, timeout=timeout, follow_redirects=True)
+    sync_client = httpx.Client(limits=limits, timeout=timeout, follow_redirects=True)
+    _http_clients["async"] = litellm.aclient_session = async_client
+    _http_clients["sync"] = litellm.client_session = sync_client
+    _http_clients["handler_async"] = _PooledAsyncHandler(async_client)
+    _http_clients["handler_sync"] = HTTPHandler(timeout=timeout, client=sync_client)
+    log.info(f"LLM HTTP pool ready ({settings.LLM_MAX_CONNECTIONS} connections max).")
+
+
+async def aclose_http_clients():
+    """Ferme le pool (arrêt de l'API)."""
+    _http_clients.pop("handler_async", None)
+    _http_clients.pop("handler_sync", None)
+    async_client, sync_client = _http_clients.pop("async", None), _http_clients.pop("sync", None)
+    litellm.aclient_session = litellm.client_session = None
+    if async_client is not None:
+        await async_client.aclose()
+    if sync_client is not None:
+        sync_client.close()
+
+
+# Singleton
+llm_client = LLMClient(
+    settings.LLM_RATE_LIMITS,
+    base_delay=settings.LLM_RETRY_BASE_DELAY,
+    max_delay=settings.LLM_RETRY_MAX_DELAY,
+    recordings=build_recordings(),
+)
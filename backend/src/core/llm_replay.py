@@ -0,0 +1,283 @@
+"""
+Backend d'enregistrement / rejeu des appels LLM (`LLM_BACKEND`), pour les tests de
+charge et les benchmarks hors ligne du pipeline `/generate` complet :
+
+- "record" : les vrais appels passent, chaque réponse est ajoutée (JSONL) à
+  `LLM_RECORDINGS_PATH` avec son temps au premier token et sa durée ;
+- "replay" : aucun appel réseau, la réponse enregistrée pour les mêmes messages
+  est rejouée (objets LiteLLM identiques, via `mock_response`) avec une latence
+  synthétique : celle enregistrée, ou tirée d'une loi log-normale (graine fixe).
+
+Clé : hash du modèle, de la température, du `response_format` et des messages
+(rôle + texte) : un appel n'est rejoué qu'avec la réponse d'un appel identique.
+Plusieurs enregistrements pour la même clé (variantes à la même température) sont
+rejoués dans l'ordre d'enregistrement : le n-ième appel identique d'une requête
+(collecteur de `metrics.track_request`) reçoit le n-ième, et au-delà le rejeu échoue
+au lieu de reboucler. Chaque requête repart du premier : le résultat ne dépend pas
+de l'ordre dans lequel les requêtes concurrentes d'un test de charge arrivent.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+import litellm
+
+from src.config import settings
+from src.core import metrics
+
+log = logging.getLogger(__name__)
+
+
+def _message_text(content: Any) -> str:
+    """Texte d'un message, marquage de cache (`cache_control`) compris ou non."""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content or "")
+
+
+def recording_key(kwargs: Dict[str, Any]) -> str:
+    """Clé d'un appel LiteLLM : tout ce qui change la réponse (hors marquage de cache)."""
+    canonical = json.dumps(
+        {
+            "model": kwargs["model"],
+            "temperature": kwargs.get("temperature"),
+            "response_format": kwargs.get("response_format"),
+            "messages": [[message.get("role"), _message_text(message.get("content"))] for message in kwargs["messages"]],
+        },
+        ensure_ascii=False, separators=(",", ":"), sort_keys=True, default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _RecordingStream:
+    """Stream LiteLLM relayé tel quel ; le texte reçu est enregistré à la fin (ou à la fermeture)."""
+    def __init__(self, response: Any, on_done: Callable[[str, Optional[float], Any], None], started: float):
+        self._response = response
+        self._iterator = response.__aiter__()
+        self._on_done = on_done
+        self._started = started
+        self._first_chunk_at: Optional[float] = None
+        self._parts: List[str] = []
+        self._usage = None
+        self._saved = False
+        self.completion_stream = self  # Pour `_aclose_stream`
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        try:
+            chunk = await self._iterator.__anext__()
+        except StopAsyncIteration:
+            self._save()
+            raise
+        self._usage = getattr(chunk, "usage", None) or self._usage
+        text = chunk.choices[0].delta.content if chunk.choices else None
+        if text:
+            if self._first_chunk_at is None:
+                self._first_chunk_at = time.perf_counter()
+            self._parts.append(text)
+        return chunk
+
+    def _save(self):
+        if not self._saved:
+            self._saved = True
+            ttft = None if self._first_chunk_at is None else self._first_chunk_at - self._started
+            self._on_done("".join(self._parts), ttft, self._usage)
+
+    async def aclose(self):
+        # Stream coupé par l'appelant : on garde ce qui a été lu (le rejeu s'arrêtera au même endroit)
+        self._save()
+        stream = getattr(self._response, "completion_stream", None)
+        close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+        if callable(close):
+            result = close()
+            if hasattr(result, "__await__"):
+                await result
+
+
+class _PacedStream:
+    """
+    Stream rejoué : chaque morceau arrive à l'heure prévue par le débit (calée sur
+    l'horloge, pas un sleep par morceau : les petits morceaux de LiteLLM ne dérivent pas).
+    """
+    def __init__(self, response: Any, seconds_per_char: float):
+        self._iterator = response.__aiter__()
+        self._seconds_per_char = seconds_per_char
+        self._started = time.perf_counter()
+        self._chars = 0
+        self.completion_stream = getattr(response, "completion_stream", None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        chunk = await self._iterator.__anext__()
+        text = chunk.choices[0].delta.content if chunk.choices else None
+        if text and self._seconds_per_char > 0:
+            self._chars += len(text)
+            delay = self._started + self._chars * self._seconds_per_char - time.perf_counter()
+            if delay > 0.005:
+                await asyncio.sleep(delay)
+        return chunk
+
+
+class LLMRecordings:
+    """Enregistrements sur disque et rejeu (voir le docstring du module)."""
+    def __init__(
+        self,
+        path: Path,
+        mode: str,
+        latency: str = "recorded",
+        ttft_median: float = 1.0,
+        ttft_sigma: float = 0.5,
+        tokens_per_second: float = 150.0,
+        seed: Optional[int] = 0,
+    ):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown LLM recordings mode: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.latency = latency
+        self.ttft_median = ttft_median
+        self.ttft_sigma = ttft_sigma
+        self.tokens_per_second = tokens_per_second
+        self.rng = random.Random(seed)
+        self.entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        # Appels déjà rejoués par clé, par requête (hors requête : compteur global)
+        self._sequences: "WeakKeyDictionary[Any, Dict[str, int]]" = WeakKeyDictionary()
+        self._global_sequence: Dict[str, int] = defaultdict(int)
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            if self.mode == "replay":
+                log.warning(f"No LLM recordings at {self.path}: every replayed call will fail.")
+            return
+        with self.path.open(encoding="utf-8") as source:
+            for line_number, line in enumerate(source, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    self.entries[entry["key"]].append(entry)
+                except (ValueError, KeyError) as e:
+                    log.warning(f"LLM recordings: line {line_number} ignored: {e}")
+        log.info(f"LLM recordings ({self.mode}): {sum(map(len, self.entries.values()))} response(s) "
+                 f"for {len(self.entries)} prompt(s) in {self.path}.")
+
+    async def acompletion(self, send: Callable[..., Awaitable[Any]], **kwargs: Any) -> Any:
+        """Remplace `send(**kwargs)` (l'appel LiteLLM réel) selon le mode."""
+        if self.mode == "record":
+            return await self._record(send, **kwargs)
+        return await self._replay(**kwargs)
+
+    # --- Enregistrement ---
+
+    def _append(self, key: str, kwargs: Dict[str, Any], content: str, usage: Any,
+                ttft: Optional[float], duration: float):
+        entry = {
+            "key": key,
+            "model": kwargs["model"],
+            "temperature": kwargs.get("temperature"),
+            "stream": bool(kwargs.get("stream")),
+            "content": content,
+            "usage": {
+                name: int(getattr(usage, name, 0) or 0)
+                for name in ("prompt_tokens", "completion_tokens", "total_tokens")
+            } if usage is not None else None,
+            "ttft": round(ttft, 4) if ttft is not None else None,
+            "duration": round(duration, 4),
+            "recorded_at": time.time(),
+        }
+        self.entries[key].append(entry)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as sink:
+            sink.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.stats["recorded"] += 1
+
+    async def _record(self, send: Callable[..., Awaitable[Any]], **kwargs: Any) -> Any:
+        key = recording_key(kwargs)
+        started = time.perf_counter()
+        response = await send(**kwargs)
+        if kwargs.get("stream"):
+            def on_done(content: str, ttft: Optional[float], usage: Any):
+                self._append(key, kwargs, content, usage, ttft, time.perf_counter() - started)
+            return _RecordingStream(response, on_done, started)
+        duration = time.perf_counter() - started
+        content = response.choices[0].message.content if response.choices else None
+        self._append(key, kwargs, content or "", getattr(response, "usage", None), duration, duration)
+        return response
+
+    # --- Rejeu ---
+
+    def _sequence(self) -> Dict[str, int]:
+        request = metrics.current()
+        if request is None:
+            return self._global_sequence
+        return self._sequences.setdefault(request, defaultdict(int))
+
+    def _pick(self, key: str) -> Dict[str, Any]:
+        entries = self.entries.get(key, [])
+        sequence = self._sequence()
+        position = sequence[key]
+        if position >= len(entries):
+            self.stats["misses"] += 1
+            raise RuntimeError(f"No recorded LLM response for call #{position + 1} with this model, temperature, "
+                               f"schema and messages (key {key[:12]}, {len(entries)} recorded); "
+                               f"record it first with LLM_BACKEND=record.")
+        sequence[key] = position + 1
+        self.stats["replayed"] += 1
+        return entries[position]
+
+    def _timing(self, entry: Dict[str, Any]) -> Tuple[float, float]:
+        """(temps au premier token, secondes par caractère du reste de la réponse)."""
+        chars = max(len(entry["content"]), 1)
+        if self.latency == "none":
+            return 0.0, 0.0
+        if self.latency == "recorded" and entry.get("ttft") is not None:
+            ttft = entry["ttft"]
+            return ttft, max(entry["duration"] - ttft, 0.0) / chars
+        ttft = self.rng.lognormvariate(0.0, self.ttft_sigma) * self.ttft_median
+        return ttft, 1.0 / (4 * self.tokens_per_second)  # ~4 caractères par token
+
+    async def _replay(self, **kwargs: Any) -> Any:
+        entry = self._pick(recording_key(kwargs))
+        ttft, seconds_per_char = self._timing(entry)
+        stream = bool(kwargs.get("stream"))
+        mock_kwargs = {"model": kwargs["model"], "messages": kwargs["messages"], "mock_response": entry["content"]}
+        if not stream:
+            # Réponse complète : tout le temps de génération est attendu d'un coup
+            await asyncio.sleep(ttft + seconds_per_char * len(entry["content"]))
+            response = await litellm.acompletion(**mock_kwargs)
+            if entry.get("usage"):
+                response.usage = litellm.Usage(**entry["usage"])
+            return response
+        await asyncio.sleep(ttft)
+        return _PacedStream(await litellm.acompletion(**mock_kwargs, stream=True), seconds_per_char)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "prompts": len(self.entries), **self.stats}
+
+
+def build_recordings() -> Optional[LLMRecordings]:
+    """Backend choisi par `LLM_BACKEND` (None = appels réels, sans enregistrement)."""
+    if settings.LLM_BACKEND == "live":
+        return None
+    return LLMRecordings(
+        settings.LLM_RECORDINGS_PATH,
+        settings.LLM_BACKEND,
+        latency=settings.LLM_REPLAY_LATENCY,
+        ttft_median=settings.LLM_REPLAY_TTFT_MEDIAN,
+        ttft_sigma=settings.LLM_REPLAY_TTFT_SIGMA,
+        tokens_per_second=settings.LLM_REPLAY_TOKENS_PER_SECOND,
+        seed=settings.LLM_REPLAY_SEED,
+    )
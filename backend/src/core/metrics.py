@@ -0,0 +1,215 @@
+"""
+Mesures par requête : temps de chaque étape du pipeline (routeur LLM, LLM de
+géométrie, extraction JSON, validation, traduction, compilation, rastérisation)
+et, pour les étapes LLM, tokens (prompt / réponse / servis depuis le cache),
+coût estimé et bascules de modèle.
+
+Le collecteur de la requête vit dans un `ContextVar` : les tâches asyncio créées
+pendant la requête (plan spéculatif, variantes, candidats en course) le partagent,
+sans rien faire passer en paramètre. Hors requête, tout est sans effet.
+Les étapes concurrentes s'additionnent : la somme peut dépasser le temps total.
+"""
+import logging
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterator, Optional
+
+import litellm
+
+log = logging.getLogger(__name__)
+
+# Étape à laquelle un appel LLM est attribué hors de tout `stage(...)`
+DEFAULT_LLM_STAGE = "llm"
+
+
+@dataclass
+class LlmUsage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cost_usd: float = 0.0
+    fallbacks: int = 0      # Erreur transitoire du modèle principal -> modèle de secours
+    hedges: int = 0         # Requête doublée vers le modèle de secours (cf. NeuclidChat._hedged)
+    retries: int = 0        # Nouvelle tentative après une erreur transitoire (cf. llm_client.py)
+    estimated: bool = False  # Tokens comptés localement (stream coupé avant le bilan du fournisseur)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "fallbacks": self.fallbacks,
+            "hedges": self.hedges,
+            "retries": self.retries,
+            "estimated": self.estimated,
+        }
+
+
+class RequestMetrics:
+    """Temps par étape et consommation LLM d'une requête."""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stage_seconds: Dict[str, float] = defaultdict(float)
+        self.stage_calls: Dict[str, int] = defaultdict(int)
+        self.llm: Dict[str, LlmUsage] = defaultdict(LlmUsage)
+        self.total_seconds: Optional[float] = None
+
+    def add_stage(self, name: str, seconds: float):
+        self.stage_seconds[name] += seconds
+        self.stage_calls[name] += 1
+
+    def finish(self):
+        self.total_seconds = time.perf_counter() - self.started
+
+    def snapshot(self) -> Dict[str, Any]:
+        total = self.total_seconds if self.total_seconds is not None else time.perf_counter() - self.started
+        return {
+            "total_seconds": round(total, 3),
+            "stages": {
+                name: {"seconds": round(seconds, 3), "calls": self.stage_calls[name]}
+                for name, seconds in self.stage_seconds.items()
+            },
+            "llm": {name: usage.snapshot() for name, usage in self.llm.items()},
+            "cost_usd": round(sum(usage.cost_usd for usage in self.llm.values()), 6),
+        }
+
+
+_request: ContextVar[Optional[RequestMetrics]] = ContextVar("neuclid_request_metrics", default=None)
+_stage: ContextVar[str] = ContextVar("neuclid_metrics_stage", default=DEFAULT_LLM_STAGE)
+
+
+def current() -> Optional[RequestMetrics]:
+    return _request.get()
+
+
+def is_tracking() -> bool:
+    return _request.get() is not None
+
+
+@contextmanager
+def track_request() -> Iterator[RequestMetrics]:
+    """Ouvre le collecteur d'une requête ; il est envoyé à `metrics_sink` à la sortie."""
+    metrics = RequestMetrics()
+    token = _request.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _request.reset(token)
+        metrics.finish()
+        metrics_sink.record(metrics)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Chronomètre une étape ; les appels LLM faits dedans lui sont attribués."""
+    metrics = _request.get()
+    if metrics is None:
+        yield
+        return
+    token = _stage.set(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_stage(name, time.perf_counter() - started)
+        _stage.reset(token)
+
+
+def _usage_value(usage: Any, name: str) -> int:
+    value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+    return int(value or 0)
+
+
+def _cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Coût d'après la table de prix de LiteLLM (0 pour un modèle inconnu)."""
+    try:
+        prompt_cost, completion_cost = litellm.cost_per_token(
+            model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+        )
+        return prompt_cost + completion_cost
+    except Exception:
+        return 0.0
+
+
+def record_llm_usage(model: str, usage: Any, estimated: bool = False):
+    """Un appel LLM terminé (`usage` : bloc `usage` d'une réponse LiteLLM, objet ou dict)."""
+    metrics = _request.get()
+    if metrics is None or usage is None:
+        return
+    prompt_tokens = _usage_value(usage, "prompt_tokens")
+    completion_tokens = _usage_value(usage, "completion_tokens")
+    details = usage.get("prompt_tokens_details") if isinstance(usage, dict) else getattr(usage, "prompt_tokens_details", None)
+    entry = metrics.llm[_stage.get()]
+    entry.calls += 1
+    entry.prompt_tokens += prompt_tokens
+    entry.completion_tokens += completion_tokens
+    entry.cached_tokens += _usage_value(details, "cached_tokens") if details is not None else 0
+    entry.cost_usd += _cost(model, prompt_tokens, completion_tokens)
+    entry.estimated |= estimated
+
+
+def record_llm_event(kind: str):
+    """Incident d'un appel LLM : 'fallbacks', 'hedges' (bascules vers le secours) ou 'retries'."""
+    metrics = _request.get()
+    if metrics is not None:
+        entry = metrics.llm[_stage.get()]
+        setattr(entry, kind, getattr(entry, kind) + 1)
+
+
+class MetricsSink:
+    """
+    Agrégat de toutes les requêtes : temps par étape (moyenne, p50, p95 sur une
+    fenêtre glissante), tokens et coût cumulés. Chaque requête est aussi journalisée
+    sur une ligne, pour l'exploitation hors process.
+    """
+    def __init__(self, window: int = 500):
+        self.requests = 0
+        self.window = window
+        self.stage_samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self.stage_totals: Dict[str, float] = defaultdict(float)
+        self.llm_totals: Dict[str, LlmUsage] = defaultdict(LlmUsage)
+
+    def record(self, metrics: RequestMetrics):
+        self.requests += 1
+        for name, seconds in metrics.stage_seconds.items():
+            self.stage_samples[name].append(seconds)
+            self.stage_totals[name] += seconds
+        for name, usage in metrics.llm.items():
+            total = self.llm_totals[name]
+            for field in ("calls", "prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd", "fallbacks", "hedges", "retries"):
+                setattr(total, field, getattr(total, field) + getattr(usage, field))
+            total.estimated |= usage.estimated
+        stages = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in metrics.stage_seconds.items())
+        tokens = sum(usage.prompt_tokens + usage.completion_tokens for usage in metrics.llm.values())
+        log.info(f"📊 Request metrics: total={metrics.total_seconds or 0:.2f}s, {stages or 'no stage'}, "
+                 f"{tokens} LLM tokens, ${sum(usage.cost_usd for usage in metrics.llm.values()):.4f}")
+
+    @staticmethod
+    def _percentile(samples: Deque[float], q: float) -> float:
+        ordered = sorted(samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "stages": {
+                name: {
+                    "total_seconds": round(self.stage_totals[name], 3),
+                    "mean_seconds": round(sum(samples) / len(samples), 3),
+                    "p50_seconds": round(self._percentile(samples, 0.5), 3),
+                    "p95_seconds": round(self._percentile(samples, 0.95), 3),
+                }
+                for name, samples in self.stage_samples.items() if samples
+            },
+            "llm": {name: usage.snapshot() for name, usage in self.llm_totals.items()},
+        }
+
+
+# Singleton
+metrics_sink = MetricsSink()
@@ -1,6 +1,6 @@
 import logging
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from jinja2 import Template
 
 log = logging.getLogger(__name__)
@@ -14,24 +14,47 @@ class PromptManager:
     def __init__(self, templates_dir: Optional[Path] = None):
         # Default to a global prompts directory if not provided
         self.templates_dir = templates_dir or Path(__file__).resolve().parent.parent.parent / "prompts"
+        # path -> (mtime_ns, compiled template, rendu sans contexte ou None)
+        self._cache: Dict[Path, Tuple[int, Template, Optional[str]]] = {}
+
+    def _get_entry(self, template_path: Path) -> Tuple[int, Template, Optional[str]]:
+        """Compiled template from memory, reloaded only if the file changed on disk."""
+        try:
+            mtime = template_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            log.error(f"Prompt template not found at: {template_path}")
+            raise FileNotFoundError(f"Template {template_path} missing.")
+
+        entry = self._cache.get(template_path)
+        if entry is None or entry[0] != mtime:
+            raw_content = template_path.read_text(encoding="utf-8")
+            try:
+                entry = (mtime, Template(raw_content), None)
+            except Exception as e:
+                log.error(f"Failed to compile prompt template {template_path}: {e}")
+                raise ValueError(f"Prompt rendering error: {e}")
+            self._cache[template_path] = entry
+            log.debug(f"Prompt template (re)loaded: {template_path}")
+        return entry
 
     def load_template(self, template_path: Path, context: Dict[str, Any] = None) -> str:
         """
         Loads a file and renders it with the given context variables.
+        The compiled template (and its context-free rendering) stays in memory
+        until the file's mtime changes.
         """
-        if not template_path.exists():
-            log.error(f"Prompt template not found at: {template_path}")
-            raise FileNotFoundError(f"Template {template_path} missing.")
-
-        raw_content = template_path.read_text(encoding="utf-8")
+        mtime, template, rendered = self._get_entry(template_path)
+        if not context and rendered is not None:
+            return rendered
         
         try:
-            template = Template(raw_content)
             rendered = template.render(**(context or {}))
-            return rendered
         except Exception as e:
             log.error(f"Failed to render prompt template {template_path}: {e}")
             raise ValueError(f"Prompt rendering error: {e}")
+        if not context:
+            self._cache[template_path] = (mtime, template, rendered)
+        return rendered
 
 # Global instance
 prompt_manager = PromptManager()
\ No newline at end of file
@@ -1,11 +1,17 @@
 import logging
 import json
-from typing import Literal
+from collections import Counter
+from typing import Any, Dict, Literal, Optional
 from pydantic import BaseModel, Field
 from langchain_core.messages import SystemMessage, HumanMessage
 
+from src.config import settings
+from src.core import metrics
+from src.core.intent_classifier import IntentPrediction, LocalIntentClassifier, route_locally
 from src.core.llm import NeuclidChat
 from src.core.registry import tool_registry
+from src.utils.parser import parse_llm_output_to_model
+from src.utils.schema import trim_schema
 
 log = logging.getLogger(__name__)
 
@@ -16,23 +22,108 @@ class RouterDecision(BaseModel):
     tool_name: str = Field(..., description="The exact name of the tool to use.")
     confidence: float = Field(..., description="Confidence score between 0.0 and 1.0.")
 
+# Le schéma ne change jamais : on le sérialise une seule fois, à l'import.
+ROUTER_DECISION_SCHEMA = json.dumps(RouterDecision.model_json_schema(), indent=2)
+
+class RoutingStats:
+    """
+    Historique des décisions du routeur (par outil et par étage) et bilan de
+    l'exécution spéculative (outil lancé avant la réponse du routeur LLM).
+    """
+    def __init__(self):
+        self.decisions: Counter = Counter()
+        self.stages: Counter = Counter()
+        self.speculations = 0
+        self.speculation_hits = 0
+
+    def record_decision(self, tool_name: str, stage: str):
+        self.decisions[tool_name] += 1
+        self.stages[stage] += 1
+
+    def most_likely_tool(self) -> Optional[str]:
+        """Outil le plus souvent choisi jusqu'ici (None sans historique)."""
+        if not self.decisions:
+            return None
+        return self.decisions.most_common(1)[0][0]
+
+    def record_speculation(self, hit: bool):
+        self.speculations += 1
+        self.speculation_hits += int(hit)
+        log.info(f"Speculation {'hit' if hit else 'miss'} "
+                 f"(hit rate: {self.speculation_hits}/{self.speculations} = {self.speculation_hit_rate:.0%})")
+
+    @property
+    def speculation_hit_rate(self) -> float:
+        return self.speculation_hits / self.speculations if self.speculations else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "decisions": dict(self.decisions),
+            "stages": dict(self.stages),
+            "speculations": self.speculations,
+            "speculation_hits": self.speculation_hits,
+            "speculation_hit_rate": round(self.speculation_hit_rate, 3),
+        }
+
 class RouterService:
     def __init__(self):
         # We use a fast, smart model for routing (e.g., Gemini Flash or GPT-4o-mini)
         self.llm = NeuclidChat(model="gemini/gemini-2.5-flash-lite", temperature=0.0)
+        self.local_confidence = settings.ROUTER_LOCAL_CONFIDENCE
+        self.stats = RoutingStats()
+        # Classifieur local, reconstruit si la liste des outils du registre change
+        self._classifier = None
+        self._classifier_tools = ()
+        # Schéma de décodage contraint, `tool_name` limité aux outils du registre
+        self._decision_schema = None
+        self._decision_schema_tools = ()
+
+    def _get_classifier(self, tools) -> LocalIntentClassifier:
+        names = tuple(tool.name for tool in tools)
+        if self._classifier is None or names != self._classifier_tools:
+            self._classifier = LocalIntentClassifier(tools)
+            self._classifier_tools = names
+        return self._classifier
+
+    def route_locally(self, user_prompt: str) -> Optional[IntentPrediction]:
+        """Local stage (single tool / TF-IDF): no network hop. May be below the confidence threshold."""
+        tools = tool_registry.get_all_tools()
+        classifier = self._get_classifier(tools) if len(tools) > 1 else None
+        return route_locally(tools, user_prompt, classifier)
+
+    def is_confident(self, prediction: Optional[IntentPrediction]) -> bool:
+        return prediction is not None and prediction.confidence >= self.local_confidence
 
     async def route_request(self, user_prompt: str) -> str:
         """
         Analyzes the prompt and returns the name of the tool to use.
+        Local stage first (single tool / TF-IDF), the LLM only if it is not confident enough.
         """
+        prediction = self.route_locally(user_prompt)
+        if self.is_confident(prediction):
+            log.info(f"Local Router Decision: {prediction.tool_name} "
+                     f"(Confidence: {prediction.confidence:.2f}, {prediction.reason})")
+            self.stats.record_decision(prediction.tool_name, "local")
+            return prediction.tool_name
+        if prediction:
+            log.info(f"Local router unsure ({prediction.tool_name}: {prediction.confidence:.2f}), asking the LLM.")
+        return await self.route_with_llm(user_prompt)
+
+    def _get_decision_schema(self) -> Dict[str, Any]:
+        names = tuple(tool.name for tool in tool_registry.get_all_tools())
+        if self._decision_schema is None or names != self._decision_schema_tools:
+            schema = trim_schema(RouterDecision)
+            schema["properties"]["tool_name"]["enum"] = list(names)
+            self._decision_schema = schema
+            self._decision_schema_tools = names
+        return self._decision_schema
+
+    async def route_with_llm(self, user_prompt: str) -> str:
+        """LLM stage of the router (one network round-trip)."""
         # 1. Get available tools dynamically
         tools_description = tool_registry.get_descriptions_for_router()
 
-        # On demande à Pydantic : "Donne-moi le plan de la classe RouterDecision en JSON"
-        schema_dict = RouterDecision.model_json_schema()
-        
-        # On le convertit en une belle chaîne de caractères lisible
-        schema_str = json.dumps(schema_dict, indent=2)
+        schema_str = ROUTER_DECISION_SCHEMA
         
         # 2. Build System Prompt (Hardcoded here for safety, but could use PromptManager)
         system_prompt = (
@@ -58,11 +149,11 @@ class RouterService:
             HumanMessage(content=user_prompt)
         ]
         
-        response = self.llm.invoke(messages)
+        # Réponse contrainte par le schéma quand le fournisseur le permet (sinon le prompt suffit)
+        with metrics.stage("router_llm"):
+            response = await self.llm.ainvoke(messages, response_schema=self._get_decision_schema())
         
         # 4. Parse 
-        from src.utils.parser import parse_llm_output_to_model
-        
         try:
             decision = parse_llm_output_to_model(response.content, RouterDecision)
             log.info(f"Router Decision: {decision.tool_name} (Confidence: {decision.confidence})")
@@ -70,6 +161,7 @@ class RouterService:
             # Verify tool exists
             try:
                 tool_registry.get_tool(decision.tool_name)
+                self.stats.record_decision(decision.tool_name, "llm")
                 return decision.tool_name
             except ValueError:
                 log.error(f"Router hallucinated a tool name: {decision.tool_name}")
@@ -0,0 +1,114 @@
+"""
+Estimation locale (sans LLM) de la difficulté d'une demande de géométrie, pour
+choisir le modèle : « segment [AB] » n'a pas besoin du même modèle qu'une
+construction d'olympiade en 60 étapes.
+
+Le score additionne :
+  - la longueur du prompt (mots) ;
+  - le nombre d'objets nommés (points A, B', M1... et segments/droites [AB], (AB)) ;
+  - les constructions délicates (tangentes, cercles inscrits, transformations...).
+"""
+import logging
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+from src.utils.text import fold_accents, tokenize
+
+log = logging.getLogger(__name__)
+
+# Tiers dans l'ordre, du plus rapide au plus fort (l'escalade suit cet ordre)
+TIERS = ("fast", "standard", "strong")
+
+# Score minimal pour chaque tier au-delà du premier
+TIER_THRESHOLDS = {"standard": 3.0, "strong": 12.0}
+
+# Mots (sans accents, pluriels simples retirés) des constructions qui demandent du raisonnement
+HARD_KEYWORDS = {
+    "tangente": 2.0, "tangent": 2.0, "inscrit": 2.0, "inscribed": 2.0, "circonscrit": 1.5,
+    "circumscribed": 1.5, "rotation": 2.0, "homothetie": 2.5, "homothety": 2.5, "symetrique": 1.5,
+    "symmetry": 1.5, "reflection": 1.5, "translation": 1.5, "intersection": 1.5, "bissectrice": 1.5,
+    "bisector": 1.5, "orthocentre": 2.0, "orthocenter": 2.0, "projete": 1.5, "projection": 1.5,
+    "hauteur": 1.0, "altitude": 1.0, "mediane": 1.0, "median": 1.0, "mediatrice": 1.0,
+    "perpendicular": 1.0, "perpendiculaire": 1.0, "parallele": 1.0, "parallel": 1.0,
+    "ellipse": 1.5, "arc": 1.0, "secteur": 1.0, "sector": 1.0, "perspective": 3.0, "cube": 3.0,
+    "pave": 3.0, "cuboid": 3.0, "olympiade": 4.0, "demontre": 2.0, "prove": 2.0,
+}
+
+WORD_WEIGHT = 0.05          # Par mot du prompt
+ENTITY_WEIGHT = 0.5         # Par objet nommé distinct
+
+# Points (A, B', M1, O_2) et objets entre crochets/parenthèses ([AB], (CD))
+_POINT = re.compile(r"[A-Z](?:'|_?\d+)?")
+_UPPER_WORD = re.compile(r"\b[A-Z][A-Z0-9'_]*(?![a-z])")
+_BRACKETED = re.compile(r"[\[(]([A-Z][A-Z0-9']{1,3})[\])]")
+
+
+@dataclass(frozen=True)
+class ComplexityEstimate:
+    score: float
+    tier: str
+    reasons: Tuple[str, ...]
+
+
+def count_entities(prompt: str) -> int:
+    """Objets nommés distincts : points isolés ou groupés ('ABC' = 3 points), segments/droites."""
+    names = set(_BRACKETED.findall(prompt))
+    for word in _UPPER_WORD.findall(prompt):
+        names.update(_POINT.findall(word))
+    return len(names)
+
+
+def estimate_complexity(prompt: str) -> ComplexityEstimate:
+    words = tokenize(prompt)
+    entities = count_entities(fold_accents(prompt))
+    keywords = {}
+    for word in words:
+        stem = word[:-1] if len(word) > 3 and word.endswith("s") else word
+        if stem in HARD_KEYWORDS:
+            keywords[stem] = HARD_KEYWORDS[stem]
+
+    score = WORD_WEIGHT * len(prompt.split()) + ENTITY_WEIGHT * entities + sum(keywords.values())
+    tier = TIERS[0]
+    for name in TIERS[1:]:
+        if score >= TIER_THRESHOLDS[name]:
+            tier = name
+    reasons = (f"{len(prompt.split())} mots", f"{entities} objets", *sorted(keywords))
+    return ComplexityEstimate(score=round(score, 2), tier=tier, reasons=reasons)
+
+
+def next_tier(tier: str) -> str:
+    """Tier suivant pour l'escalade (le plus fort reste le plus fort)."""
+    index = TIERS.index(tier)
+    return TIERS[min(index + 1, len(TIERS) - 1)]
+
+
+class TierStats:
+    """Latence et taux de succès par tier, et nombre d'escalades."""
+    def __init__(self):
+        self.attempts: Dict[str, int] = defaultdict(int)
+        self.successes: Dict[str, int] = defaultdict(int)
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.escalations = 0
+
+    def record(self, tier: str, success: bool, started: float):
+        self.attempts[tier] += 1
+        self.successes[tier] += int(success)
+        self.seconds[tier] += time.perf_counter() - started
+        log.info(f"Tier '{tier}' {'succeeded' if success else 'failed'} "
+                 f"(success rate: {self.successes[tier]}/{self.attempts[tier]}, "
+                 f"mean latency: {self.seconds[tier] / self.attempts[tier]:.1f}s)")
+
+    def snapshot(self) -> Dict[str, Any]:
+        tiers: Dict[str, Any] = {}
+        for tier in TIERS:
+            attempts = self.attempts.get(tier, 0)
+            if attempts:
+                tiers[tier] = {
+                    "attempts": attempts,
+                    "success_rate": round(self.successes[tier] / attempts, 3),
+                    "mean_seconds": round(self.seconds[tier] / attempts, 2),
+                }
+        return {"tiers": tiers, "escalations": self.escalations}
@@ -0,0 +1,100 @@
+"""
+Contrôles numériques d'un plan déjà validé (sans LaTeX) : un plan peut passer
+`Geometry2DInput` et donner quand même une figure inutilisable (deux sommets au
+même endroit, triangle plat, point à 200 unités du cadre...).
+
+Seules les coordonnées connues sans moteur géométrique sont utilisées : points
+placés par coordonnées et milieux de points connus. Le reste n'est pas vérifié.
+"""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .models import Geometry2DInput
+
+EPSILON = 1e-6
+# Aire relative (aire / plus grand côté²) en dessous de laquelle une forme est plate
+FLAT_RATIO = 1e-3
+# Un point à plus de FRAME_MARGIN fois la taille du cadre en dehors de celui-ci est suspect
+FRAME_MARGIN = 1.0
+
+# Champs qui désignent des points devant former une forme non dégénérée
+# (2 points distincts, ou 3 points et plus non alignés)
+SHAPE_FIELDS = {
+    "through", "of_segment", "diameter_points", "to_line_from_points", "on_segment", "from_points",
+    "from_diagonal", "through_points", "triangle_points", "from_triangle_points", "point_ids",
+}
+# Étapes dont `point_ids` est une forme (ailleurs, c'est une simple liste de points à dessiner)
+SHAPE_POINT_IDS = {"draw_polygon"}
+
+Point = Tuple[float, float]
+
+
+def known_coordinates(plan: Geometry2DInput) -> Dict[str, Point]:
+    """Coordonnées calculables directement : points par coordonnées et milieux de points connus."""
+    coords: Dict[str, Point] = {}
+    for step in plan.construction_steps:
+        if step.type == "def_point_coords":
+            coords[step.id] = (float(step.coords[0]), float(step.coords[1]))
+        elif step.type == "def_midpoint" and all(p in coords for p in step.of_segment):
+            (ax, ay), (bx, by) = (coords[p] for p in step.of_segment)
+            coords[step.id] = ((ax + bx) / 2, (ay + by) / 2)
+    return coords
+
+
+def _relative_area(points: Sequence[Point]) -> float:
+    """Aire du polygone (formule du lacet) rapportée au carré de sa plus grande distance."""
+    area = abs(sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(points, [*points[1:], points[0]]))) / 2
+    span = max(math.dist(p, q) for p in points for q in points)
+    return area / (span * span) if span > EPSILON else 0.0
+
+
+def _shape_issue(ids: Sequence[str], coords: Dict[str, Point]) -> Optional[str]:
+    if len(set(ids)) < len(ids):
+        return f"points répétés {list(ids)}"
+    if not all(p in coords for p in ids):
+        return None
+    points = [coords[p] for p in ids]
+    if len(points) == 2:
+        return f"points confondus {list(ids)}" if math.dist(*points) < EPSILON else None
+    if _relative_area(points) < FLAT_RATIO:
+        return f"points alignés {list(ids)}"
+    return None
+
+
+def find_degeneracies(plan: Geometry2DInput) -> List[str]:
+    """Problèmes numériques du plan (liste vide si rien de suspect)."""
+    issues: List[str] = []
+    cfg = plan.figure_config
+    (xmin, xmax), (ymin, ymax) = cfg.x_range, cfg.y_range
+    if not (xmin < xmax and ymin < ymax):
+        issues.append(f"cadre vide ou inversé (x_range={list(cfg.x_range)}, y_range={list(cfg.y_range)})")
+
+    coords = known_coordinates(plan)
+    for point_id, (x, y) in coords.items():
+        if not (math.isfinite(x) and math.isfinite(y)):
+            issues.append(f"coordonnées non finies pour '{point_id}'")
+            continue
+        margin_x, margin_y = FRAME_MARGIN * abs(xmax - xmin), FRAME_MARGIN * abs(ymax - ymin)
+        if not (xmin - margin_x <= x <= xmax + margin_x and ymin - margin_y <= y <= ymax + margin_y):
+            issues.append(f"'{point_id}' ({x:g}, {y:g}) très loin du cadre")
+
+    # Deux points placés au même endroit par coordonnées
+    placed = [step for step in plan.construction_steps if step.type == "def_point_coords"]
+    seen: Dict[Point, str] = {}
+    for step in placed:
+        key = (round(step.coords[0], 6), round(step.coords[1], 6))
+        if key in seen:
+            issues.append(f"'{step.id}' et '{seen[key]}' placés au même endroit {key}")
+        seen.setdefault(key, step.id)
+
+    for number, step in enumerate(plan.construction_steps, start=1):
+        for field in SHAPE_FIELDS:
+            value = getattr(step, field, None)
+            if field == "point_ids" and step.type not in SHAPE_POINT_IDS:
+                continue
+            if not isinstance(value, (list, tuple)) or len(value) < 2 or not all(isinstance(v, str) for v in value):
+                continue
+            issue = _shape_issue(value, coords)
+            if issue:
+                issues.append(f"étape {number} ('{step.type}') : {issue}")
+    return issues
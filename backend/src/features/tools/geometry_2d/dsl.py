@@ -0,0 +1,351 @@
+"""
+Format compact (une ligne par étape) pour les plans de construction.
+
+Le JSON répète à chaque étape `"type": ...`, les noms de champs, les guillemets :
+les tokens de sortie dominent la latence du LLM. Ici :
+
+    FIG x_range=-1,12 y_range=-2,5
+    P A 0,0
+    P B 4,0
+    MID M A,B
+    SEG A,B;B,M style=color:red,thickness:thick
+    END
+
+- 1er mot : le `type` de l'étape (ou un alias court, `DSL_ALIASES`) ;
+- puis les champs obligatoires, dans l'ordre du modèle, séparés par des espaces ;
+- puis les champs optionnels en `nom=valeur` ;
+- listes : `A,B,C` ; listes de listes : `A,B;C,D` ; objets : `clé:valeur,clé:valeur` ;
+- une valeur avec espaces ou caractères spéciaux s'écrit en JSON (`"Mon texte"`, `{...}`, `[...]`).
+
+La grammaire est dérivée des modèles Pydantic (aucune table par brique à maintenir) et
+l'aller-retour `plan_to_dsl` / `parse_dsl` redonne le même `Geometry2DInput`.
+"""
+import json
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union, get_args, get_origin
+
+from pydantic import BaseModel
+
+from .models import FigureConfig, step_models
+
+# Alias des briques les plus fréquentes
+DSL_ALIASES = {
+    "P": "def_point_coords",
+    "MID": "def_midpoint",
+    "LINE": "def_line_by_points",
+    "SEG": "draw_segments",
+    "POLY": "draw_polygon",
+    "DOTS": "draw_points",
+    "LABELS": "label_points",
+    "LINES": "draw_lines",
+    "CIRCLES": "draw_circles",
+}
+_ALIAS_OF = {step_type: alias for alias, step_type in DSL_ALIASES.items()}
+
+FIGURE_KEYWORD = "FIG"
+END_KEYWORD = "END"
+
+# Sortes de champs : valeur simple, liste, liste de listes, objet (dict / sous-modèle)
+SCALAR, LIST, NESTED, OBJECT = "scalar", "list", "nested", "object"
+
+_KEYWORD_ARG = re.compile(r"^([a-z_][a-z0-9_]*)=(.*)$", re.DOTALL)
+_BARE_TOKEN = re.compile(r"^[^\s,;=:\"{}\[\]]+$")
+
+
+class DslError(ValueError):
+    """Ligne du format compact impossible à lire."""
+
+
+def _strip_optional(annotation: Any) -> Any:
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return _strip_optional(args[0])
+    return annotation
+
+
+def _is_sequence(annotation: Any) -> bool:
+    return get_origin(annotation) in (list, tuple, List, Tuple)
+
+
+def field_kind(annotation: Any) -> str:
+    annotation = _strip_optional(annotation)
+    origin = get_origin(annotation)
+    if _is_sequence(annotation):
+        items = [_strip_optional(arg) for arg in get_args(annotation) if arg is not Ellipsis]
+        if any(_is_sequence(item) for item in items):
+            return NESTED
+        if any(isinstance(item, type) and issubclass(item, BaseModel) for item in items):
+            return OBJECT  # Liste d'objets : JSON
+        return LIST
+    if origin is dict or (isinstance(annotation, type) and issubclass(annotation, (BaseModel, dict))):
+        return OBJECT
+    if origin is Literal:
+        return SCALAR
+    return SCALAR
+
+
+class DslSpec:
+    """Champs d'un modèle vus par le format compact : obligatoires (positionnels) et optionnels."""
+    def __init__(self, model: type, skip: Tuple[str, ...] = ("type",)):
+        self.model = model
+        self.required: List[Tuple[str, str]] = []
+        self.optional: Dict[str, str] = {}
+        for name, field in model.model_fields.items():
+            if name in skip:
+                continue
+            if field.is_required():
+                self.required.append((name, field_kind(field.annotation)))
+            else:
+                self.optional[name] = field_kind(field.annotation)
+
+    def kind(self, name: str) -> Optional[str]:
+        return dict(self.required).get(name) or self.optional.get(name)
+
+
+def step_specs() -> Dict[str, DslSpec]:
+    return _step_specs(step_models())
+
+
+@lru_cache(maxsize=None)
+def _step_specs(models: Tuple[type, ...]) -> Dict[str, DslSpec]:
+    # Clé = les modèles connus : une étape tierce enregistrée après coup recalcule la table
+    return {model.model_fields["type"].default: DslSpec(model) for model in models}
+
+
+@lru_cache(maxsize=None)
+def figure_spec() -> DslSpec:
+    return DslSpec(FigureConfig, skip=())
+
+
+# --- Écriture -------------------------------------------------------------------
+
+def _scalar(value: Any) -> Optional[str]:
+    """Valeur simple sous forme nue, ou None si elle doit passer par JSON."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, str) and _BARE_TOKEN.match(value):
+        return value
+    return None
+
+
+def encode_value(value: Any, kind: str) -> str:
+    if kind == SCALAR:
+        bare = _scalar(value)
+    elif kind == LIST and isinstance(value, list):
+        items = [_scalar(item) for item in value]
+        bare = ",".join(items) if value and None not in items else None
+    elif kind == NESTED and isinstance(value, list) and value and all(isinstance(item, list) and item for item in value):
+        rows = [[_scalar(item) for item in row] for row in value]
+        bare = ";".join(",".join(row) for row in rows) if all(None not in row for row in rows) else None
+    elif kind == OBJECT and isinstance(value, dict) and value:
+        pairs = [(_scalar(key), _scalar(item)) for key, item in value.items()]
+        bare = ",".join(f"{k}:{v}" for k, v in pairs) if all(None not in pair for pair in pairs) else None
+    else:
+        bare = None
+    return bare if bare is not None else json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _encode_line(keyword: str, spec: DslSpec, data: Dict[str, Any]) -> str:
+    parts = [keyword]
+    parts.extend(encode_value(data[name], kind) for name, kind in spec.required if name in data)
+    parts.extend(f"{name}={encode_value(data[name], kind)}" for name, kind in spec.optional.items() if name in data)
+    return " ".join(parts)
+
+
+def plan_to_dsl(plan: BaseModel) -> str:
+    """`Geometry2DInput` -> format compact (valeurs par défaut omises)."""
+    lines = []
+    figure = plan.figure_config.model_dump(mode="json", exclude_defaults=True)
+    if figure:
+        lines.append(_encode_line(FIGURE_KEYWORD, figure_spec(), figure))
+    for step in plan.construction_steps:
+        data = step.model_dump(mode="json", exclude_defaults=True)
+        lines.append(_encode_line(_ALIAS_OF.get(step.type, step.type), step_specs()[step.type], data))
+    lines.append(END_KEYWORD)
+    return "\n".join(lines)
+
+
+# --- Lecture --------------------------------------------------------------------
+
+def split_tokens(line: str) -> List[str]:
+    """Découpe sur les espaces, sauf dans une chaîne JSON ou entre crochets/accolades."""
+    tokens, current, depth, in_string, escaped = [], [], 0, False, False
+    for char in line:
+        if in_string:
+            current.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "[{":
+            depth += 1
+        elif char in "]}":
+            depth -= 1
+        elif char.isspace() and depth <= 0:
+            if current:
+                tokens.append("".join(current))
+                current = []
+            continue
+        current.append(char)
+    if in_string or depth > 0:
+        raise DslError("chaîne ou crochet non fermé")
+    if current:
+        tokens.append("".join(current))
+    return tokens
+
+
+def decode_value(token: str, kind: str) -> Any:
+    if token[:1] in ('"', "[", "{"):
+        try:
+            return json.loads(token)
+        except json.JSONDecodeError as e:
+            raise DslError(f"JSON invalide : {token}") from e
+    if kind == LIST:
+        return token.split(",")
+    if kind == NESTED:
+        return [row.split(",") for row in token.split(";")]
+    if kind == OBJECT:
+        pairs = [pair.split(":", 1) for pair in token.split(",")]
+        if any(len(pair) != 2 for pair in pairs):
+            raise DslError(f"objet attendu (clé:valeur,...) : {token}")
+        return dict(pairs)
+    return token  # Pydantic convertit '3.5', 'true'... selon le champ
+
+
+def _decode_args(tokens: List[str], spec: DslSpec, data: Dict[str, Any]) -> Dict[str, Any]:
+    positional = iter(spec.required)
+    for token in tokens:
+        match = _KEYWORD_ARG.match(token)
+        if match and spec.kind(match.group(1)):
+            name, value = match.groups()
+            data[name] = decode_value(value, spec.kind(name))
+            continue
+        field = next(positional, None)
+        if field is None:
+            raise DslError(f"valeur en trop : {token}")
+        data[field[0]] = decode_value(token, field[1])
+    return data
+
+
+def parse_step_line(line: str) -> Dict[str, Any]:
+    """Une ligne -> dict d'étape (non validé : Pydantic signalera les champs manquants)."""
+    tokens = split_tokens(line)
+    step_type = DSL_ALIASES.get(tokens[0], tokens[0])
+    spec = step_specs().get(step_type)
+    if spec is None:
+        raise DslError(f"type d'étape inconnu : {tokens[0]}")
+    return _decode_args(tokens[1:], spec, {"type": step_type})
+
+
+def parse_dsl_line(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Étape lue sur une ligne (None pour les lignes vides, clôtures de code, FIG, END).
+    Une ligne illisible devient une étape `{"type", "dsl_line", "dsl_error"}` :
+    la validation la rejette et la boucle de réparation la voit telle quelle.
+    """
+    line = line.strip()
+    if not line or line.startswith(("```", "#")) or line == END_KEYWORD or line.split(" ", 1)[0] == FIGURE_KEYWORD:
+        return None
+    try:
+        return parse_step_line(line)
+    except DslError as e:
+        return {"type": line.split(" ", 1)[0], "dsl_line": line, "dsl_error": str(e)}
+
+
+def parse_dsl(text: str) -> Dict[str, Any]:
+    """Format compact -> dict `Geometry2DInput` (à valider ensuite)."""
+    document: Dict[str, Any] = {"construction_steps": []}
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped == END_KEYWORD:
+            break
+        if stripped.split(" ", 1)[0] == FIGURE_KEYWORD:
+            try:
+                document["figure_config"] = _decode_args(split_tokens(stripped)[1:], figure_spec(), {})
+            except DslError:
+                pass  # Cadre par défaut plutôt qu'un échec
+            continue
+        step = parse_dsl_line(stripped)
+        if step is not None:
+            document["construction_steps"].append(step)
+    return document
+
+
+class StreamingDslParser:
+    """
+    Pendant de `StreamingArrayParser` pour le format compact : renvoie chaque étape
+    dès que sa ligne est complète, et `closed` passe à True à la ligne END.
+    """
+    def __init__(self):
+        self.text = ""
+        self.closed = False
+        self._line_start = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        if self.closed:
+            return []
+        self.text += chunk
+        steps = []
+        while True:
+            end = self.text.find("\n", self._line_start)
+            if end < 0:
+                break
+            line = self.text[self._line_start:end].strip()
+            self._line_start = end + 1
+            if line == END_KEYWORD:
+                self.closed = True
+                self.text = self.text[:end]
+                break
+            step = parse_dsl_line(line)
+            if step is not None and "dsl_error" not in step:
+                steps.append(step)
+        return steps
+
+    @property
+    def document(self) -> str:
+        return self.text
+
+
+# --- Documentation pour le LLM -------------------------------------------------------
+
+def _signature(keyword: str, spec: DslSpec) -> str:
+    parts = [keyword]
+    parts.extend(f"<{name}{'' if kind == SCALAR else ':' + kind}>" for name, kind in spec.required)
+    parts.extend(f"[{name}=]" for name in spec.optional)
+    return " ".join(parts)
+
+
+def dsl_reference(step_types: Optional[List[str]] = None) -> str:
+    """Grammaire du format compact + signature des briques demandées (toutes par défaut)."""
+    specs = step_specs()
+    names = [name for name in specs if step_types is None or name in step_types]
+    signatures = "\n".join(
+        _signature(_ALIAS_OF.get(name, name), specs[name]) + (f"   (= {name})" if name in _ALIAS_OF else "")
+        for name in names
+    )
+    return (
+        "### OUTPUT FORMAT: COMPACT PLAN (overrides the JSON output format)\n"
+        "Write the plan as one step per line instead of JSON, then a last line `END`. No Markdown, no comments.\n"
+        "- First word: the step `type` (or its short alias). Then the REQUIRED fields, in the order below, "
+        "separated by spaces. Then the optional fields as `name=value`.\n"
+        "- list: `A,B,C` | list of lists: `A,B;C,D` | object: `key:value,key:value` | "
+        'text with spaces or special characters: JSON (`"Le point $A$"`, `{...}`, `[...]`).\n'
+        f"- Optional first line for the frame: {_signature(FIGURE_KEYWORD, figure_spec())}\n"
+        "Example:\n"
+        "FIG x_range=-1,6 y_range=-1,5\n"
+        "P A 0,0\nP B 4,0\nP C 1,3\nMID M A,B\n"
+        "POLY A,B,C style=color:blue\nSEG C,M style=pattern:dashed\nDOTS A,B,C,M\nLABELS point_ids=A,B,C,M\nEND\n\n"
+        "Step signatures (same fields as in the JSON reference):\n"
+        f"{signatures}"
+    )
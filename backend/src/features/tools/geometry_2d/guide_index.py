@@ -0,0 +1,216 @@
+"""
+Découpage de `guide.md` en sections et sélection de celles utiles à un prompt.
+
+Le guide entier (~20k tokens) partait dans chaque appel LLM, même pour « trace le
+segment [AB] ». Ici on l'indexe une fois par version du fichier :
+  - les sections « cœur » (mission, structure, règle d'or, style) sont toujours envoyées,
+    et ne changent pas d'un prompt à l'autre (préfixe cachable côté fournisseur) ;
+  - chaque brique (`#### \`def_midpoint\``) et chaque exemple devient une section
+    récupérable, notée par BM25 contre le prompt utilisateur ;
+  - on garde les meilleures dans un budget de tokens, avec l'intro de leur groupe
+    (3.2, 3.10...), et on les recolle dans l'ordre du guide.
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, get_args
+
+from src.utils.bm25 import BM25Index
+from src.utils.text import tokenize
+
+from .models import ConstructionStep
+
+log = logging.getLogger(__name__)
+
+STEP_TYPES = frozenset(model.model_fields["type"].default for model in get_args(ConstructionStep))
+
+# Briques présentes dans presque toutes les figures : toujours envoyées.
+ALWAYS_ON_STEPS = ("def_point_coords", "draw_points", "label_points", "draw_segments", "draw_polygon")
+
+# Définitions invisibles sans leur brique de dessin : on documente les deux ensemble.
+COMPANION_STEPS = {
+    **{name: ("draw_lines",) for name in (
+        "def_line_by_points", "def_parallel_line", "def_perpendicular_line", "def_mediator",
+        "def_angle_bisector", "def_tangent_at_point", "def_tangents_from_point")},
+    **{name: ("draw_circles",) for name in STEP_TYPES if name.startswith("def_circle")},
+    "def_projection_point": ("mark_right_angle",),
+}
+
+# Une section retenue doit peser au moins cette fraction du meilleur score.
+MIN_RELATIVE_SCORE = 0.3
+
+_H2 = re.compile(r"^## ")
+_GROUP = re.compile(r"^### \*\*3\.\d+\.")
+_EXAMPLE = re.compile(r"^### \*\*Exemple")
+_H4 = re.compile(r"^(\*\s+)?#### ")
+_CODE_NAME = re.compile(r"`([a-zA-Z0-9_]+)`")
+
+
+def guide_terms(text: str) -> List[str]:
+    """Mots du texte, pluriels simples retirés ('cercles' -> 'cercle', 'points' -> 'point')."""
+    return [word[:-1] if len(word) > 3 and word.endswith("s") else word for word in tokenize(text)]
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimation grossière (≈ 4 caractères par token), suffisante pour un budget."""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class GuideSection:
+    """Un morceau contigu du guide."""
+    title: str
+    kind: str                                  # 'core' | 'group' | 'step' | 'example'
+    group: Optional[int] = None                # Index de la section d'intro du groupe
+    step_types: Tuple[str, ...] = ()
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+
+def split_guide(content: str) -> List[GuideSection]:
+    """Découpe le guide selon ses titres (voir la docstring du module)."""
+    sections = [GuideSection(title="preamble", kind="core")]
+    group_index: Optional[int] = None
+    in_dictionary = False  # Entre le titre 3 et la section 4
+
+    def start(title: str, kind: str, group: Optional[int] = None, step_types: Tuple[str, ...] = ()):
+        sections.append(GuideSection(title=title, kind=kind, group=group, step_types=step_types))
+
+    for line in content.splitlines():
+        if _H2.match(line):
+            in_dictionary = False
+            if line.startswith("## 6"):
+                start(line, "group")  # Intro des exemples
+                group_index = len(sections) - 1
+            else:
+                start(line, "core")
+                group_index = None
+        elif line.startswith("### **3. "):
+            in_dictionary = True
+            start(line, "core")
+        elif _GROUP.match(line):
+            start(line, "group")
+            group_index = len(sections) - 1
+        elif _EXAMPLE.match(line):
+            start(line, "example", group=group_index)
+        elif _H4.match(line) and in_dictionary:
+            names = tuple(name for name in _CODE_NAME.findall(line) if name in STEP_TYPES)
+            if names:
+                start(line, "step", group=group_index, step_types=names)
+            else:
+                # Sous-partie de 3.10 (« Les Calculs de Mesures »...) : nouvelle intro de groupe
+                start(line, "group")
+                group_index = len(sections) - 1
+        else:
+            sections[-1].lines.append(line)
+            continue
+        sections[-1].lines.append(line)
+    return sections
+
+
+class GuideRetriever:
+    """
+    Index BM25 des briques et exemples d'une version donnée du guide.
+    `core` contient les sections toujours envoyées, identiques pour tous les prompts.
+    """
+
+    def __init__(self, content: str):
+        self.content = content
+        self.sections = split_guide(content)
+        self.candidates = [i for i, s in enumerate(self.sections) if s.kind in ("step", "example")]
+        documents = []
+        for i in self.candidates:
+            section = self.sections[i]
+            # Le nom de la brique compte aussi : `def_circle_inscribed` -> circle, inscribed
+            type_words = " ".join(name.replace("_", " ") for name in section.step_types)
+            documents.append(guide_terms(f"{type_words} {section.text}"))
+        self.index = BM25Index(documents)
+        self.full_tokens = estimate_tokens(content)
+        self.core = "\n".join(s.text for s in self.sections if s.kind == "core")
+        self.section_by_step = {name: i for i, s in enumerate(self.sections) for name in s.step_types}
+
+    def rank(self, prompt: str) -> List[Tuple[int, float]]:
+        """(index de section, score) des sections récupérables, du plus au moins pertinent."""
+        scores = self.index.scores(guide_terms(prompt))
+        return sorted(zip(self.candidates, scores), key=lambda item: item[1], reverse=True)
+
+    def select(self, prompt: str, token_budget: int) -> List[int]:
+        """
+        Index (dans l'ordre du guide) des sections hors cœur à envoyer pour ce prompt :
+        briques toujours utiles + meilleures briques/exemples dans `token_budget`.
+        """
+        chosen = set()
+        for i, section in enumerate(self.sections):
+            if section.kind == "step" and set(section.step_types) & set(ALWAYS_ON_STEPS):
+                chosen.add(i)
+                if section.group is not None:
+                    chosen.add(section.group)
+        used = sum(estimate_tokens(self.sections[i].text) for i in chosen)
+
+        ranked = self.rank(prompt)
+        best = ranked[0][1] if ranked else 0.0
+        for index, score in ranked:
+            if score <= 0 or score < best * MIN_RELATIVE_SCORE:
+                break
+            if index in chosen:
+                continue
+            section = self.sections[index]
+            extra = [index]
+            for name in section.step_types:
+                extra.extend(self.section_by_step[companion] for companion in COMPANION_STEPS.get(name, ())
+                             if companion in self.section_by_step)
+            for i in list(extra):
+                group = self.sections[i].group
+                if group is not None and group not in extra:
+                    extra.append(group)
+            extra = [i for i in extra if i not in chosen]
+            cost = sum(estimate_tokens(self.sections[i].text) for i in extra)
+            if used + cost > token_budget:
+                continue  # Une section plus courte peut encore tenir
+            chosen.update(extra)
+            used += cost
+        return sorted(chosen)
+
+    def build_excerpt(self, prompt: str, token_budget: int) -> str:
+        """Briques et exemples du guide utiles pour ce prompt (sans les sections cœur)."""
+        selected = self.select(prompt, token_budget)
+        excerpt = "\n".join(self.sections[i].text for i in selected)
+        log.info(f"Guide réduit à {len(selected)}/{len(self.sections)} sections "
+                 f"(~{estimate_tokens(self.core) + estimate_tokens(excerpt)}/{self.full_tokens} tokens).")
+        return excerpt
+
+    def build_step_reference(self, step_types: List[str], query: str, token_budget: int) -> str:
+        """
+        Doc des briques nommées (avec l'intro de leur groupe), pour la réparation d'étapes.
+        Un type inconnu (inventé par le LLM) est remplacé par les sections proches de `query`.
+        """
+        chosen = set()
+        for name in step_types:
+            index = self.section_by_step.get(name)
+            if index is None:
+                chosen.update(self.select(query, token_budget))
+                continue
+            chosen.add(index)
+            if self.sections[index].group is not None:
+                chosen.add(self.sections[index].group)
+        return "\n".join(self.sections[i].text for i in sorted(chosen))
+
+    def selected_step_types(self, prompt: str, token_budget: int) -> List[str]:
+        """Briques documentées dans l'extrait (pour le contrôle de précision)."""
+        return [name for i in self.select(prompt, token_budget) for name in self.sections[i].step_types]
+
+
+# Un index par contenu du guide (le PromptManager renvoie la même chaîne tant que le fichier ne change pas)
+_retrievers: Dict[int, GuideRetriever] = {}
+
+
+def get_guide_retriever(content: str) -> GuideRetriever:
+    retriever = _retrievers.get(id(content))
+    if retriever is None or retriever.content is not content:
+        _retrievers.clear()
+        retriever = GuideRetriever(content)
+        _retrievers[id(content)] = retriever
+    return retriever
@@ -1,7 +1,12 @@
 # backend/src/features/geometry/models.py
 
-from pydantic import BaseModel, Field, model_validator, field_validator, conint
-from typing import List, Dict, Literal, Optional, Tuple, Union, Annotated
+import heapq
+import logging
+
+from pydantic import BaseModel, Field, ValidationInfo, model_validator, field_validator, conint
+from typing import Any, ClassVar, List, Dict, Literal, Optional, Tuple, Union, Annotated, get_args, get_origin
+
+log = logging.getLogger(__name__)
 
 # ==============================================================================
 #  MODÈLES DE SUPPORT (Version minimale pour le Sprint 1)
@@ -25,6 +30,109 @@ class Style(BaseModel):
     fill_color: Optional[str] = Field(None, description="Couleur de remplissage pour les surfaces (cercles, polygones).")
     opacity: Optional[float] = Field(None, description="Opacité du remplissage (de 0.0 à 1.0).")
     
+# ==============================================================================
+#  RÔLES DES CHAMPS D'UNE ÉTAPE (création / référence d'IDs)
+# ==============================================================================
+
+# Champs qui créent toujours des IDs
+ALWAYS_CREATION_KEYS = {'id', 'ids', 'tangency_point_id', 'tangency_point_ids',
+                        'line_id', 'new_ids', 'point_on_line_id', 'point_on_line_ids'}
+
+# Liste des champs de données pures (pas des IDs)
+DATA_KEYS = {'type', 'style', 'label', 'text', 'unit', 'color', 
+             'thickness', 'pattern', 'fill_color', 'position',
+             'radius', 'semi_major_axis', 'semi_minor_axis', 'angle',
+             'start_angle', 'end_angle', 'arrow_spec', 'triangle_type',
+             'center_type', 'on_segments','num_sides', 'build_method',
+             'name_prefix', 'base_points', 'derived_points',
+             'base_origin', 'base_width', 'base_height', 'depth_vector'
+             }
+
+# Rôles possibles d'un champ vis-à-vis des IDs
+ROLE_CREATE = "create"          # str ou liste de str : nouveaux IDs
+ROLE_REFERENCE = "reference"    # str, liste de str ou liste de paires : IDs utilisés
+ROLE_REFERENCE_KEYS = "keys"    # dict dont les CLÉS sont des IDs utilisés (custom_labels)
+ROLE_CIRCLE_DEF = "circle_def"  # CircleDefForIntersection : le centre (et le point) sont utilisés
+
+
+def _annotation_has_str(annotation: Any) -> bool:
+    """Vrai si l'annotation peut porter des chaînes (str, Literal[...], Tuple[str, ...], List[...])."""
+    if annotation is str:
+        return True
+    if get_origin(annotation) is Literal:
+        return any(isinstance(arg, str) for arg in get_args(annotation))
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return False
+    return any(_annotation_has_str(arg) for arg in get_args(annotation))
+
+
+class ConstructionStepModel(BaseModel):
+    """
+    Base de toutes les étapes de construction.
+    À la création de chaque classe, on calcule UNE FOIS le rôle de ses champs
+    (créent des IDs / en référencent / données pures), ce qui permet au validateur
+    de lire directement les attributs sans `model_dump`.
+    """
+    # Champs qui créent des IDs en plus de ALWAYS_CREATION_KEYS (à déclarer par classe).
+    id_creation_fields: ClassVar[Tuple[str, ...]] = ()
+    # Calculé par __pydantic_init_subclass__ : ((nom_du_champ, rôle), ...)
+    id_field_roles: ClassVar[Tuple[Tuple[str, str], ...]] = ()
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any) -> None:
+        super().__pydantic_init_subclass__(**kwargs)
+        roles = []
+        for name, field in cls.model_fields.items():
+            if name in ALWAYS_CREATION_KEYS or name in cls.id_creation_fields:
+                roles.append((name, ROLE_CREATE))
+            elif name in DATA_KEYS:
+                continue
+            elif name == 'custom_labels':
+                roles.append((name, ROLE_REFERENCE_KEYS))
+            elif name == 'circle_def':
+                roles.append((name, ROLE_CIRCLE_DEF))
+            elif _annotation_has_str(field.annotation):
+                roles.append((name, ROLE_REFERENCE))
+        cls.id_field_roles = tuple(roles)
+
+    def implicit_created_ids(self) -> List[str]:
+        """IDs créés sans apparaître dans un champ (ex: sommets d'un polygone régulier)."""
+        return []
+
+    def collect_ids(self) -> Tuple[List[str], List[str]]:
+        """Retourne `(ids_créés, ids_référencés)` en lisant les champs selon leur rôle."""
+        created: List[str] = []
+        referenced: List[str] = []
+        for name, role in self.id_field_roles:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            if role == ROLE_CREATE:
+                if isinstance(value, (list, tuple)):
+                    created.extend(value)
+                else:
+                    created.append(value)
+            elif role == ROLE_REFERENCE:
+                if isinstance(value, str):
+                    referenced.append(value)
+                elif isinstance(value, (list, tuple)):
+                    # Gérer les listes de listes comme pour les segments
+                    if value and isinstance(value[0], (list, tuple)):
+                        for sub_list in value:
+                            referenced.extend([item for item in sub_list if isinstance(item, str)])
+                    else:
+                        referenced.extend([item for item in value if isinstance(item, str)])
+            elif role == ROLE_REFERENCE_KEYS:
+                referenced.extend(value.keys())
+            elif role == ROLE_CIRCLE_DEF:
+                if value.by_center_point:
+                    referenced.extend(value.by_center_point)
+                if value.by_center_radius:
+                    # Le rayon est un float, on ne prend que la chaîne (le centre)
+                    referenced.extend([item for item in value.by_center_radius if isinstance(item, str)])
+        created.extend(self.implicit_created_ids())
+        return created, referenced
+
 # ==============================================================================
 #  MODÈLES D'ÉTAPES DE CONSTRUCTION (Version minimale pour le Sprint 1)
 # ==============================================================================
@@ -33,14 +141,14 @@ class Style(BaseModel):
 #  ÉTAPES DE CONSTRUCTION : Une Grammaire Complète pour les Points et Lignes
 # ==============================================================================
 # --- ACTIONS DE DÉFINITION DE POINTS ---
-class DefinePointByCoords(BaseModel):
+class DefinePointByCoords(ConstructionStepModel):
     type: Literal["def_point_coords"] = "def_point_coords"
     id: str
     coords: Tuple[float, float]
     label: Optional[str] = None
     style: Style = Field(default_factory=Style)
 
-class DefineMidPoint(BaseModel):
+class DefineMidPoint(ConstructionStepModel):
     type: Literal["def_midpoint"] = "def_midpoint"
     id: str
     of_segment: Tuple[str, str] # (id_point_A, id_point_B)
@@ -48,24 +156,24 @@ class DefineMidPoint(BaseModel):
     style: Style = Field(default_factory=Style)
 
 # --- ACTIONS DE DÉFINITION DE LIGNES ---
-class DefineLineByPoints(BaseModel):
+class DefineLineByPoints(ConstructionStepModel):
     type: Literal["def_line_by_points"] = "def_line_by_points"
     id: str # L'ID de cette nouvelle ligne (ex: "d1")
     through: Tuple[str, str] # (id_point_A, id_point_B)
 
 
-class DefineMediator(BaseModel):
+class DefineMediator(ConstructionStepModel):
     type: Literal["def_mediator"] = "def_mediator"
     id: str
     of_segment: Tuple[str, str]
 
-class DefineProjectionPoint(BaseModel):
+class DefineProjectionPoint(ConstructionStepModel):
     type: Literal["def_projection_point"] = "def_projection_point"
     id: str
     from_point: str
     on_line: str # l'ID de la ligne
 
-class DefineParallelLine(BaseModel):
+class DefineParallelLine(ConstructionStepModel):
     """
     Définit une nouvelle ligne qui est parallèle à une autre.
     Cette action est une définition pure ; pour la rendre visible, utilisez DrawLines.
@@ -77,7 +185,7 @@ class DefineParallelLine(BaseModel):
     through_point: str               # L'ID du point par lequel elle passe.
     to_line_from_points: Tuple[str, str] # Tuple des ID des deux points définissant la droite de référence.
 
-class DefinePerpendicularLine(BaseModel):
+class DefinePerpendicularLine(ConstructionStepModel):
     """
     Définit une nouvelle ligne qui est perpendiculaire à une autre.
     Cette action est une définition pure ; pour la rendre visible, utilisez DrawLines.
@@ -96,7 +204,7 @@ class DefinePerpendicularLine(BaseModel):
 
 # --- ACTIONS DE DÉFINITION DE CERCLES ---
 
-class DefineCircleByCenterPoint(BaseModel):
+class DefineCircleByCenterPoint(ConstructionStepModel):
     """
     DÉFINIT un cercle à partir de son centre et d'un point par lequel il passe.
     Cette action est une définition logique, elle ne dessine rien.
@@ -107,7 +215,7 @@ class DefineCircleByCenterPoint(BaseModel):
     center: str = Field(..., description="ID du point qui est le centre du cercle.")
     through_point: str = Field(..., description="ID du point situé sur la circonférence du cercle.")
 
-class DefineCircleByCenterRadius(BaseModel):
+class DefineCircleByCenterRadius(ConstructionStepModel):
     """
     DÉFINIT un cercle à partir de son centre et d'un rayon numérique.
     Cette action est une définition logique et gère la complexité de stocker
@@ -119,7 +227,7 @@ class DefineCircleByCenterRadius(BaseModel):
     center: str = Field(..., description="ID du point qui est le centre du cercle.")
     radius: float = Field(..., gt=0, description="Valeur numérique du rayon (doit être > 0).")
 
-class DefineCircleByDiameter(BaseModel):
+class DefineCircleByDiameter(ConstructionStepModel):
     """
     DÉFINIT un cercle à partir de deux points formant son diamètre.
     Cette action est une définition logique, elle ne dessine rien.
@@ -129,7 +237,7 @@ class DefineCircleByDiameter(BaseModel):
     id: str = Field(..., description="ID unique pour ce nouveau cercle (ex: 'c_diam').")
     diameter_points: Tuple[str, str] = Field(..., description="Tuple des ID des deux points formant le diamètre.")
 
-class DefineCircleCircumscribed(BaseModel):
+class DefineCircleCircumscribed(ConstructionStepModel):
     """
     DÉFINIT le cercle circonscrit à un triangle (passant par 3 points).
     Cette action est une définition logique, elle ne dessine rien.
@@ -139,7 +247,7 @@ class DefineCircleCircumscribed(BaseModel):
     id: str = Field(..., description="ID unique pour ce nouveau cercle (ex: 'c_circum').")
     through_points: Tuple[str, str, str] = Field(..., description="Tuple des ID des trois points par lesquels le cercle doit passer.")
 
-class DefineCircleInscribed(BaseModel):
+class DefineCircleInscribed(ConstructionStepModel):
     """
     DÉFINIT le cercle inscrit dans un triangle (tangent aux 3 côtés).
     Cette action est une définition logique, elle ne dessine rien.
@@ -157,7 +265,7 @@ class DefineCircleInscribed(BaseModel):
 
 # --- MODÈLE n°1 : Intersection de deux Droites ---
 
-class FindIntersectionLineLine(BaseModel):
+class FindIntersectionLineLine(ConstructionStepModel):
     """
     CALCULE et nomme le point d'intersection de deux droites.
     Chaque droite est définie par deux de ses points.
@@ -196,7 +304,7 @@ class CircleDefForIntersection(BaseModel):
 
 # --- MODÈLE n°2 : Intersection d'une Droite et d'un Cercle ---
 
-class FindIntersectionLineCircle(BaseModel):
+class FindIntersectionLineCircle(ConstructionStepModel):
     """
     CALCULE et nomme les deux points d'intersection (potentiels) d'une droite et d'un cercle.
     Même s'il n'y a qu'une ou zéro intersection, deux IDs doivent être fournis.
@@ -210,7 +318,7 @@ class FindIntersectionLineCircle(BaseModel):
 
 # --- MODÈLE n°3 : Intersection de deux Cercles ---
 
-class FindIntersectionCircleCircle(BaseModel):
+class FindIntersectionCircleCircle(ConstructionStepModel):
     """
     CALCULE et nomme les deux points d'intersection (potentiels) de deux cercles.
     Correspond à la commande LaTeX : \\tkzInterCC(cercle1)(cercle2)
@@ -225,7 +333,7 @@ class FindIntersectionCircleCircle(BaseModel):
 #                 MODÈLES DE CALCUL DE LIGNES TANGENTES AUX CERCLES
 # ==============================================================================
 
-class DefineTangentAtPointOnCircle(BaseModel):
+class DefineTangentAtPointOnCircle(ConstructionStepModel):
     """
     CALCULE la ligne tangente à un cercle en un point situé SUR ce cercle.
     Cette action définit logiquement la ligne ; elle doit être dessinée avec DrawLines.
@@ -237,12 +345,13 @@ class DefineTangentAtPointOnCircle(BaseModel):
     circle_center_id: str = Field(..., description="ID du centre du cercle.")
 
 
-class DefineTangentsFromPointToCircle(BaseModel):
+class DefineTangentsFromPointToCircle(ConstructionStepModel):
     """
     CALCULE les deux lignes tangentes issues d'un point extérieur à un cercle.
     Cette action définit DEUX nouvelles lignes et DEUX nouveaux points (les points de tangence).
     """
     type: Literal["def_tangents_from_point"] = "def_tangents_from_point"
+    id_creation_fields: ClassVar[Tuple[str, ...]] = ('line_ids',)
     # Les ID pour les objets que cette action va créer :
     line_ids: Tuple[str, str] = Field(..., description="Tuple des IDs des deux nouvelles lignes tangentes.")
     tangency_point_ids: Tuple[str, str] = Field(..., description="Tuple des IDs des deux nouveaux points de tangence qui seront calculés.")
@@ -254,23 +363,23 @@ class DefineTangentsFromPointToCircle(BaseModel):
 
 
 # --- ACTIONS DE DESSIN ---
-class DrawPoints(BaseModel):
+class DrawPoints(ConstructionStepModel):
     type: Literal["draw_points"] = "draw_points"
     point_ids: List[str]
     style: Style = Field(default_factory=Style)
 
-class DrawSegments(BaseModel): # Peut dessiner un ou plusieurs segments
+class DrawSegments(ConstructionStepModel): # Peut dessiner un ou plusieurs segments
     type: Literal["draw_segments"] = "draw_segments"
     segments: List[Tuple[str, str]] # ex: [["A","B"], ["B","C"]]
     arrow_spec: Optional[str] = Field(None, description="Spécification pour les flèches (ex: '->', '<->').")
     style: Style = Field(default_factory=Style)
     
-class DrawLines(BaseModel): # Peut dessiner une ou plusieurs lignes
+class DrawLines(ConstructionStepModel): # Peut dessiner une ou plusieurs lignes
     type: Literal["draw_lines"] = "draw_lines"
     line_ids: List[str] # ex: ["d1", "mediatrice_AB"]
     style: Style = Field(default_factory=Style)
 
-class CalculateLength(BaseModel):
+class CalculateLength(ConstructionStepModel):
     """
     CALCULE la distance entre deux points et stocke le résultat
     dans une macro LaTeX nommée.
@@ -286,7 +395,7 @@ class CalculateLength(BaseModel):
             raise ValueError("Les deux points pour un calcul de longueur doivent être distincts.")
         return v
 
-class DrawVector(BaseModel):
+class DrawVector(ConstructionStepModel):
     """
     [ACTION SÉMANTIQUE] DESSINE un vecteur d'un point de départ à un point d'arrivée.
     Ceci est un raccourci qui utilise en interne la commande DrawSegment avec une option de flèche.
@@ -296,7 +405,7 @@ class DrawVector(BaseModel):
     end_point_id: str = Field(..., description="ID du point de destination du vecteur.")
     style: Optional[Style] = Field(default_factory=Style)
 
-class DrawVectorByLength(BaseModel):
+class DrawVectorByLength(ConstructionStepModel):
     """
     [ACTION SÉMANTIQUE] DESSINE un vecteur d'un point de départ, dans la direction
     d'un autre point, mais avec une longueur spécifiée.
@@ -308,13 +417,13 @@ class DrawVectorByLength(BaseModel):
     style: Optional[Style] = Field(default_factory=Style)
 
 
-class DrawPolygon(BaseModel): # Remplaçons la syntaxe confuse de DrawSegments
+class DrawPolygon(ConstructionStepModel): # Remplaçons la syntaxe confuse de DrawSegments
     type: Literal["draw_polygon"] = "draw_polygon"
     point_ids: List[str] # ["A", "B", "C"] pour dessiner les côtés du triangle ABC
     style: Style = Field(default_factory=Style)
 
 
-class DefineRegularPolygon(BaseModel):
+class DefineRegularPolygon(ConstructionStepModel):
     """
     DÉFINIT les sommets d'un polygone régulier. Ne dessine rien.
     Les points créés sont nommés en utilisant un préfixe.
@@ -332,6 +441,12 @@ class DefineRegularPolygon(BaseModel):
     num_sides: Annotated[int, Field(gt=2)] = Field(..., description="Le nombre total de côtés du polygone.")
     
     build_method: Literal["side", "center"] = Field("side", description="Méthode de construction : 'side' ou 'center'.")
+
+    def implicit_created_ids(self) -> List[str]:
+        # On génère la liste des noms que LaTeX va créer (P1, P2, P3...)
+        if not self.name_prefix:
+            return []
+        return [f"{self.name_prefix}{k+1}" for k in range(self.num_sides)]
     
 
 
@@ -342,7 +457,7 @@ class MarkStyle(BaseModel):
     pos: Optional[float] = Field(0.5, description="Position de la marque le long du segment (de 0.0 à 1.0).")
     color: Optional[str] = None
     size: Optional[str] = Field(None, description="Taille de la marque, incluant l'unité (ex: '6pt').")
-class MarkSegments(BaseModel):
+class MarkSegments(ConstructionStepModel):
     """
     DESSINE une marque visuelle sur un ou plusieurs segments.
     Principalement utilisé pour indiquer des longueurs égales.
@@ -352,14 +467,14 @@ class MarkSegments(BaseModel):
     on_segments: List[Tuple[str, str]] = Field(..., description="Liste des segments à marquer. Ex: [['A','B'], ['C','D']]")
     style: MarkStyle
 
-class MarkRightAngle(BaseModel):
+class MarkRightAngle(ConstructionStepModel):
     type: Literal["mark_right_angle"] = "mark_right_angle"
     vertex: str
     points: Tuple[str, str]
 
 # --- ACTION DE DESSIN DE CERCLES ---
 
-class DrawCircles(BaseModel):
+class DrawCircles(ConstructionStepModel):
     """
     DESSINE un ou plusieurs cercles qui ont déjà été définis.
     Utilise la convention centre/point_sur_le_cercle récupérée lors de la définition.
@@ -369,7 +484,7 @@ class DrawCircles(BaseModel):
     circle_ids: List[str] = Field(..., description="Liste des ID des cercles à dessiner.")
     style: Style = Field(default_factory=Style, description="Style de tracé appliqué aux cercles.")
 
-class LabelCircle(BaseModel):
+class LabelCircle(ConstructionStepModel):
     """
     Place une étiquette sur un cercle.
     Le cercle est défini par son centre et un point dessus.
@@ -385,7 +500,7 @@ class LabelCircle(BaseModel):
 #                 MODÈLES DE DESSIN : ELLIPSES ET DEMI-CERCLES
 # ==============================================================================
 
-class DrawEllipse(BaseModel):
+class DrawEllipse(ConstructionStepModel):
     """
     DESSINE une ellipse à partir de son centre, ses axes et son angle.
     Correspond à la commande LaTeX : \\tkzDrawEllipse(centre, axe_a, axe_b, angle)
@@ -398,7 +513,7 @@ class DrawEllipse(BaseModel):
     style: Style = Field(default_factory=Style)
 
 
-class DrawSemiCircles(BaseModel):
+class DrawSemiCircles(ConstructionStepModel):
     """
     DESSINE un ou plusieurs demi-cercles. Chaque demi-cercle est défini
     par un centre et un point sur sa circonférence.
@@ -413,7 +528,7 @@ class DrawSemiCircles(BaseModel):
 #                      MODÈLES DE DESSIN : ARCS DE CERCLE
 # ==============================================================================
 
-class DrawArcByPoints(BaseModel):
+class DrawArcByPoints(ConstructionStepModel):
     """
     DESSINE un arc de cercle défini par son centre et deux points (départ et arrivée).
     Correspond à la syntaxe : \\tkzDrawArc(centre,depart)(arrivee)
@@ -426,7 +541,7 @@ class DrawArcByPoints(BaseModel):
     style: Style = Field(default_factory=Style)
 
 
-class DrawArcByAngles(BaseModel):
+class DrawArcByAngles(ConstructionStepModel):
     """
     DESSINE un arc de cercle défini par son centre, un rayon, et deux angles.
     Correspond à la syntaxe : \\tkzDrawArc[R](centre,rayon)(angle_dep,angle_fin)
@@ -439,7 +554,7 @@ class DrawArcByAngles(BaseModel):
     arrow_spec: Optional[str] = Field(None, description="Spécification optionnelle pour les flèches (ex: '<->').")
     style: Style = Field(default_factory=Style)
 
-class LabelArc(BaseModel):
+class LabelArc(ConstructionStepModel):
     """
     Place une étiquette le long d'un arc de cercle.
     L'arc est défini par trois points (départ, centre, arrivée).
@@ -457,7 +572,7 @@ class LabelArc(BaseModel):
 #           MODÈLES DE CALCUL : POINTS SUR LIGNES ET CERCLES
 # ==============================================================================
 
-class DefinePointOnLine(BaseModel):
+class DefinePointOnLine(ConstructionStepModel):
     """
     CALCULE et nomme un nouveau point situé sur une ligne à une position relative.
     Correspond à la commande LaTeX : \\tkzDefPointOnLine[pos=...](pt1,pt2)
@@ -468,7 +583,7 @@ class DefinePointOnLine(BaseModel):
     pos: float = Field(..., description="Position relative sur la ligne (0=1er pt, 1=2e pt, 0.5=milieu, etc.).")
 
 
-class DefinePointOnCircle(BaseModel):
+class DefinePointOnCircle(ConstructionStepModel):
     """
     CALCULE et nomme un nouveau point sur un cercle à un angle donné.
     Le rayon du cercle peut être défini soit par un point, soit par une valeur.
@@ -499,7 +614,7 @@ class DefinePointOnCircle(BaseModel):
 # ==============================================================================
 #                  MODÈLES POUR LA GESTION DES ANGLES
 # ==============================================================================
-class DrawAngle(BaseModel):
+class DrawAngle(ConstructionStepModel):
     """
     DESSINE les deux segments qui forment un angle.
     Ceci est un raccourci sémantique qui utilise DrawSegments en interne.
@@ -510,7 +625,7 @@ class DrawAngle(BaseModel):
     
     style: Style = Field(default_factory=Style, description="Le style à appliquer aux deux segments de l'angle.")
 
-class CalculateAngleByPoints(BaseModel):
+class CalculateAngleByPoints(ConstructionStepModel):
     """
     CALCULE la valeur d'un angle défini par trois points et la stocke
     dans une macro LaTeX nommée. L'angle est mesuré de (sommet,pt1) vers (sommet,pt2).
@@ -522,7 +637,7 @@ class CalculateAngleByPoints(BaseModel):
     end_point_id: str = Field(..., description="ID du point sur le second côté de l'angle.")
 
 
-class CalculateAngleOfSlope(BaseModel):
+class CalculateAngleOfSlope(ConstructionStepModel):
     """
     CALCULE la valeur de l'angle de la pente d'une droite et la stocke
     dans une macro LaTeX nommée.
@@ -531,7 +646,7 @@ class CalculateAngleOfSlope(BaseModel):
     id: str = Field(..., description="ID/Nom de la nouvelle macro qui stockera la valeur de l'angle de pente.")
     line_points: Tuple[str, str] = Field(..., description="Tuple des 2 ID des points définissant la ligne.")
 
-class DefineAngleBisector(BaseModel):
+class DefineAngleBisector(ConstructionStepModel):
     """
     DÉFINIT la ligne bissectrice d'un angle donné.
     L'angle est défini par trois points. Ne dessine rien.
@@ -546,7 +661,7 @@ class DefineAngleBisector(BaseModel):
     of_angle_from_points: Tuple[str, str, str] = Field(..., description="Tuple des IDs de trois points définissant l'angle." \
     " L'ordre est important : (point_depart, sommet, point_arrivee).")
 
-class MarkAngle(BaseModel):
+class MarkAngle(ConstructionStepModel):
     # NOTE TRES IMPORTANTE: ne jamains exposé cette solution au llm, ils doivent toujours utiliser MarkInternalAngle
     """
     DESSINE un arc pour marquer un angle. Peut aussi être rempli et/ou étiqueté.
@@ -568,7 +683,7 @@ class MarkAngle(BaseModel):
             raise ValueError("Les champs 'label' et 'display_calculated_angle_id' ne peuvent pas être utilisés en même temps.")
         return self
 
-class MarkInternalAngle(BaseModel):
+class MarkInternalAngle(ConstructionStepModel):
     """
     [ACTION INTELLIGENTE] Dessine la marque de l'angle INTERNE.
     Détermine automatiquement le bon ordre des points pour toujours tracer l'angle
@@ -593,7 +708,7 @@ class MarkInternalAngle(BaseModel):
 #                 MODÈLES DE DESSIN : SECTEURS ANGULAIRES
 # ==============================================================================
 
-class DrawAngularSectorByPoints(BaseModel):
+class DrawAngularSectorByPoints(ConstructionStepModel):
     """
     [Secteur 1/4] DESSINE un secteur angulaire défini par son centre et deux points.
     Correspond à la commande LaTeX : \\tkzDrawSector(centre,pt_depart)(pt_arrivee)
@@ -605,7 +720,7 @@ class DrawAngularSectorByPoints(BaseModel):
     style: Optional[Style] = Field(default_factory=Style)
 
 
-class DrawAngularSectorByRotation(BaseModel):
+class DrawAngularSectorByRotation(ConstructionStepModel):
     """
     [Secteur 2/4] DESSINE un secteur angulaire défini par son centre, un point, et un angle de rotation.
     Correspond à la commande LaTeX : \\tkzDrawSector[rotate](centre,pt_depart)(angle)
@@ -617,7 +732,7 @@ class DrawAngularSectorByRotation(BaseModel):
     style: Optional[Style] = Field(default_factory=Style)
 
 
-class DrawAngularSectorByAngles(BaseModel):
+class DrawAngularSectorByAngles(ConstructionStepModel):
     """
     [Secteur 3/4] DESSINE un secteur angulaire défini par son centre, un rayon, et deux angles.
     Correspond à la commande LaTeX : \\tkzDrawSector[R](centre,rayon)(angle_dep,angle_fin)
@@ -630,7 +745,7 @@ class DrawAngularSectorByAngles(BaseModel):
     style: Optional[Style] = Field(default_factory=Style)
 
 
-class DrawAngularSectorByNodes(BaseModel):
+class DrawAngularSectorByNodes(ConstructionStepModel):
     """
     [Secteur 4/4] DESSINE un secteur angulaire défini par son centre, un rayon, et deux points 'cibles'.
     L'arc s'arrête sur les rayons passant par ces deux points cibles.
@@ -669,7 +784,7 @@ L'option de symétrie (swap):
 Sémantique : "Construis le triangle de l'autre côté du segment [AB]".
 Importance : C'est un modificateur essentiel qui s'applique à presque tous les autres types. Ce sera un simple booléen (vrai/faux) dans notre modèle.
 """
-class DefineTriangleBy2Points(BaseModel):
+class DefineTriangleBy2Points(ConstructionStepModel):
     """
     DÉFINIT un triangle à partir d'un segment de base et d'une propriété.
     Cette action CALCULE et nomme le troisième point du triangle.
@@ -715,7 +830,7 @@ class DefineTriangleBy2Points(BaseModel):
             
         return self
 
-class DefineTriangleCenter(BaseModel):
+class DefineTriangleCenter(ConstructionStepModel):
     """
     DÉFINIT un point remarquable d'un triangle (orthocentre, centre de gravité, etc.).
     Cette action CALCULE et nomme le point central demandé. Elle ne dessine rien d'autre.
@@ -740,7 +855,7 @@ class DefineTriangleCenter(BaseModel):
 #                 MODÈLES DE DÉFINITION DE QUADRILATÈRES
 # ==============================================================================
 
-class DefineSquare(BaseModel):
+class DefineSquare(ConstructionStepModel):
     """
     DÉFINIT les deux points manquants pour former un carré.
     Basé sur deux points de départ qui forment le premier côté.
@@ -751,7 +866,7 @@ class DefineSquare(BaseModel):
     ids: Tuple[str, str] = Field(..., description="Tuple des IDs des DEUX NOUVEAUX points qui seront créés (les 3ème et 4ème sommets).")
     from_points: Tuple[str, str] = Field(..., description="Tuple des IDs des deux points de base qui forment le premier côté du carré.")
     
-class DefineRectangle(BaseModel):
+class DefineRectangle(ConstructionStepModel):
     """
     DÉFINIT les deux points manquants pour former un rectangle.
     Basé sur deux points qui forment une DIAGONALE.
@@ -762,7 +877,7 @@ class DefineRectangle(BaseModel):
     ids: Tuple[str, str] = Field(..., description="Tuple des IDs des DEUX NOUVEAUX points qui seront créés.")
     from_diagonal: Tuple[str, str] = Field(..., description="Tuple des IDs des deux points qui forment une diagonale du rectangle.")
 
-class DefineParallelogram(BaseModel):
+class DefineParallelogram(ConstructionStepModel):
     """
     DÉFINIT le point manquant pour former un parallélogramme.
     Basé sur trois points de départ.
@@ -781,7 +896,7 @@ class CustomLabel(BaseModel):
     text: Optional[str] = None      # Le texte à afficher. Si omis, l'ID du point sera utilisé.
     style: Optional[Style] = None   # Un style optionnel qui surcharge le style global pour ce point uniquement.
 
-class LabelPoints(BaseModel):
+class LabelPoints(ConstructionStepModel):
     """
     Place les labels des points. Propose deux modes mutuellement exclusifs :
     - Mode simple ('point_ids') : Pour un placement automatique par tkz-euclide.
@@ -822,14 +937,14 @@ class LabelStyle(BaseModel):
     # On pourrait ajouter 'rotate', 'font', etc. plus tard.
 
 # --- Le modèle pour labelliser UN segment ---
-class LabelSegment(BaseModel):
+class LabelSegment(ConstructionStepModel):
     type: Literal["label_segment"] = "label_segment"
     on_segment: Tuple[str, str]   # Les deux points du segment (ex: ["A","B"])
     text: str                     # Le texte du label (ex: "5cm" ou "a")
     style: LabelStyle = Field(default_factory=LabelStyle)
 
 # --- Le modèle pour labelliser UNE ligne ---
-class LabelLine(BaseModel):
+class LabelLine(ConstructionStepModel):
     type: Literal["label_line"] = "label_line"
     on_line: Tuple[str, str]      # Les deux points définissant la ligne (ex: ["A","B"])
     text: str                     # Le texte du label (ex: "d_1")
@@ -843,7 +958,7 @@ class DisplayCalculationParams(BaseModel):
 
 # --- B. Le nouveau modèle DrawText ---
 
-class DrawText(BaseModel):
+class DrawText(ConstructionStepModel):
     """
     Écrit un texte à des coordonnées données. Propose deux modes exclusifs :
     - Mode 'text': pour écrire une chaîne de caractères simple.
@@ -920,7 +1035,7 @@ class RotationParams(BaseModel):
 # ==============================================================================
 #                 MODÈLES DE DÉFINITION PAR TRANSFORMATION
 # ==============================================================================
-class DefinePointsByTransformation(BaseModel):
+class DefinePointsByTransformation(ConstructionStepModel):
     """
     Modèle de base pour toutes les transformations. Contient la logique
     de validation partagée pour s'assurer que les listes d'entrée et de sortie
@@ -983,7 +1098,7 @@ class PatternStyle(BaseModel):
     color: str = "gray"
     pattern_thickness: Optional[Literal["thin", "thick"]] = None
 
-class FillShapeWithPattern(BaseModel):
+class FillShapeWithPattern(ConstructionStepModel):
     """
     DESSINE et REMPLIT une forme polygonale avec un motif de hachures.
     C'est l'outil à utiliser pour représenter des plans coupés.
@@ -993,13 +1108,14 @@ class FillShapeWithPattern(BaseModel):
     style: PatternStyle = Field(default_factory=PatternStyle)
 
 
-class DefinePerspectiveCuboid(BaseModel):
+class DefinePerspectiveCuboid(ConstructionStepModel):
     """
     [HAUT NIVEAU] Construit les 8 sommets d'un parallélépipède (cube) en perspective.
     L'utilisateur définit explicitement les 4 sommets de la base avant
     et le vecteur de translation qui donne la profondeur. Les 4 autres points sont calculés.
     """
     type: Literal["def_perspective_cuboid"] = "def_perspective_cuboid"
+    id_creation_fields: ClassVar[Tuple[str, ...]] = ('base_points', 'derived_points')
 
     base_points: Tuple[str, str, str, str] = Field(
         ...,
@@ -1080,6 +1196,108 @@ ConstructionStep = Union[
     DefinePerspectiveCuboid
 ]
 
+def collect_step_ids(step: "ConstructionStepModel") -> Tuple[List[str], List[str]]:
+    """
+    Retourne `(ids_créés, ids_référencés)` pour une étape de construction.
+    Utilisé par le validateur de dépendances et par le cache de traduction.
+    """
+    return step.collect_ids()
+
+
+def check_step_dependencies(steps: List["ConstructionStepModel"]) -> None:
+    """
+    Vérifie que chaque ID est défini AVANT d'être utilisé et n'est défini qu'une fois.
+    Lève une ValueError à la première violation.
+    """
+    defined_ids = set()
+
+    for i, step in enumerate(steps):
+        new_ids_created, dependencies_to_check = step.collect_ids()
+
+        # --- Valider les dépendances ---
+        for dep_id in set(dependencies_to_check):
+            if dep_id not in defined_ids:
+                raise ValueError(
+                    f"ID de dépendance non défini : '{dep_id}' est utilisé à l'étape {i+1} "
+                    f"(type: '{step.type}') mais n'a pas été défini dans une étape précédente."
+                )
+        
+        # --- Enregistrer les nouveaux IDs ---
+        for new_id in new_ids_created:
+            if new_id in defined_ids:
+                raise ValueError(f"ID '{new_id}' redéfini à l'étape {i+1}. Les IDs doivent être uniques.")
+            defined_ids.add(new_id)
+
+
+def reorder_steps_by_dependencies(steps: List["ConstructionStepModel"]) -> List["ConstructionStepModel"]:
+    """
+    Mode réparation : remet dans un ordre valide un plan où un ID est utilisé avant
+    sa définition (erreur fréquente des LLM), au lieu de le rejeter.
+
+    Construit le graphe "étape qui crée l'ID -> étape qui l'utilise" et en fait un tri
+    topologique stable (à contraintes égales, l'ordre d'origine est conservé). Les étapes
+    qui ne créent rien (dessins, labels, marques) sont en plus chaînées entre elles :
+    leur ordre relatif, donc la superposition du dessin, ne change jamais.
+    Ne rejette que les vrais problèmes : ID jamais défini, ID défini deux fois, cycle.
+    """
+    creators: Dict[str, int] = {}
+    references: List[List[str]] = []
+    draw_steps: List[int] = []
+
+    for i, step in enumerate(steps):
+        created, referenced = step.collect_ids()
+        for new_id in created:
+            if new_id in creators:
+                raise ValueError(f"ID '{new_id}' redéfini à l'étape {i+1}. Les IDs doivent être uniques.")
+            creators[new_id] = i
+        references.append(referenced)
+        if not created:
+            draw_steps.append(i)
+
+    successors: List[set] = [set() for _ in steps]
+    for i, referenced in enumerate(references):
+        for dep_id in set(referenced):
+            if dep_id not in creators:
+                raise ValueError(
+                    f"ID de dépendance non défini : '{dep_id}' est utilisé à l'étape {i+1} "
+                    f"(type: '{steps[i].type}') mais n'est défini dans aucune étape."
+                )
+            successors[creators[dep_id]].add(i)
+    for previous, following in zip(draw_steps, draw_steps[1:]):
+        successors[previous].add(following)
+
+    in_degree = [0] * len(steps)
+    for targets in successors:
+        for target in targets:
+            in_degree[target] += 1
+
+    # Tri topologique de Kahn, en sortant toujours la plus petite position d'origine.
+    ready = [i for i, degree in enumerate(in_degree) if degree == 0]
+    heapq.heapify(ready)
+    order: List[int] = []
+    while ready:
+        i = heapq.heappop(ready)
+        order.append(i)
+        for target in successors[i]:
+            in_degree[target] -= 1
+            if in_degree[target] == 0:
+                heapq.heappush(ready, target)
+
+    if len(order) < len(steps):
+        blocked = [i for i, degree in enumerate(in_degree) if degree > 0]
+        details = ", ".join(f"{i+1} ({steps[i].type})" for i in blocked)
+        raise ValueError(f"Dépendance circulaire entre les étapes : {details}.")
+
+    if order != sorted(order):
+        moved = sum(1 for position, i in enumerate(order) if position != i)
+        log.info(f"Plan réordonné selon les dépendances : {moved} étape(s) déplacée(s).")
+    return [steps[i] for i in order]
+
+
+# Une étape seule, telle qu'elle apparaît dans `construction_steps` (validation au fil du stream).
+DiscriminatedConstructionStep = Annotated[ConstructionStep, Field(discriminator='type')]
+
+
 # ==============================================================================
 #  LE MODÈLE PRINCIPAL (Version minimale pour le Sprint 1)
 # ==============================================================================
@@ -1092,129 +1310,66 @@ class Geometry2DInput(BaseModel):
     figure_config: FigureConfig = Field(default_factory=FigureConfig)
     
     # On applique la syntaxe 'Annotated' que nous avons apprise
-    construction_steps: List[Annotated[ConstructionStep, Field(discriminator='type')]]
+    construction_steps: List[DiscriminatedConstructionStep]
 
     @model_validator(mode='after')
-    def check_id_dependencies(self) -> 'Geometry2DInput':
+    def check_id_dependencies(self, info: ValidationInfo) -> 'Geometry2DInput':
         """
         Vérifie que les objets référencés par un `id` sont définis AVANT
         d'être utilisés. C'est la garantie de la logique séquentielle.
+        Avec le contexte de validation `{"reorder_steps": True}`, un plan dans le
+        désordre est d'abord réordonné (voir `reorder_steps_by_dependencies`).
         """
-        defined_ids = set()
+        if info.context and info.context.get("reorder_steps"):
+            self.construction_steps = reorder_steps_by_dependencies(self.construction_steps)
+        check_step_dependencies(self.construction_steps)
+        return self
 
-        for i, step in enumerate(self.construction_steps):
-            step_dict = step.model_dump(exclude_unset=True)
-            step_type = step_dict.get('type', '')
-            
-            # --- ÉTAPE 1: Identifier les NOUVEAUX IDs créés par cette étape ---
-            new_ids_created = []
-            
-            # Champs qui créent toujours des IDs
-            always_creation_keys = {'id', 'ids', 'tangency_point_id', 'tangency_point_ids',
-                                    'line_id', 'new_ids', 'point_on_line_id', 'point_on_line_ids'}
-            for key in always_creation_keys:
-                if key in step_dict:
-                    value = step_dict[key]
-                    if isinstance(value, (list, tuple)):
-                        new_ids_created.extend(value)
-                    else:
-                        new_ids_created.append(value)
-
-            # ---  Gérer la création implicite des points du polygone ---
-            if step_type == 'def_regular_polygon':
-                prefix = step_dict.get('name_prefix', '')
-                num_sides = step_dict.get('num_sides', 0)
-                if prefix and num_sides > 0:
-                    # On génère la liste des noms que LaTeX va créer (P1, P2, P3...)
-                    # et on les ajoute à la liste des points créés pour cette étape.
-                    implicit_ids = [f"{prefix}{k+1}" for k in range(num_sides)]
-                    new_ids_created.extend(implicit_ids)
-
-            if step_type == 'def_perspective_cuboid':
-                # On lui apprend que ces deux champs créent des points.
-                if 'base_points' in step_dict:
-                    new_ids_created.extend(step_dict['base_points'])
-                if 'derived_points' in step_dict:
-                    new_ids_created.extend(step_dict['derived_points'])
-            
-            # Cas spécial pour line_ids : création seulement dans certains types d'étapes
-            line_creation_types = {'def_tangents_from_point'}  # Ajouter d'autres types si nécessaire
-            if 'line_ids' in step_dict and step_type in line_creation_types:
-                line_ids = step_dict['line_ids']
-                if isinstance(line_ids, (list, tuple)):
-                    new_ids_created.extend(line_ids)
-                else:
-                    new_ids_created.append(line_ids)
 
-            # --- ÉTAPE 2: Identifier toutes les DÉPENDANCES ---
-            dependencies_to_check = []
-            
-            # Liste des champs de données pures (pas des IDs)
-            DATA_KEYS = {'type', 'style', 'label', 'text', 'unit', 'color', 
-                     'thickness', 'pattern', 'fill_color', 'position',
-                     'radius', 'semi_major_axis', 'semi_minor_axis', 'angle',
-                     'start_angle', 'end_angle', 'arrow_spec', 'triangle_type',
-                     'center_type', 'on_segments','num_sides', 'build_method',
-                     'name_prefix', 'base_points', 'derived_points',
-                     'base_origin', 'base_width', 'base_height', 'depth_vector'
-                     }
-
-            for key, value in step_dict.items():
-                # Ignorer les champs de données pures
-                if key in DATA_KEYS:
-                    continue
-                    
-                # Ignorer les champs de création qu'on a déjà traités
-                if key in always_creation_keys:
-                    continue
-                if key == 'line_ids' and step_type in line_creation_types:
-                    continue
-                
-                # Cas spécial : line_ids dans draw_lines est une DÉPENDANCE
-                if key == 'line_ids' and step_type == 'draw_lines':
-                    if isinstance(value, (list, tuple)):
-                        dependencies_to_check.extend([item for item in value if isinstance(item, str)])
-                    elif isinstance(value, str):
-                        dependencies_to_check.append(value)
-                    continue
-
-                # Cas spécial : les CLÉS du dictionnaire custom_labels sont des dépendances
-                if key == 'custom_labels' and isinstance(value, dict):
-                    dependencies_to_check.extend(value.keys())
-                    continue
-
-                # Cas spécial : les VALEURS de circle_def sont des dépendances
-                if key == 'circle_def' and isinstance(value, dict):
-                    if value.get('by_center_point'):
-                        dependencies_to_check.extend(value['by_center_point'])
-                    if value.get('by_center_radius'):
-                        # Le rayon est un float, on ne prend que la chaîne (le centre)
-                        dependencies_to_check.extend([item for item in value['by_center_radius'] if isinstance(item, str)])
-                    continue
-
-                # Cas général pour tous les autres champs
-                if isinstance(value, str):
-                    dependencies_to_check.append(value)
-                elif isinstance(value, (list, tuple)):
-                    # Gérer les listes de listes comme pour les segments
-                    if value and isinstance(value[0], (list, tuple)):
-                        for sub_list in value:
-                            dependencies_to_check.extend([item for item in sub_list if isinstance(item, str)])
-                    else:
-                        dependencies_to_check.extend([item for item in value if isinstance(item, str)])
-
-            # --- ÉTAPE 3: Valider les dépendances ---
-            for dep_id in set(dependencies_to_check):
-                if dep_id not in defined_ids:
-                    raise ValueError(
-                        f"ID de dépendance non défini : '{dep_id}' est utilisé à l'étape {i+1} "
-                        f"(type: '{step_type}') mais n'a pas été défini dans une étape précédente."
-                    )
-            
-            # --- ÉTAPE 4: Enregistrer les nouveaux IDs ---
-            for new_id in new_ids_created:
-                if new_id in defined_ids:
-                    raise ValueError(f"ID '{new_id}' redéfini à l'étape {i+1}. Les IDs doivent être uniques.")
-                defined_ids.add(new_id)
+# ==============================================================================
+#  ÉTAPES TIERCES (plugins)
+# ==============================================================================
+
+# Toutes les étapes connues : l'union `ConstructionStep`, puis celles des plugins
+_STEP_MODELS: List[type] = list(get_args(ConstructionStep))
+# Recalculé à chaque enregistrement (même objet entre-temps : clé stable pour `get_type_adapter`)
+_STEP_TYPE: Any = DiscriminatedConstructionStep
+
+
+def step_models() -> Tuple[type, ...]:
+    """Modèles de toutes les étapes acceptées dans un plan (plugins compris)."""
+    return tuple(_STEP_MODELS)
+
+
+def discriminated_step_type() -> Any:
+    """Type d'une étape seule (comme `DiscriminatedConstructionStep`), plugins compris."""
+    return _STEP_TYPE
+
+
+def register_step_model(model: type) -> type:
+    """
+    Décorateur pour ajouter un type d'étape hors de l'union `ConstructionStep`
+    (plugin tiers). `Geometry2DInput` est reconstruit pour l'accepter ; son rendu
+    s'enregistre à part, avec `translator.register_step_translator`. Exemple :
+
+        @register_step_model
+        class DrawStar(ConstructionStepModel):
+            type: Literal["draw_star"] = "draw_star"
+            center: str
+    """
+    step_type = model.model_fields["type"].default
+    if any(known.model_fields["type"].default == step_type for known in _STEP_MODELS):
+        raise ValueError(f"Le type d'étape '{step_type}' existe déjà.")
+    global _STEP_TYPE
+    _STEP_MODELS.append(model)
+    _STEP_TYPE = Annotated[Union[tuple(_STEP_MODELS)], Field(discriminator='type')]
+    Geometry2DInput.model_fields["construction_steps"].annotation = List[_STEP_TYPE]
+    Geometry2DInput.model_rebuild(force=True)
 
-        return self
\ No newline at end of file
+    # Validateurs et schémas déjà construits pour l'ancienne union
+    from src.utils.parser import get_type_adapter
+    from src.utils.schema import clear_schema_cache
+    get_type_adapter.cache_clear()
+    clear_schema_cache()
+    log.info(f"Étape tierce enregistrée : '{step_type}'.")
+    return model
@@ -0,0 +1,90 @@
+"""
+Mode édition : le LLM reçoit le plan précédent (étapes numérotées, dans le format de
+sortie de l'outil : JSON ou format compact) et ne renvoie que les changements
+(`PlanPatch`), appliqués ici avant la validation.
+
+Les étapes ajoutées vont en fin de plan : la validation en mode réparation
+(`reorder_steps`) les remonte après leurs dépendances si besoin.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from .dsl import plan_to_dsl
+from .models import Geometry2DInput
+
+# Présentation du plan précédent, selon `GEOMETRY_PLAN_FORMAT`
+PLAN_DESCRIPTIONS = {
+    "json": "as JSON, one numbered step object per line (the unnumbered first line is the frame)",
+    "dsl": "in the compact format, one numbered step per line",
+}
+
+EDIT_INSTRUCTIONS = (
+    "### EDIT MODE\n"
+    "The user is modifying an existing figure. Its current plan is given below {plan_description}. "
+    "Return ONLY the changes, as JSON:\n"
+    '{{"remove": [<step numbers>], "replace": [{{"step_number": <n>, "step": <step>}}], '
+    '"add": [<new steps>], "figure_config": <new frame or null>}}\n'
+    "- Steps are JSON objects, exactly as in the reference. Reuse the existing IDs; new IDs must be unique.\n"
+    "- Added steps are appended (their dependencies are sorted out automatically).\n"
+    "- Leave out everything that does not change. No Markdown text before or after.\n"
+)
+
+
+class StepReplacement(BaseModel):
+    step_number: int = Field(..., description="Numéro (1-based) de l'étape remplacée dans le plan précédent.")
+    step: Dict[str, Any]
+
+
+class PlanPatch(BaseModel):
+    """Changements demandés au plan précédent."""
+    remove: List[int] = Field(default_factory=list, description="Numéros (1-based) des étapes à supprimer.")
+    replace: List[StepReplacement] = Field(default_factory=list)
+    add: List[Dict[str, Any]] = Field(default_factory=list, description="Étapes ajoutées en fin de plan.")
+    figure_config: Optional[Dict[str, Any]] = None
+
+    def summary(self) -> Dict[str, int]:
+        return {"added": len(self.add), "replaced": len(self.replace), "removed": len(self.remove)}
+
+
+def _step_dicts(plan: Geometry2DInput) -> List[Dict[str, Any]]:
+    return [
+        {"type": step.type, **step.model_dump(mode="json", exclude_defaults=True)} for step in plan.construction_steps
+    ]
+
+
+def edit_instructions(plan_format: str) -> str:
+    return EDIT_INSTRUCTIONS.format(plan_description=PLAN_DESCRIPTIONS[plan_format])
+
+
+def numbered_plan(plan: Geometry2DInput, plan_format: str = "dsl") -> str:
+    """
+    Plan aux étapes numérotées, le cadre non numéroté en tête : format compact
+    (`3| MID M A,B`) ou une étape JSON par ligne (`3| {"type": "def_midpoint", ...}`).
+    """
+    if plan_format == "json":
+        frame = json.dumps({"figure_config": plan.figure_config.model_dump(mode="json")}, ensure_ascii=False)
+        steps = (json.dumps(step, ensure_ascii=False) for step in _step_dicts(plan))
+        return "\n".join([frame, *(f"{number}| {step}" for number, step in enumerate(steps, start=1))])
+    lines = plan_to_dsl(plan).splitlines()[:-1]  # Sans END
+    offset = 1 if len(lines) > len(plan.construction_steps) else 0
+    numbered = lines[:offset]
+    numbered.extend(f"{number}| {line}" for number, line in enumerate(lines[offset:], start=1))
+    return "\n".join(numbered)
+
+
+def apply_patch(plan: Geometry2DInput, patch: PlanPatch) -> Dict[str, Any]:
+    """Plan précédent + patch -> dict `Geometry2DInput` (à valider ; les numéros hors plan sont ignorés)."""
+    steps: List[Any] = _step_dicts(plan)
+    for replacement in patch.replace:
+        if 1 <= replacement.step_number <= len(steps):
+            steps[replacement.step_number - 1] = replacement.step
+    removed = {number - 1 for number in patch.remove}
+    steps = [step for i, step in enumerate(steps) if i not in removed]
+    steps.extend(patch.add)
+
+    figure_config = plan.figure_config.model_dump(mode="json")
+    if patch.figure_config:
+        figure_config.update(patch.figure_config)
+    return {"figure_config": figure_config, "construction_steps": steps}
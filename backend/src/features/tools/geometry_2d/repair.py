@@ -0,0 +1,184 @@
+"""
+Réparation ciblée d'un plan rejeté par la validation.
+
+Plutôt que de tout régénérer (ou d'échouer), on relève TOUTES les erreurs d'un
+coup, étape par étape :
+  - erreurs de schéma (champ manquant, type inconnu...) via l'adaptateur d'une étape seule ;
+  - erreurs de dépendances (ID jamais défini, ID défini deux fois), l'ordre étant
+    de toute façon réparé par `reorder_steps_by_dependencies`.
+Le LLM ne reçoit que ces étapes, leurs erreurs et la doc des briques concernées,
+et renvoie des étapes de remplacement qu'on recolle à leur place dans le plan.
+"""
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+
+from src.utils.parser import get_type_adapter
+
+from .models import discriminated_step_type
+
+log = logging.getLogger(__name__)
+
+REPAIR_SYSTEM_PROMPT = (
+    "### ROLE\n"
+    "You repair invalid steps of a geometry construction plan (JSON) written for the Neuclid engine.\n\n"
+    "### RULES\n"
+    "1. Fix ONLY the steps listed by the user, using the error messages and the reference below.\n"
+    "2. Keep the intent, the IDs and the values of each step whenever they are valid.\n"
+    "3. If a step uses an ID that no step defines, return the missing definition step(s) followed by the step.\n"
+    "4. If a step is redundant (e.g. defines an ID twice), return an empty list to delete it.\n"
+    "5. Output Format: Return ONLY valid JSON: "
+    '{"repairs": [{"step_number": <n>, "steps": [<step>, ...]}]}. No Markdown text before or after.\n'
+)
+
+
+@dataclass
+class StepIssue:
+    """Une étape rejetée du plan et toutes ses erreurs."""
+    index: int                      # Position dans `construction_steps` (0-based)
+    raw_step: Any
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def step_type(self) -> Optional[str]:
+        return self.raw_step.get("type") if isinstance(self.raw_step, dict) else None
+
+
+class StepRepair(BaseModel):
+    step_number: int = Field(..., description="Numéro (1-based) de l'étape corrigée, tel que donné dans la demande.")
+    steps: List[Dict[str, Any]] = Field(..., description="Étapes qui remplacent l'étape (vide = suppression).")
+
+
+class PlanRepair(BaseModel):
+    """Réponse attendue du LLM de réparation."""
+    repairs: List[StepRepair]
+
+
+def _format_error(error: Dict[str, Any]) -> str:
+    location = ".".join(str(part) for part in error["loc"])
+    return f"{location}: {error['msg']}" if location else error["msg"]
+
+
+def _strings(value: Any) -> Iterator[str]:
+    """Toutes les chaînes d'une valeur JSON (IDs possiblement créés par une étape invalide)."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _strings(item)
+        yield from (key for key in value if isinstance(key, str))
+    elif isinstance(value, list):
+        for item in value:
+            yield from _strings(item)
+
+
+def find_step_issues(raw_steps: List[Any]) -> Tuple[List[StepIssue], List[str]]:
+    """
+    Relève les erreurs de chaque étape brute du plan.
+    Renvoie (étapes à réparer, IDs définis par les étapes valides).
+    """
+    adapter = get_type_adapter(discriminated_step_type())
+    issues: Dict[int, StepIssue] = {}
+    steps = []
+    for i, raw_step in enumerate(raw_steps):
+        try:
+            steps.append(adapter.validate_python(raw_step))
+        except ValidationError as e:
+            steps.append(None)
+            issues[i] = StepIssue(i, raw_step, [_format_error(error) for error in e.errors()])
+
+    def issue(i: int) -> StepIssue:
+        return issues.setdefault(i, StepIssue(i, raw_steps[i]))
+
+    creators: Dict[str, int] = {}
+    for i, step in enumerate(steps):
+        if step is None:
+            continue
+        for new_id in step.collect_ids()[0]:
+            if new_id in creators:
+                issue(i).errors.append(f"ID '{new_id}' already defined at step {creators[new_id] + 1}. IDs must be unique.")
+            else:
+                creators[new_id] = i
+
+    # Un ID qui n'apparaît que dans une étape invalide sera sans doute défini une fois celle-ci corrigée
+    maybe_defined = {text for i in issues for text in _strings(raw_steps[i])}
+    for i, step in enumerate(steps):
+        if step is None:
+            continue
+        missing = sorted(set(step.collect_ids()[1]) - creators.keys() - maybe_defined)
+        if missing:
+            issue(i).errors.append(f"Undefined ID(s) {missing}: no step of the plan defines them.")
+
+    return [issues[i] for i in sorted(issues)], sorted(creators)
+
+
+def build_repair_request(user_prompt: str, issues: List[StepIssue], defined_ids: List[str]) -> str:
+    """Message utilisateur de la réparation : la demande d'origine, les étapes fautives et leurs erreurs."""
+    parts = [
+        f"### ORIGINAL REQUEST\n{user_prompt}\n",
+        f"### IDS DEFINED BY THE VALID STEPS\n{', '.join(defined_ids) or '(none)'}\n",
+        "### STEPS TO FIX",
+    ]
+    for issue in issues:
+        errors = "\n".join(f"- {error}" for error in issue.errors)
+        parts.append(f"Step {issue.index + 1}: {json.dumps(issue.raw_step, ensure_ascii=False)}\nErrors:\n{errors}\n")
+    return "\n".join(parts)
+
+
+def splice_repairs(raw_steps: List[Any], issues: List[StepIssue], repair: PlanRepair) -> List[Any]:
+    """Remplace chaque étape fautive par les étapes renvoyées ; les autres ne bougent pas."""
+    replacements = {}
+    allowed = {issue.index + 1 for issue in issues}
+    for item in repair.repairs:
+        if item.step_number in allowed:
+            replacements[item.step_number] = item.steps
+        else:
+            log.warning(f"Réparation ignorée pour l'étape {item.step_number} (non signalée).")
+    spliced = []
+    for i, raw_step in enumerate(raw_steps):
+        spliced.extend(replacements.get(i + 1, [raw_step]))
+    return spliced
+
+
+class RepairStats:
+    """Bilan des réparations : taux de succès et coût comparé à la génération initiale."""
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.repaired_steps = 0
+        self.repair_tokens = 0          # Estimations (≈ 4 caractères par token)
+        self.generation_tokens = 0      # Coût de la génération initiale des plans réparés
+        self.repair_seconds = 0.0
+
+    def record(self, success: bool, steps: int, repair_tokens: int, generation_tokens: int, seconds: float):
+        self.attempts += 1
+        self.successes += int(success)
+        self.repaired_steps += steps if success else 0
+        self.repair_tokens += repair_tokens
+        self.generation_tokens += generation_tokens
+        self.repair_seconds += seconds
+        log.info(f"Repair {'succeeded' if success else 'failed'} in {seconds:.1f}s, ~{repair_tokens} tokens "
+                 f"(success rate: {self.successes}/{self.attempts} = {self.success_rate:.0%})")
+
+    @property
+    def success_rate(self) -> float:
+        return self.successes / self.attempts if self.attempts else 0.0
+
+    @property
+    def cost_ratio(self) -> float:
+        """Tokens de réparation / tokens de la génération complète."""
+        return self.repair_tokens / self.generation_tokens if self.generation_tokens else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "attempts": self.attempts,
+            "successes": self.successes,
+            "success_rate": round(self.success_rate, 3),
+            "repaired_steps": self.repaired_steps,
+            "repair_tokens": self.repair_tokens,
+            "cost_ratio": round(self.cost_ratio, 3),
+            "mean_seconds": round(self.repair_seconds / self.attempts, 2) if self.attempts else 0.0,
+        }
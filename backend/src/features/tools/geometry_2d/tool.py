@@ -1,25 +1,65 @@
+import asyncio
+import hashlib
+import json
 import logging
+import time
+from contextlib import aclosing
 from pathlib import Path
-from typing import Type
+from typing import Any, Dict, List, Optional, Tuple, Type
 
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage
+from pydantic import ValidationError
 
+from src.config import settings
 from src.core.base_tool import BaseTool, ToolResult
+from src.core import metrics
 from src.core.llm import NeuclidChat
 from src.core.prompt_manager import prompt_manager
-from src.utils.parser import parse_llm_output_to_model
+from src.utils.parser import StreamingArrayParser, extract_json_from_text, get_type_adapter, parse_llm_output_to_model
+from src.utils.schema import trim_schema
 
 # Local feature imports
-from .models import Geometry2DInput
-from .translator import generate_geometry_2d # We assume this function returns image path AND code ideally
+from .complexity import TIERS, TierStats, estimate_complexity, next_tier
+from .degeneracy import find_degeneracies
+from .dsl import StreamingDslParser, dsl_reference, parse_dsl
+from .guide_index import STEP_TYPES, estimate_tokens, get_guide_retriever
+from .models import Geometry2DInput, discriminated_step_type, step_models
+from .patch import PlanPatch, apply_patch, edit_instructions, numbered_plan
+from .repair import REPAIR_SYSTEM_PROMPT, PlanRepair, RepairStats, build_repair_request, find_step_issues, splice_repairs
+from .translator import StepPretranslator, generate_geometry_2d, generate_geometry_2d_batch # We assume this function returns image path AND code ideally
 
 log = logging.getLogger(__name__)
 
 class Geometry2DTool(BaseTool):
+    # Contexte de validation : active la réparation de l'ordre des étapes du LLM.
+    validation_context = {"reorder_steps": True}
+
     def __init__(self):
-        self.llm = NeuclidChat(model="gemini/gemini-2.5-flash", temperature=0.1)
+        # Le prompt système (~20k tokens, identique d'un appel à l'autre) est mis en cache côté fournisseur
+        self.llm = NeuclidChat(model=settings.GEOMETRY_MODEL_TIERS["standard"], temperature=0.1, cache_system_prompt=True)
+        # Un modèle par tier de complexité (le tier « standard » sert aussi à l'édition et à la réparation)
+        self.model_tiering = settings.GEOMETRY_MODEL_TIERING
+        self.tier_llms = {
+            tier: self.llm if model == self.llm.model_name
+            else NeuclidChat(model=model, temperature=0.1, cache_system_prompt=True)
+            for tier, model in settings.GEOMETRY_MODEL_TIERS.items()
+        }
+        self.tier_stats = TierStats()
         # Define path to the specific guide for this tool
         self.guide_path = Path(__file__).parent / "guide.md"
+        self._guide_content = None
+        self._system_message = None
+        self._prompt_fingerprint = None
+        # Seules les sections du guide utiles au prompt sont envoyées (0 = guide complet)
+        self.guide_token_budget = settings.GEOMETRY_GUIDE_TOKEN_BUDGET
+        # Plan invalide : on ne renvoie au LLM que les étapes fautives (cf. repair.py)
+        self.repair_rounds = settings.GEOMETRY_REPAIR_ROUNDS
+        self.repair_stats = RepairStats()
+        self.response_schema = settings.GEOMETRY_RESPONSE_SCHEMA
+        self.schema_max_variants = settings.GEOMETRY_SCHEMA_MAX_VARIANTS
+        self.plan_format = settings.GEOMETRY_PLAN_FORMAT
+        self.race_candidates = settings.GEOMETRY_RACE_CANDIDATES
+        self.race_temperatures = settings.GEOMETRY_RACE_TEMPERATURES
 
     @property
     def name(self) -> str:
@@ -33,18 +73,47 @@ class Geometry2DTool(BaseTool):
             "Do NOT use for function plots or data charts."
         )
 
+    @property
+    def examples(self) -> List[str]:
+        return [
+            "Trace un triangle ABC rectangle en A et son cercle circonscrit",
+            "Construis la médiatrice du segment [AB] et la bissectrice de l'angle",
+            "Draw a circle of center O through point A and the tangent line",
+            "Place le milieu, le centre de gravité, l'orthocentre du triangle",
+            "Carré, rectangle, parallélogramme, polygone régulier, hexagone, pentagone",
+            "Droite parallèle, perpendiculaire, projeté orthogonal, intersection de deux droites",
+            "Symétrique, rotation, translation, homothétie d'un point, vecteur",
+            "Arc, secteur angulaire, ellipse, demi-cercle, cercle inscrit",
+            "Marque l'angle droit, code les segments égaux, mesure la longueur",
+            "Geometry figure: points, segments, lines, angles, polygon, intersection",
+        ]
+
     @property
     def input_model(self) -> Type[Geometry2DInput]:
         return Geometry2DInput
 
-    async def run(self, user_prompt: str) -> ToolResult:
-        log.info(f"[{self.name}] Processing: {user_prompt}")
-
-        # 1. Load System Context via PromptManager
+    def get_system_message(self) -> str:
+        """
+        System prompt of the tool (role + guide + rules). Built once and reused
+        until `guide.md` changes on disk (the PromptManager hands back the same
+        string while the file's mtime is unchanged). Identical bytes on every call
+        also let the provider cache this prefix.
+        """
         # We read the raw guide content to inject into the system prompt
         guide_content = prompt_manager.load_template(self.guide_path)
-        
-        system_msg = (
+        if guide_content is self._guide_content:
+            return self._system_message
+
+        if self.guide_token_budget > 0:
+            # Guide réduit : seules les sections cœur ici, les briques arrivent dans un 2e message
+            guide_content_for_prompt = (
+                f"{get_guide_retriever(guide_content).core}\n\n"
+                "(The reference of the construction steps relevant to this request is given in the next system message.)"
+            )
+        else:
+            guide_content_for_prompt = guide_content
+
+        self._system_message = (
             "### ROLE\n"
             "You are Neuclid, the world's most advanced Geometry AI Agent. "
             "Your goal is to translate natural language requests into a precise, sequential JSON construction plan.\n\n"
@@ -52,7 +121,7 @@ class Geometry2DTool(BaseTool):
             "### KNOWLEDGE BASE (THE TOOLS)\n"
             "You have access to a specific library of geometric actions. "
             "You must ONLY use the actions defined in the documentation below:\n"
-            f"{guide_content}\n\n"
+            f"{guide_content_for_prompt}\n\n"
 
             "### CRITICAL RULES (MUST FOLLOW)\n"
             "1. **Sequential Logic**: You cannot use a point (e.g., 'C') in a command if it hasn't been defined in a previous step.\n"
@@ -67,26 +136,287 @@ class Geometry2DTool(BaseTool):
             "- Determine the order of construction (Dependencies first).\n"
             "- Select the correct tool 'type' for each step.\n"
         )
+        self._guide_content = guide_content
+        # Empreinte du prompt système ET du guide complet (les extraits en dépendent aussi)
+        fingerprint = hashlib.sha1(self._system_message.encode("utf-8"))
+        fingerprint.update(f"{guide_content}|{self.guide_token_budget}".encode("utf-8"))
+        self._prompt_fingerprint = fingerprint.hexdigest()[:12]
+        return self._system_message
+
+    def get_guide_excerpt(self, user_prompt: str) -> str:
+        """Briques et exemples de guide.md pertinents pour ce prompt (BM25 local, cf. guide_index)."""
+        guide_content = prompt_manager.load_template(self.guide_path)
+        excerpt = get_guide_retriever(guide_content).build_excerpt(user_prompt, self.guide_token_budget)
+        return f"### CONSTRUCTION STEPS REFERENCE (relevant excerpt)\n{excerpt}"
+
+    def get_response_schema(self, user_prompt: str) -> Optional[Dict[str, Any]]:
+        """
+        Schéma JSON du plan pour le décodage contraint (None si désactivé). L'union des
+        briques est trop large pour les fournisseurs : seules les briques documentées
+        dans l'extrait du guide gardent leur schéma complet (cf. `trim_schema`). Sans
+        extrait (guide complet), l'union reste entière.
+        """
+        if not self.response_schema:
+            return None
+        return trim_schema(Geometry2DInput, self.schema_max_variants, self.get_selected_step_types(user_prompt))
 
-        # 2. LLM Generation
-        messages = [
-            SystemMessage(content=system_msg),
-            HumanMessage(content=user_prompt)
+    def get_selected_step_types(self, user_prompt: str) -> Optional[List[str]]:
+        """
+        Briques documentées dans l'extrait du guide pour ce prompt (None = guide complet, toutes).
+        Les étapes tierces (`register_step_model`) n'ont pas de section dans le guide : toujours gardées.
+        """
+        if self.guide_token_budget <= 0:
+            return None
+        guide = get_guide_retriever(prompt_manager.load_template(self.guide_path))
+        plugin_types = [
+            model.model_fields["type"].default for model in step_models()
+            if model.model_fields["type"].default not in STEP_TYPES
         ]
-        response = self.llm.invoke(messages)
+        return guide.selected_step_types(user_prompt, self.guide_token_budget) + plugin_types
+
+    @property
+    def cache_version(self) -> str:
+        # Un plan en cache n'est valable que pour le même modèle et le même prompt système (guide compris)
+        self.get_system_message()
+        if self.model_tiering:
+            models = "+".join(self.tier_llms[tier].model_name for tier in TIERS)
+            return f"{models}:{self._prompt_fingerprint}"
+        return f"{self.llm.model_name}:{self._prompt_fingerprint}"
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot = {"repair": self.repair_stats.snapshot()}
+        if self.model_tiering:
+            snapshot["tiers"] = self.tier_stats.snapshot()
+        return snapshot
+
+    async def run(self, user_prompt: str, context: Optional[Dict] = None) -> ToolResult:
+        plan, metadata = await self.generate_plan(user_prompt, context)
+        return await self.render(plan, metadata)
+
+    async def generate_plan(self, user_prompt: str, context: Optional[Dict] = None) -> Tuple[Geometry2DInput, Dict[str, Any]]:
+        if context and context.get("previous_plan") is not None:
+            return await self._edit_plan(user_prompt, context["previous_plan"])
+        # Variantes : température plus haute pour ne pas obtenir N fois la même figure
+        temperature = context.get("temperature") if context else None
+        # Course de candidats (hors variantes, qui sont déjà parallèles)
+        race = self.race_candidates > 1 and temperature is None
+        if not self.model_tiering:
+            if race:
+                return await self._race_plans(user_prompt, self.llm)
+            return await self._generate_plan_with(self.llm, user_prompt, temperature)
+
+        # Modèle selon la complexité estimée ; un plan toujours invalide (après réparation) passe au tier suivant
+        estimate = estimate_complexity(user_prompt)
+        tier = estimate.tier
+        log.info(f"[{self.name}] Complexité {estimate.score} ({', '.join(estimate.reasons)}) -> tier '{tier}'")
+        while True:
+            started = time.perf_counter()
+            try:
+                if race:
+                    backup = self.tier_llms[next_tier(tier)] if tier != TIERS[-1] else None
+                    plan, metadata = await self._race_plans(user_prompt, self.tier_llms[tier], backup)
+                else:
+                    plan, metadata = await self._generate_plan_with(self.tier_llms[tier], user_prompt, temperature)
+            except ValueError as e:  # ValidationError compris
+                self.tier_stats.record(tier, False, started)
+                if tier == TIERS[-1]:
+                    raise
+                log.warning(f"[{self.name}] Plan invalide avec le tier '{tier}', escalade vers '{next_tier(tier)}' : {e}")
+                tier = next_tier(tier)
+                self.tier_stats.escalations += 1
+                continue
+            self.tier_stats.record(tier, True, started)
+            return plan, {**metadata, "tier": tier, "complexity": estimate.score}
+
+    async def _generate_plan_with(
+        self, llm: NeuclidChat, user_prompt: str, temperature: Optional[float] = None
+    ) -> Tuple[Geometry2DInput, Dict[str, Any]]:
+        log.info(f"[{self.name}] Processing with {llm.model_name}: {user_prompt}")
+
+        # 1. System Context (guide compris), construit une fois puis réutilisé
+        system_msg = self.get_system_message()
+
+        # 2. LLM Generation (streamée, avec pré-traduction des étapes à l'arrivée)
+        messages = [SystemMessage(content=system_msg)]
+        if self.guide_token_budget > 0:
+            messages.append(SystemMessage(content=self.get_guide_excerpt(user_prompt)))
+        if self.plan_format == "dsl":
+            # Format compact : la doc des briques reste en JSON, seule la sortie change
+            messages.append(SystemMessage(content=dsl_reference(self.get_selected_step_types(user_prompt))))
+            messages.append(HumanMessage(content=user_prompt))
+            output, pretranslated_steps = await self._stream_plan(
+                llm, messages, parser=StreamingDslParser(), temperature=temperature
+            )
+            raw_plan = json.dumps(parse_dsl(output), ensure_ascii=False)
+        else:
+            messages.append(HumanMessage(content=user_prompt))
+            output, pretranslated_steps = await self._stream_plan(
+                llm, messages, self.get_response_schema(user_prompt), temperature=temperature
+            )
+            raw_plan = output
 
-        # 3. Parse JSON
-        data_model: Geometry2DInput = parse_llm_output_to_model(response.content, Geometry2DInput)
+        # 3. Parse JSON (les plans dans le désordre sont réordonnés plutôt que rejetés)
+        metadata = {"model_used": llm.model_name, "pretranslated_steps": pretranslated_steps}
+        if temperature is not None:
+            metadata["temperature"] = temperature
+        return await self._validate_plan(llm, user_prompt, raw_plan, messages, output, metadata)
 
+    async def _race_plans(
+        self, user_prompt: str, llm: NeuclidChat, backup_llm: Optional[NeuclidChat] = None
+    ) -> Tuple[Geometry2DInput, Dict[str, Any]]:
+        """
+        Lance `race_candidates` générations en même temps (une température par candidat,
+        `backup_llm` pour le dernier) : le premier plan qui passe la validation et les
+        contrôles numériques l'emporte, les autres sont annulés (stream LLM fermé).
+        Un échec ne coûte donc plus un cycle complet de plus. Relève l'erreur du premier
+        candidat si aucun ne passe.
+        """
+        candidates = []
+        for index in range(self.race_candidates):
+            is_last = index == self.race_candidates - 1
+            candidate_llm = backup_llm if backup_llm is not None and is_last else llm
+            candidates.append((candidate_llm, self.race_temperatures[index % len(self.race_temperatures)]))
+        log.info(f"[{self.name}] Course de {len(candidates)} candidats : "
+                 f"{', '.join(f'{c.model_name}@{t}' for c, t in candidates)}")
+
+        started = time.perf_counter()
+        tasks = {
+            asyncio.create_task(self._checked_plan(candidate_llm, user_prompt, temperature)): index
+            for index, (candidate_llm, temperature) in enumerate(candidates)
+        }
+        errors: Dict[int, BaseException] = {}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.get):
+                    if task.exception() is not None:
+                        errors[tasks[task]] = task.exception()
+                        log.warning(f"[{self.name}] Candidat {tasks[task]} écarté : {task.exception()}")
+                        continue
+                    plan, metadata = task.result()
+                    log.info(f"[{self.name}] Candidat {tasks[task]} gagnant en {time.perf_counter() - started:.1f}s "
+                             f"({len(errors)} échec(s), {len(pending)} annulé(s)).")
+                    race = {"candidates": len(candidates), "winner": tasks[task], "failed": len(errors)}
+                    return plan, {**metadata, "race": race}
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Attendre les perdants : streams fermés, jetons du limiteur rendus, exceptions récupérées
+            await asyncio.gather(*tasks, return_exceptions=True)
+        raise errors[min(errors)]
+
+    async def _checked_plan(
+        self, llm: NeuclidChat, user_prompt: str, temperature: Optional[float]
+    ) -> Tuple[Geometry2DInput, Dict[str, Any]]:
+        """Plan validé, refusé (ValueError) s'il est numériquement dégénéré."""
+        plan, metadata = await self._generate_plan_with(llm, user_prompt, temperature)
+        issues = find_degeneracies(plan)
+        if issues:
+            raise ValueError(f"Degenerate plan: {'; '.join(issues)}")
+        return plan, metadata
+
+    async def _edit_plan(self, user_prompt: str, previous_plan: Any) -> Tuple[Geometry2DInput, Dict[str, Any]]:
+        """
+        Mode édition : le LLM voit le plan précédent (numéroté, au format de sortie) et ne
+        renvoie qu'un patch (ajouts, remplacements, suppressions), appliqué puis revalidé.
+        Les étapes inchangées retrouvent leur traduction dans le cache au rendu.
+        """
+        if not isinstance(previous_plan, Geometry2DInput):
+            previous_plan = Geometry2DInput.model_validate(previous_plan)
+        log.info(f"[{self.name}] Editing a {len(previous_plan.construction_steps)}-step plan: {user_prompt}")
+
+        messages = [SystemMessage(content=self.get_system_message())]
+        if self.guide_token_budget > 0:
+            messages.append(SystemMessage(content=self.get_guide_excerpt(user_prompt)))
+        if self.plan_format == "dsl":
+            # Le plan précédent est montré au format compact : le modèle doit le connaître
+            messages.append(SystemMessage(content=dsl_reference(self.get_selected_step_types(user_prompt))))
+        current_plan = numbered_plan(previous_plan, self.plan_format)
+        messages.append(SystemMessage(content=f"{edit_instructions(self.plan_format)}\n### CURRENT PLAN\n{current_plan}"))
+        messages.append(HumanMessage(content=user_prompt))
+        # Pas de `response_schema` : les étapes du patch sont des objets libres, refusés par Gemini
+        with metrics.stage("geometry_llm"):
+            answer = (await self.llm.ainvoke(messages)).content
+
+        patch = parse_llm_output_to_model(answer, PlanPatch)
+        log.info(f"[{self.name}] Patch reçu : {patch.summary()}")
+        raw_plan = json.dumps(apply_patch(previous_plan, patch), ensure_ascii=False)
+        metadata = {"model_used": self.llm.model_name, "edit": patch.summary()}
+        return await self._validate_plan(self.llm, user_prompt, raw_plan, messages, answer, metadata)
+
+    async def _validate_plan(
+        self, llm: NeuclidChat, user_prompt: str, raw_plan: str, messages: List[BaseMessage], output: str,
+        metadata: Dict[str, Any]
+    ) -> Tuple[Geometry2DInput, Dict[str, Any]]:
+        """
+        Valide le plan JSON ; en cas d'erreurs, ne fait réparer que les étapes fautives,
+        par `llm`, le modèle qui a produit le plan (son tier, avec le model tiering).
+        """
+        try:
+            data_model: Geometry2DInput = parse_llm_output_to_model(
+                raw_plan, Geometry2DInput, context=self.validation_context
+            )
+        except ValidationError as e:
+            # Réparation des seules étapes fautives, au lieu d'un échec (et d'une régénération complète)
+            generation_tokens = sum(estimate_tokens(m.content) for m in messages) + estimate_tokens(output)
+            data_model, repaired_steps = await self._repair_plan(llm, user_prompt, raw_plan, e, generation_tokens)
+            metadata["repaired_steps"] = repaired_steps
+        return data_model, metadata
+
+    async def render(self, plan: Geometry2DInput, metadata: Optional[Dict[str, Any]] = None) -> ToolResult:
         # 4. Generate Figure (Translator)
         # Note: You might need to update `generate_geometry_2d` to return the LaTeX code string too.
         # For now, let's assume it returns the path, and we reconstruct/fetch code differently if needed.
-        image_path, latex_code = generate_geometry_2d(
-            input_data=data_model,
-            show_axes=data_model.figure_config.axes,
-            show_grid=data_model.figure_config.grid
+        # lualatex (subprocess.run, jusqu'à 60 s) tourne dans un thread : la boucle garde ses streams LLM
+        image_path, latex_code, invalidated_steps = await asyncio.to_thread(
+            generate_geometry_2d,
+            input_data=plan,
+            show_axes=plan.figure_config.axes,
+            show_grid=plan.figure_config.grid
         )
-        json_dict = data_model.model_dump()
+        return self._to_result(plan, image_path, latex_code, invalidated_steps, metadata)
+
+    async def render_batch(
+        self, plans: List[Geometry2DInput], metadatas: Optional[List[Dict[str, Any]]] = None
+    ) -> List[ToolResult]:
+        # Variantes : un seul document multi-pages, un seul lualatex (le démarrage domine le coût)
+        metadatas = metadatas or [{} for _ in plans]
+        if len(plans) == 1:
+            return [await self.render(plans[0], metadatas[0])]
+        # Les axes / la grille restent propres à chaque plan (lus dans son `figure_config`)
+        try:
+            outputs = await asyncio.to_thread(generate_geometry_2d_batch, plans)
+        except Exception as e:
+            # Une variante qui ne compile pas (ou un nombre de pages inattendu) ne doit pas
+            # emporter les autres : on retombe sur un rendu par plan et on garde ceux qui passent
+            log.warning(f"[{self.name}] Batch render failed ({e}); rendering the {len(plans)} variants one by one.")
+            return await self._render_each(plans, metadatas)
+        return [
+            self._to_result(plan, image_path, latex_code, invalidated_steps, {**metadata, "batch_size": len(plans)})
+            for plan, metadata, (image_path, latex_code, invalidated_steps) in zip(plans, metadatas, outputs)
+        ]
+
+    async def _render_each(
+        self, plans: List[Geometry2DInput], metadatas: List[Dict[str, Any]]
+    ) -> List[ToolResult]:
+        outcomes = await asyncio.gather(
+            *(self.render(plan, {**metadata, "batch_fallback": True}) for plan, metadata in zip(plans, metadatas)),
+            return_exceptions=True,
+        )
+        results = [outcome for outcome in outcomes if isinstance(outcome, ToolResult)]
+        errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        for error in errors:
+            log.warning(f"[{self.name}] Variant dropped, it does not compile on its own: {error}")
+        if not results:
+            raise errors[0]
+        return results
+
+    def _to_result(
+        self, plan: Geometry2DInput, image_path: Path, latex_code: str, invalidated_steps: List[int],
+        metadata: Optional[Dict[str, Any]]
+    ) -> ToolResult:
+        json_dict = plan.model_dump()
 
         return ToolResult(
             image_url=image_path.name, # On met juste le nom ici, l'API ajoutera "http://localhost..."
@@ -94,7 +424,106 @@ class Geometry2DTool(BaseTool):
             json_content=json_dict,
             tool_name=self.name,
             metadata={
-                "steps_count": len(data_model.construction_steps),
-                "model_used": self.llm.model_name
+                "steps_count": len(plan.construction_steps),
+                "model_used": self.llm.model_name,
+                **(metadata or {}),
+                "invalidated_steps": invalidated_steps
             }
-        )
\ No newline at end of file
+        )
+
+    async def _repair_plan(
+        self, llm: NeuclidChat, user_prompt: str, raw_plan: str, error: ValidationError, generation_tokens: int
+    ) -> Tuple[Geometry2DInput, int]:
+        """
+        Boucle de réparation : relève toutes les erreurs par étape, envoie au LLM ces
+        étapes seules (avec la doc de leurs briques) et recolle les corrections.
+        Renvoie (plan valide, nombre d'étapes réparées) ; relève l'erreur d'origine sinon.
+        """
+        try:
+            document = extract_json_from_text(raw_plan)
+        except ValueError:
+            raise error
+        raw_steps = document.get("construction_steps") if isinstance(document, dict) else None
+        if self.repair_rounds <= 0 or not isinstance(raw_steps, list):
+            raise error
+
+        started = time.perf_counter()
+        repair_tokens = repaired = 0
+        guide = get_guide_retriever(prompt_manager.load_template(self.guide_path))
+        for round_number in range(1, self.repair_rounds + 1):
+            issues, defined_ids = find_step_issues(raw_steps)
+            if not issues:
+                break  # Erreur hors étapes (cycle, figure_config...) : rien à cibler
+            log.info(f"[{self.name}] Réparation {round_number}/{self.repair_rounds} : "
+                     f"{len(issues)}/{len(raw_steps)} étape(s) à corriger.")
+            reference = guide.build_step_reference(
+                [issue.step_type for issue in issues], user_prompt, self.guide_token_budget or 2000
+            )
+            messages = [
+                SystemMessage(content=REPAIR_SYSTEM_PROMPT),
+                SystemMessage(content=f"### CONSTRUCTION STEPS REFERENCE (relevant excerpt)\n{reference}"),
+                HumanMessage(content=build_repair_request(user_prompt, issues, defined_ids)),
+            ]
+            try:
+                # Pas de `response_schema` : étapes libres (`Dict[str, Any]`), comme pour le patch
+                with metrics.stage("repair_llm"):
+                    answer = (await llm.ainvoke(messages)).content
+                repair_tokens += sum(estimate_tokens(m.content) for m in messages) + estimate_tokens(answer)
+                repair = parse_llm_output_to_model(answer, PlanRepair)
+            except (ValidationError, ValueError) as e:
+                log.warning(f"[{self.name}] Réponse de réparation inutilisable : {e}")
+                break
+            raw_steps = splice_repairs(raw_steps, issues, repair)
+            repaired += len(issues)
+            try:
+                plan = Geometry2DInput.model_validate(
+                    {**document, "construction_steps": raw_steps}, context=self.validation_context
+                )
+            except ValidationError as e:
+                error = e
+                continue
+            self.repair_stats.record(True, repaired, repair_tokens, generation_tokens, time.perf_counter() - started)
+            return plan, repaired
+
+        self.repair_stats.record(False, repaired, repair_tokens, generation_tokens, time.perf_counter() - started)
+        raise error
+
+    async def _stream_plan(
+        self,
+        llm: NeuclidChat,
+        messages: List[BaseMessage],
+        response_schema: Optional[Dict[str, Any]] = None,
+        parser: Optional[StreamingArrayParser | StreamingDslParser] = None,
+        temperature: Optional[float] = None,
+    ) -> Tuple[str, int]:
+        """
+        Streame la réponse du LLM. Chaque étape de `construction_steps` est validée
+        et pré-traduite dès que son accolade fermante arrive (la traduction finale
+        relit alors le cache), et on coupe le stream dès que l'objet JSON racine est
+        complet : les tokens de politesse qui suivent ne sont ni attendus ni payés.
+        Renvoie (texte brut, nombre d'étapes pré-traduites).
+        `parser` : StreamingDslParser pour le format compact (JSON par défaut).
+        `temperature` : remplace celle du modèle pour cet appel (variantes).
+        """
+        parser = parser or StreamingArrayParser("construction_steps")
+        pretranslator = StepPretranslator()
+        step_adapter = get_type_adapter(discriminated_step_type())
+
+        sampling = {} if temperature is None else {"temperature": temperature}
+        with metrics.stage("geometry_llm"):
+            async with aclosing(llm.astream(messages, response_schema=response_schema, **sampling)) as stream:
+                async for chunk in stream:
+                    for raw_step in parser.feed(chunk.content):
+                        try:
+                            step = step_adapter.validate_python(raw_step)
+                        except ValidationError as e:
+                            # Le parse final remontera l'erreur complète
+                            log.debug(f"[{self.name}] Étape streamée invalide : {e}")
+                            continue
+                        pretranslator.feed(step)
+                    if parser.closed:
+                        log.info(f"[{self.name}] Plan complet, arrêt du stream LLM.")
+                        break
+
+        log.info(f"[{self.name}] {pretranslator.translated} étape(s) pré-traduite(s) pendant la génération.")
+        return parser.document, pretranslator.translated
\ No newline at end of file
@@ -1,13 +1,18 @@
 # backend/src/features/geometry/translator.py
 
 import dis
+import hashlib
 import logging
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any,Tuple,Optional,List
+from typing import Dict, Any,Tuple,Optional,List, Callable, Iterator
 
 # --- Nos importations locales ---
 from .models import (
-    Geometry2DInput, Style,
+    Geometry2DInput, Style, collect_step_ids, step_models,
     DefinePointByCoords, 
     DefineMidPoint,
     DefineLineByPoints, 
@@ -75,10 +80,92 @@ from .models import (
 )
 
 # Le compilateur LaTeX
-from src.core.latex_compiler import compile_latex_to_image
+from src.core.latex_compiler import compile_latex_to_image, compile_latex_to_images
 
 log = logging.getLogger(__name__)
 
+# ==============================================================================
+#                 CACHE INCRÉMENTAL DES FRAGMENTS PAR ÉTAPE
+# ==============================================================================
+
+# Mémoires internes du traducteur qu'une étape peut alimenter pour les suivantes.
+TRANSLATOR_MEMORY_ATTRS = ('defined_lines', 'defined_circles', 'defined_calculations', 'point_construction_methods')
+
+
+@dataclass(frozen=True)
+class CachedFragment:
+    """Lignes LaTeX d'une étape et écritures qu'elle a faites dans les mémoires du traducteur."""
+    lines: Tuple[str, ...]
+    memory: Dict[str, Dict[str, Any]]
+
+
+class TranslationCache:
+    """
+    Cache LRU des fragments LaTeX, indexé par le hash structurel d'une étape et
+    des étapes qui ont créé les IDs qu'elle utilise (hash de type Merkle) :
+    modifier une étape invalide aussi toutes celles qui en dépendent, et elles seules.
+    Partagé entre la boucle (pré-traduction du stream) et les threads de rendu : verrouillé.
+    """
+    def __init__(self, max_entries: int = 20_000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedFragment]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[CachedFragment]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: CachedFragment):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Chaînes d'une étape sérialisée en JSON (valeurs et clés) : candidates au rôle d'ID référencé
+_JSON_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+
+class _MemoryDict(dict):
+    """
+    Mémoire du traducteur (`TRANSLATOR_MEMORY_ATTRS`) qui note ses écritures dans
+    `journal` quand il est ouvert : le cache récupère ce qu'une étape a écrit sans
+    recopier toute la mémoire avant chaque étape (coût quadratique sur les grands plans).
+    """
+    def __init__(self):
+        super().__init__()
+        self.journal: Optional[Dict[str, Any]] = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if self.journal is not None:
+            self.journal[key] = value
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
 # ==============================================================================
 #                      LA CLASSE DU TRADUCTEUR GÉOMÉTRIQUE
 # ==============================================================================
@@ -87,23 +174,46 @@ class TkzEuclideTranslator:
     Traduit un objet Geometry2DInput sémantique et validé en un code LaTeX
     robuste utilisant le package tkz-euclide.
     """
-    def __init__(self, input_data: Geometry2DInput, show_axes: bool, show_grid: bool):
+    def __init__(self, input_data: Geometry2DInput, show_axes: bool, show_grid: bool,
+                 cache: Optional[TranslationCache] = None):
         self.data = input_data
         self.show_axes = show_axes
         self.show_grid = show_grid
         self.latex_parts = []
-        self.defined_lines = {}
-        self.defined_circles = {} # NOTRE  MEMOIRE INTERNE POUR STOCKER LES DEFS DES CERCLES
-        self.defined_calculations = {}
+        self.defined_lines = _MemoryDict()
+        self.defined_circles = _MemoryDict() # NOTRE  MEMOIRE INTERNE POUR STOCKER LES DEFS DES CERCLES
+        self.defined_calculations = _MemoryDict()
         # Elle stockera la "recette de construction" de chaque point.
-        self.point_construction_methods = {}
+        self.point_construction_methods = _MemoryDict()
+        # Index ID -> étape de définition (évite de re-parcourir tout le plan à chaque recherche).
+        self.steps_by_id = {}
+        for step in input_data.construction_steps:
+            self._index_step(step)
+        # Cache incrémental (optionnel) et rapport de la dernière traduction.
+        self.cache = cache
+        self.step_keys = {}          # ID créé -> clé de cache de l'étape qui l'a créé
+        self.invalidated_steps = []  # Index (0-based) des étapes réellement retraduites
 
     def translate(self) -> str:
         """Méthode principale qui orchestre la traduction."""
+        return "\n".join(self.iter_lines())
+
+    def iter_lines(self) -> Iterator[str]:
+        """
+        Version générateur de `translate` : produit les lignes LaTeX au fur et à mesure
+        (en-tête, puis chaque étape, puis la fin) sans accumuler tout le corps en mémoire.
+        """
         self._build_header()
-        self._execute_construction_steps()
+        yield from self._flush_parts()
+        for index, step in enumerate(self.data.construction_steps):
+            yield from self._translate_step_cached(index, step)
         self._build_footer()
-        return "\n".join(self.latex_parts)
+        yield from self._flush_parts()
+
+    def _flush_parts(self) -> List[str]:
+        """Rend les lignes produites depuis le dernier appel et vide le tampon."""
+        parts, self.latex_parts = self.latex_parts, []
+        return parts
     
     #======================================================================================================
     # helper methods
@@ -119,6 +229,12 @@ class TkzEuclideTranslator:
     #     if not step: log.error(f"Impossible de trouver la définition de la ligne ID '{line_id}'")
     #     return step
     
+    def _index_step(self, step: Any):
+        """Enregistre l'étape dans l'index si elle porte un `id` (la première définition gagne)."""
+        step_id = getattr(step, 'id', None)
+        if step_id is not None and step_id not in self.steps_by_id:
+            self.steps_by_id[step_id] = step
+
     def _style_to_str(self, style: Style) -> str:
         """Convertit un objet Style en une chaîne d'options."""
         parts = [style.color]
@@ -132,11 +248,7 @@ class TkzEuclideTranslator:
         C'est crucial pour le dessin car cela nous donne accès à toutes
         les informations de l'étape de définition (comme le through_point).
         """
-        for step in self.data.construction_steps:
-            # On vérifie si l'étape a un attribut 'id' et s'il correspond
-            if hasattr(step, 'id') and step.id == line_id:
-                return step
-        return None
+        return self.steps_by_id.get(line_id)
     
     def _find_line_ref_points(self, line_id: str) -> Tuple[str, str]:
         step = self._find_line_def_step(line_id)
@@ -181,10 +293,9 @@ class TkzEuclideTranslator:
     
     def _get_coords_by_id(self, point_id: str) -> Optional[Tuple[float, float]]:
         """Helper pour retrouver les coordonnées d'un point déjà défini."""
-        for step in self.data.construction_steps:
-            if hasattr(step, 'id') and step.id == point_id:
-                if hasattr(step, 'coords'):
-                    return step.coords
+        step = self.steps_by_id.get(point_id)
+        if step is not None and hasattr(step, 'coords'):
+            return step.coords
         return None # Devrait être trouvé par le validateur, mais sécurité
 
     def _build_drawing_options(self, style: Optional["Style"], base_options: List[str] = None) -> str:
@@ -222,11 +333,54 @@ class TkzEuclideTranslator:
         """Construit la fin de l'environnement LaTeX."""
         self.latex_parts.append(r"\end{tikzpicture}")
 
-    def _execute_construction_steps(self):
-        """Boucle sur les étapes et appelle la méthode de traduction correspondante."""
-        for step in self.data.construction_steps:
-            translator_method = getattr(self, f"_translate_{step.type}", self._translate_unknown)
-            translator_method(step)
+    def _translate_step(self, step: Any):
+        """Appelle le traducteur enregistré pour le type de l'étape."""
+        handler = STEP_TRANSLATORS.get(step.type)
+        if handler is not None:
+            handler(self, step)
+        else:
+            getattr(self, f"_translate_{step.type}", self._translate_unknown)(step)
+
+    def _translate_step_cached(self, index: int, step: Any) -> List[str]:
+        """
+        Traduit une étape en réutilisant son fragment si ni elle ni ses dépendances
+        n'ont changé. Sur un succès de cache, on rejoue aussi ses écritures mémoire
+        (lignes, cercles, calculs...) pour que les étapes suivantes restent correctes.
+        """
+        if self.cache is None:
+            self._translate_step(step)
+            self.invalidated_steps.append(index)
+            return self._flush_parts()
+
+        key = self._step_cache_key(step)
+        entry = self.cache.get(key)
+        if entry is None:
+            memories = {name: getattr(self, name) for name in TRANSLATOR_MEMORY_ATTRS}
+            for journaled in memories.values():
+                journaled.journal = {}
+            try:
+                self._translate_step(step)
+            finally:
+                memory = {name: journaled.journal for name, journaled in memories.items() if journaled.journal}
+                for journaled in memories.values():
+                    journaled.journal = None
+            entry = CachedFragment(lines=tuple(self._flush_parts()), memory=memory)
+            self.cache.put(key, entry)
+            self.invalidated_steps.append(index)
+        else:
+            for name, written in entry.memory.items():
+                getattr(self, name).update(written)
+
+        created_ids, _ = collect_step_ids(step)
+        for new_id in created_ids:
+            self.step_keys[new_id] = key
+        return list(entry.lines)
+
+    def _step_cache_key(self, step: Any) -> str:
+        """Hash structurel de l'étape + clés des étapes qui ont créé les IDs qu'elle mentionne."""
+        payload = step.model_dump_json()
+        dependency_keys = sorted({self.step_keys[v] for v in _JSON_STRING.findall(payload) if v in self.step_keys})
+        return hashlib.sha1("\n".join([payload, *dependency_keys]).encode("utf-8")).hexdigest()
     
     def _translate_unknown(self, step: Any):
         log.warning(f"Action de construction non reconnue ou non implémentée : '{step.type}'")
@@ -1358,6 +1512,56 @@ class TkzEuclideTranslator:
         self.latex_parts.append(f"    \\tkzDefPointBy[translation=from {vec_start_name} to {vec_end_name}]({p_e}) \\tkzGetPoint{{{p_h}}}")
 
 
+# ==============================================================================
+#                 REGISTRE DES TRADUCTEURS D'ÉTAPES
+# ==============================================================================
+# Traducteur d'un type d'étape : la méthode `_translate_<type>` du traducteur (une
+# sous-classe peut la surcharger), sauf si un traducteur a été enregistré pour ce type
+# avec `register_step_translator` — c'est le cas des étapes tierces, ajoutées à
+# `Geometry2DInput` par `models.register_step_model`.
+# Un traducteur est un callable `(translator, step) -> None` qui ajoute ses lignes
+# dans `translator.latex_parts`.
+StepTranslator = Callable[[TkzEuclideTranslator, Any], None]
+
+STEP_TRANSLATORS: Dict[str, StepTranslator] = {}
+
+
+def register_step_translator(step_type: str) -> Callable[[StepTranslator], StepTranslator]:
+    """
+    Décorateur pour enregistrer le traducteur d'un type d'étape : une étape tierce
+    (voir `models.register_step_model`) ou une variante du rendu d'une étape existante.
+
+        @register_step_translator("draw_star")
+        def translate_draw_star(translator, step):
+            translator.latex_parts.append(...)
+    """
+    def decorator(handler: StepTranslator) -> StepTranslator:
+        if step_type in STEP_TRANSLATORS or hasattr(TkzEuclideTranslator, f"_translate_{step_type}"):
+            log.warning(f"Le traducteur de l'étape '{step_type}' est écrasé.")
+        STEP_TRANSLATORS[step_type] = handler
+        return handler
+    return decorator
+
+
+def validate_step_translators() -> None:
+    """
+    Vérifie que chaque type d'étape connu (`models.step_models`) possède un traducteur.
+    Appelée à l'import : un oubli fait échouer le démarrage au lieu de produire
+    silencieusement un "% Action ignorée" à l'exécution. Un plugin l'appelle après
+    avoir enregistré son étape et son traducteur.
+    """
+    step_types = {model.model_fields["type"].default for model in step_models()}
+    missing = sorted(
+        step_type for step_type in step_types
+        if step_type not in STEP_TRANSLATORS and not hasattr(TkzEuclideTranslator, f"_translate_{step_type}")
+    )
+    if missing:
+        raise RuntimeError(f"Aucun traducteur LaTeX enregistré pour les étapes : {', '.join(missing)}")
+
+
+validate_step_translators()
+
+
 # todo: lors de l'ecriture du guide; penser a mettre un champ sur l'intention du user afin de guider le llm
 
 """
@@ -1389,37 +1593,161 @@ GEOMETRY_POSTAMBLE = r"""
 \end{document}
 """
 
+# Variante multi-pages : une page par tikzpicture (plusieurs figures, une seule compilation)
+GEOMETRY_BATCH_PREAMBLE = GEOMETRY_PREAMBLE.replace("[preview, border=1mm]", "[multi=tikzpicture, border=1mm]")
+
+
+def iter_geometry_document(translator: TkzEuclideTranslator) -> Iterator[str]:
+    """
+    Produit le document LaTeX complet (préambule + figure + fin) morceau par morceau,
+    prêt à être écrit dans un fichier ou un pipe. La concaténation des morceaux est
+    identique à `GEOMETRY_PREAMBLE + translator.translate() + GEOMETRY_POSTAMBLE`.
+    """
+    yield GEOMETRY_PREAMBLE
+    for line in translator.iter_lines():
+        yield f"{line}\n"
+    yield GEOMETRY_POSTAMBLE.lstrip("\n")
+
 # ==============================================================================
 #                      LA FONCTION PUBLIQUE DE L'OUTIL
 # ==============================================================================
 
+# Cache partagé entre les requêtes : les clés sont des hashs de contenu, donc sûres
+# à réutiliser d'un plan (ou d'un utilisateur) à l'autre.
+translation_cache = TranslationCache()
+
+
+class StepPretranslator:
+    """
+    Traduit les étapes au fur et à mesure qu'elles sortent du stream LLM, à seule fin
+    de remplir le cache : la traduction finale (`generate_geometry_2d`) ne fait plus
+    que relire les fragments. On s'arrête à la première étape qui référence un ID
+    encore inconnu (plan dans le désordre) : la suite sera traduite à la fin.
+    """
+    def __init__(self, cache: TranslationCache = translation_cache):
+        empty_plan = Geometry2DInput.model_construct(construction_steps=[])
+        self.translator = TkzEuclideTranslator(empty_plan, show_axes=False, show_grid=False, cache=cache)
+        self.defined_ids = set()
+        self.translated = 0
+        self.stopped = False
+
+    def feed(self, step: Any) -> bool:
+        """Pré-traduit une étape validée. Renvoie False si elle a été laissée de côté."""
+        if self.stopped:
+            return False
+        created_ids, referenced_ids = collect_step_ids(step)
+        if any(ref not in self.defined_ids for ref in referenced_ids) or \
+                any(new_id in self.defined_ids for new_id in created_ids):
+            log.debug(f"Pré-traduction arrêtée à l'étape {self.translated + 1} ('{step.type}').")
+            self.stopped = True
+            return False
+        try:
+            self.translator._index_step(step)
+            self.translator._translate_step_cached(self.translated, step)
+        except Exception as e:
+            log.warning(f"Pré-traduction de l'étape {self.translated + 1} impossible : {e}")
+            self.stopped = True
+            return False
+        self.defined_ids.update(created_ids)
+        self.translated += 1
+        return True
+
+
 def generate_geometry_2d(
     input_data: Geometry2DInput, 
     show_axes: bool = False, 
-    show_grid: bool = False
-) -> Tuple[Path, str]:
+    show_grid: bool = False,
+    cache: Optional[TranslationCache] = translation_cache
+) -> Tuple[Path, str, List[int]]:
     """Fonction principale de l'outil de géométrie 2D (Sprint 1 - Points et Lignes).
     Args:
         input_data (Geometry2DInput): Les données d'entrée validées par Pydantic.
         show_axes (bool): Si True, dessine les axes du repère.
         show_grid (bool): Si True, dessine la grille du repère.
-    
+        cache (TranslationCache): Cache des fragments par étape (None pour le désactiver).
+    Returns:
+        (chemin de l'image, code LaTeX complet, index des étapes retraduites)
     """
     log.info("Début de la génération de la figure de géométrie 2D.")
     
     try:
-        translator = TkzEuclideTranslator(input_data, show_axes=show_axes, show_grid=show_grid)
-        body_code = translator.translate()
-        log.info("Traduction en code LaTeX (tkz-euclide) réussie.")
-        log.debug(f"Code LaTeX généré : \n{body_code}")
-
-        # on construit le fichier entier maintenant.
-        full_source_code = GEOMETRY_PREAMBLE + body_code + GEOMETRY_POSTAMBLE
-        
-        image_path = compile_latex_to_image(full_source_code)
+        translator = TkzEuclideTranslator(input_data, show_axes=show_axes, show_grid=show_grid, cache=cache)
+
+        # La traduction est écrite directement dans le fichier .tex au fil de l'eau ;
+        # on garde une copie des morceaux pour renvoyer le code source à l'éditeur.
+        chunks: List[str] = []
+
+        def stream_document() -> Iterator[str]:
+            for chunk in iter_geometry_document(translator):
+                chunks.append(chunk)
+                yield chunk
+
+        image_path = compile_latex_to_image(stream_document())
+        full_source_code = "".join(chunks)
+        invalidated = translator.invalidated_steps
+        log.info(
+            f"Traduction en code LaTeX (tkz-euclide) réussie : {len(invalidated)}/"
+            f"{len(input_data.construction_steps)} étape(s) retraduite(s)."
+        )
+        log.debug(f"Code LaTeX généré : \n{full_source_code}")
         log.info(f"Compilation LaTeX réussie. Image : {image_path}")
-        return image_path, full_source_code 
+        return image_path, full_source_code, invalidated
         
     except Exception as e:
         log.error(f"Échec dans le workflow de l'outil de géométrie : {e}", exc_info=True)
-        raise e
\ No newline at end of file
+        raise e
+
+
+def generate_geometry_2d_batch(
+    plans: List[Geometry2DInput],
+    cache: Optional[TranslationCache] = translation_cache
+) -> List[Tuple[Path, str, List[int]]]:
+    """Plusieurs figures (ex: variantes d'un même prompt) compilées en un seul passage lualatex.
+    Chaque plan garde sa propre traduction, axes et grille compris (`figure_config`, comme
+    pour `generate_geometry_2d`) ; le document commun a une page par figure.
+    Returns:
+        Pour chaque plan, dans l'ordre : (chemin de l'image, code LaTeX autonome, étapes retraduites)
+    """
+    log.info(f"Génération groupée de {len(plans)} figure(s) de géométrie 2D.")
+
+    try:
+        translators = [
+            TkzEuclideTranslator(
+                plan, show_axes=plan.figure_config.axes, show_grid=plan.figure_config.grid, cache=cache
+            )
+            for plan in plans
+        ]
+        postamble = GEOMETRY_POSTAMBLE.lstrip("\n")
+        # Comme pour une figure seule, la traduction se fait pendant l'écriture du .tex :
+        # l'étape "translation" n'est mesurée qu'à un endroit (compile_latex_to_images)
+        bodies: List[List[str]] = [[] for _ in plans]
+
+        # Chaque figure est dans son propre groupe TeX : couleurs, styles et macros définis
+        # localement (\tkzSetUpPoint, \pgfmathsetmacro...) ne fuient pas dans la suivante.
+        # Les noms de nœuds tikz restent globaux, mais un plan validé définit chacun de ses
+        # ids avant de s'en servir : un nom laissé par la figure précédente n'est jamais lu.
+        def stream_document() -> Iterator[str]:
+            yield GEOMETRY_BATCH_PREAMBLE
+            for translator, body in zip(translators, bodies):
+                yield "\\begingroup\n"
+                for line in translator.iter_lines():
+                    body.append(f"{line}\n")
+                    yield body[-1]
+                yield "\\endgroup\n"
+            yield postamble
+
+        image_paths = compile_latex_to_images(stream_document())
+        if len(image_paths) != len(plans):
+            raise RuntimeError(f"LaTeX batch produced {len(image_paths)} page(s) for {len(plans)} figure(s).")
+
+        # Le code renvoyé à l'éditeur reste un document autonome par figure
+        results = [
+            (image_path, GEOMETRY_PREAMBLE + "".join(body) + postamble, translator.invalidated_steps)
+            for image_path, body, translator in zip(image_paths, bodies, translators)
+        ]
+        log.info(f"Compilation groupée réussie : {len(results)} image(s).")
+        return results
+
+    except Exception as e:
+        log.error(f"Échec de la génération groupée : {e}", exc_info=True)
+        raise e
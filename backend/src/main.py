@@ -9,6 +9,7 @@ from src.config import settings
 from src.firebase_setup import initialize_firebase
 
 from src.core.startup import register_application_tools
+from src.core.llm_client import aclose_http_clients, install_http_clients
 
 from src.api.v1 import generation
 from src.api.v1 import compilation
@@ -36,11 +37,15 @@ async def lifespan(app: FastAPI):
     # 2. Enregistrement des Outils (Factory Pattern)
     # C'est ici que la magie opère : on charge Geometry2D, etc.
     register_application_tools()
+
+    # 3. Pool HTTP commun à tous les appels LLM
+    install_http_clients()
     
     yield
     
     # --- CODE EXÉCUTÉ À L'ARRÊT ---
     log.info("🛑 Arrêt de NEUCLID API...")
+    await aclose_http_clients()
 
 
 
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class PersistentLRUCache:
+    """
+    Cache clé -> texte (JSON en pratique) à deux niveaux :
+      - un LRU en mémoire (`max_entries`) pour les requêtes chaudes ;
+      - une table SQLite qui survit aux redémarrages (`path=None` pour s'en passer).
+    Chaque entrée expire `ttl_seconds` après son écriture. Le fichier SQLite n'est
+    ouvert qu'au premier accès : importer le module (singletons) ne crée rien sur disque.
+    La table garde au plus `max_entries` lignes (les plus anciennes partent d'abord) et
+    les entrées expirées sont purgées toutes les `PURGE_EVERY` écritures.
+    Depuis du code async, passer par `aget` / `aput` : l'accès SQLite (et le verrou)
+    se fait alors dans un thread, sans bloquer la boucle d'événements.
+    """
+    PURGE_EVERY = 100
+
+    def __init__(self, path: Optional[Path], max_entries: int = 2000, ttl_seconds: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._opened = path is None
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _database(self) -> Optional[sqlite3.Connection]:
+        """Connexion SQLite (ouverte au premier appel), None en mémoire seule. Appelé sous `_lock`."""
+        if not self._opened:
+            self._opened = True
+            self._open(self.path)
+        return self._db
+
+    def _open(self, path: Path):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_created_at ON entries (created_at)")
+            self._purge_expired(self._db)
+            self._trim(self._db)
+            self._db.commit()
+        except sqlite3.Error as e:
+            # Le cache reste utilisable en mémoire seule
+            log.error(f"Persistent cache unavailable at {path}: {e}")
+            self._db = None
+
+    def _purge_expired(self, db: sqlite3.Connection):
+        db.execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+    def _trim(self, db: sqlite3.Connection):
+        """Ne garde que les `max_entries` lignes les plus récentes."""
+        db.execute(
+            "DELETE FROM entries WHERE key IN "
+            "(SELECT key FROM entries ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def _expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            db = self._database()
+            if entry is None and db is not None:
+                row = db.execute("SELECT created_at, value FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._remember(key, entry)
+            if entry is None or self._expired(entry[0]):
+                if entry is not None:
+                    self._delete(key)
+                self.misses += 1
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: str):
+        entry = (time.time(), value)
+        with self._lock:
+            self._remember(key, entry)
+            db = self._database()
+            if db is not None:
+                try:
+                    db.execute(
+                        "INSERT OR REPLACE INTO entries (key, value, created_at) VALUES (?, ?, ?)",
+                        (key, value, entry[0]),
+                    )
+                    self._trim(db)
+                    self._writes += 1
+                    if self._writes % self.PURGE_EVERY == 0:
+                        self._purge_expired(db)
+                    db.commit()
+                except sqlite3.Error as e:
+                    log.warning(f"Could not persist cache entry: {e}")
+
+    async def aget(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, value: str):
+        await asyncio.to_thread(self.put, key, value)
+
+    def _remember(self, key: str, entry: Tuple[float, str]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _delete(self, key: str):
+        self._memory.pop(key, None)
+        db = self._database()
+        if db is not None:
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            db = self._database()
+            if db is not None:
+                db.execute("DELETE FROM entries")
+                db.commit()
+
+    def __len__(self) -> int:
+        return len(self._memory)
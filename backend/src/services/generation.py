@@ -1,34 +1,221 @@
+import asyncio
 import logging
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.config import settings
+from src.core import metrics
+from src.core.llm_client import llm_client
 from src.core.router_tools import router_service
 from src.core.registry import tool_registry
-from src.core.base_tool import ToolResult
+from src.core.base_tool import BaseTool, ToolResult
+from src.services.plan_cache import plan_cache
+from src.services.result_store import result_store
 
 log = logging.getLogger(__name__)
 
 class GenerationService:
     """
     Main entry point for the API.
-    Orchestrates the flow: Prompt -> Router -> Tool -> Result.
+    Orchestrates the flow: Prompt -> (Plan cache) -> Router -> Tool -> Result.
     """
-    
-    async def generate(self, user_prompt: str) -> ToolResult:
-        log.info("🚀 Starting Generation Workflow...")
-        
-        # 1. Ask the Router which tool to use
-        tool_name = await router_service.route_request(user_prompt)
-        log.info(f"🎯 Router selected: {tool_name}")
 
-        # 2. Get the tool instance
+    def __init__(self):
+        self.plan_cache = plan_cache if settings.PLAN_CACHE_ENABLED else None
+        self.speculative = settings.SPECULATIVE_GENERATION
+        self.results = result_store
+        self.max_variants = settings.GENERATION_MAX_VARIANTS
+        self.variant_temperature = settings.GENERATION_VARIANT_TEMPERATURE
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Aggregated counters since startup: per-stage timings, routing, LLM client and each tool."""
+        return {
+            "metrics": metrics.metrics_sink.snapshot(),
+            "router": router_service.stats.snapshot(),
+            "llm_client": llm_client.snapshot(),
+            "tools": {tool.name: tool.snapshot() for tool in tool_registry.get_all_tools()},
+        }
+
+    async def generate(
+        self, user_prompt: str, previous_result_id: Optional[str] = None, use_plan_cache: bool = True
+    ) -> ToolResult:
+        """
+        Generates a figure. With `previous_result_id`, the prompt edits that result
+        (same tool, previous plan as context) instead of starting from scratch.
+        `use_plan_cache=False` plans the prompt again even if it was cached (the new plan
+        then replaces the cached one).
+        Every result gets a `result_id` that a follow-up request can pass back,
+        and per-stage timings / LLM usage in `metadata["metrics"]`.
+        """
+        with metrics.track_request() as request_metrics:
+            if previous_result_id:
+                result = await self._edit(user_prompt, previous_result_id)
+            else:
+                result = await self._generate(user_prompt, use_plan_cache)
+            result.result_id = await self.results.save(result, user_prompt)
+            result.metadata["metrics"] = request_metrics.snapshot()
+        return result
+
+    async def generate_variants(self, user_prompt: str, variants: int) -> List[ToolResult]:
+        """
+        N variants of the same figure (e.g. a 4-up grid): routed once, N plans requested
+        concurrently, invalid or duplicate ones dropped, survivors rendered together
+        (one LaTeX compilation for tools that support it). Raises if no variant survives.
+        """
+        if not 1 <= variants <= self.max_variants:
+            raise ValueError(f"variants must be between 1 and {self.max_variants} (got {variants}).")
+        with metrics.track_request() as request_metrics:
+            results = await self._generate_variants(user_prompt, variants)
+            # Mesures de la requête entière, partagées par toutes les variantes
+            snapshot = request_metrics.snapshot()
+            for result in results:
+                result.metadata["metrics"] = snapshot
+        return results
+
+    async def _generate_variants(self, user_prompt: str, variants: int) -> List[ToolResult]:
+        log.info(f"🚀 Starting Generation Workflow ({variants} variants)...")
+
+        # 1. One routing decision for all variants (the speculative plan becomes the first one)
+        tool, speculative_plan = await self._route(user_prompt)
+        log.info(f"🎯 Router selected: {tool.name}")
+
+        if tool.cache_version is None:
+            # Outil sans plan exposé : N exécutions complètes, rendues chacune de leur côté
+            outcomes = await asyncio.gather(*(tool.run(user_prompt) for _ in range(variants)), return_exceptions=True)
+            results = self._survivors(outcomes)
+        else:
+            # 2. N plans at once; only the first one keeps the tool's own temperature
+            first = speculative_plan or tool.generate_plan(user_prompt)
+            others = (
+                tool.generate_plan(user_prompt, context={"temperature": self.variant_temperature})
+                for _ in range(variants - 1)
+            )
+            planned = self._survivors(await asyncio.gather(first, *others, return_exceptions=True))
+
+            # 3. Identical plans would give identical images
+            plans, metadatas, seen = [], [], set()
+            for index, (plan, metadata) in enumerate(planned):
+                key = json.dumps(plan.model_dump(mode="json"), sort_keys=True)
+                if key in seen:
+                    continue
+                seen.add(key)
+                plans.append(plan)
+                metadatas.append({**metadata, "variant": index})
+            log.info(f"🧩 {len(plans)}/{variants} distinct valid plan(s), rendering together")
+            results = await tool.render_batch(plans, metadatas)
+
+        for result in results:
+            result.result_id = await self.results.save(result, user_prompt)
+        log.info(f"✅ {len(results)} variant(s) generated via {tool.name}")
+        return results
+
+    @staticmethod
+    def _survivors(outcomes: list) -> list:
+        """Successful outcomes of a gather(return_exceptions=True); re-raises the first error if none."""
+        survivors = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+        errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        for error in errors:
+            log.warning(f"⚠️ Variant dropped: {error}")
+        if not survivors:
+            raise errors[0]
+        return survivors
+
+    async def _edit(self, user_prompt: str, previous_result_id: str) -> ToolResult:
+        log.info(f"✏️ Editing result {previous_result_id}...")
+        previous = await self.results.load(previous_result_id)
+        if previous is None:
+            raise ValueError(f"Unknown or expired previous_result_id: {previous_result_id}")
+        tool_name, previous_plan = previous
         tool = tool_registry.get_tool(tool_name)
+        if tool.cache_version is not None:
+            plan, metadata = await tool.generate_plan(user_prompt, context={"previous_plan": previous_plan})
+            result = await tool.render(plan, {**metadata, "previous_result_id": previous_result_id})
+        else:
+            result = await tool.run(user_prompt, context={"previous_plan": previous_plan})
+        log.info(f"✅ Edit successful via {tool.name}")
+        return result
 
-        # 3. Execute the tool
+    async def _generate(self, user_prompt: str, use_plan_cache: bool = True) -> ToolResult:
+        log.info("🚀 Starting Generation Workflow...")
+
+        # 0. Same prompt (up to whitespace) already planned? Skip both LLM calls.
+        if self.plan_cache is not None and use_plan_cache:
+            cached = await self.plan_cache.lookup(user_prompt)
+            if cached is not None:
+                tool, plan = cached
+                log.info(f"♻️ Plan cache hit: {tool.name}")
+                result = await tool.render(plan, {"plan_cache": "hit"})
+                log.info(f"✅ Generation successful via {tool.name} (cached plan)")
+                return result
+
+        # 1. Ask the Router which tool to use (the likely tool may already be planning)
+        tool, speculative_plan = await self._route(user_prompt)
+        log.info(f"🎯 Router selected: {tool.name}")
+
+        # 2. Execute the tool
         try:
-            result = await tool.run(user_prompt)
-            log.info(f"✅ Generation successful via {tool_name}")
+            if speculative_plan is not None:
+                plan, metadata = await speculative_plan
+                metadata = {**metadata, "speculation": "hit"}
+            elif tool.cache_version is not None:
+                plan, metadata = await tool.generate_plan(user_prompt)
+            else:
+                result = await tool.run(user_prompt)
+                log.info(f"✅ Generation successful via {tool.name}")
+                return result
+
+            if self.plan_cache is not None:
+                metadata = {**metadata, "plan_cache": "miss" if use_plan_cache else "bypass"}
+            result = await tool.render(plan, metadata)
+            # Mis en cache seulement une fois rendu : un plan qui ne compile pas ne doit pas resservir
+            if self.plan_cache is not None:
+                await self.plan_cache.store_plan(user_prompt, tool, plan)
+            log.info(f"✅ Generation successful via {tool.name}")
             return result
         except Exception as e:
             log.error(f"❌ Tool execution failed: {e}")
             raise e
 
+    async def _route(self, user_prompt: str) -> Tuple[BaseTool, Optional[asyncio.Task]]:
+        """
+        Routes the prompt. When the LLM router is needed, the historically most
+        likely tool starts planning at the same time (speculative execution):
+        its task is returned if the router agrees, cancelled otherwise.
+        """
+        prediction = router_service.route_locally(user_prompt)
+        candidate = None if router_service.is_confident(prediction) else self._speculation_candidate(prediction)
+        if candidate is None:
+            return tool_registry.get_tool(await router_service.route_request(user_prompt)), None
+
+        log.info(f"🔮 Speculatively planning with {candidate.name} while the router decides")
+        plan_task = asyncio.create_task(candidate.generate_plan(user_prompt))
+        # Évite "Task exception was never retrieved" si la tâche annulée avait déjà échoué
+        plan_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        try:
+            tool_name = await router_service.route_with_llm(user_prompt)
+        except BaseException:
+            plan_task.cancel()
+            raise
+
+        hit = tool_name == candidate.name
+        router_service.stats.record_speculation(hit)
+        if not hit:
+            plan_task.cancel()
+            return tool_registry.get_tool(tool_name), None
+        return candidate, plan_task
+
+    def _speculation_candidate(self, prediction) -> Optional[BaseTool]:
+        """Most likely tool by routing history (else the local guess), if it can plan on its own."""
+        if not self.speculative:
+            return None
+        name = router_service.stats.most_likely_tool() or (prediction.tool_name if prediction else None)
+        if name is None:
+            return None
+        try:
+            tool = tool_registry.get_tool(name)
+        except ValueError:
+            return None
+        return tool if tool.cache_version is not None else None
+
 # Singleton
-generation_service = GenerationService()
\ No newline at end of file
+generation_service = GenerationService()
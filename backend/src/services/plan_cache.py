@@ -0,0 +1,64 @@
+import hashlib
+import json
+import logging
+from typing import Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from src.config import settings
+from src.core.base_tool import BaseTool
+from src.core.registry import tool_registry
+from src.services.cache import PersistentLRUCache
+
+log = logging.getLogger(__name__)
+
+
+def plan_cache_key(user_prompt: str) -> str:
+    """
+    Clé d'un prompt : seuls les espaces sont compactés ('Triangle  ABC' == 'Triangle ABC').
+    La casse et les accents restent : 'triangle abc' et 'triangle ABC' n'ont pas les mêmes points.
+    """
+    return hashlib.sha1(" ".join(user_prompt.split()).encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """
+    Cache prompt (espaces compactés) -> plan validé d'un outil.
+    Chaque entrée mémorise l'outil et sa `cache_version` (modèle, prompt système) :
+    un succès saute le routeur ET l'appel LLM de l'outil, il ne reste qu'à rendre.
+    """
+    def __init__(self, store: PersistentLRUCache):
+        self.store = store
+
+    async def lookup(self, user_prompt: str) -> Optional[Tuple[BaseTool, BaseModel]]:
+        raw = await self.store.aget(plan_cache_key(user_prompt))
+        if raw is None:
+            return None
+        try:
+            entry = json.loads(raw)
+            tool = tool_registry.get_tool(entry["tool_name"])
+            if tool.cache_version is None or tool.cache_version != entry["cache_version"]:
+                log.info(f"Plan cache: stale entry for '{entry['tool_name']}' (tool version changed).")
+                return None
+            plan = tool.input_model.model_validate(entry["plan"])
+        except (ValueError, KeyError, ValidationError) as e:
+            log.warning(f"Plan cache: unusable entry ignored: {e}")
+            return None
+        return tool, plan
+
+    async def store_plan(self, user_prompt: str, tool: BaseTool, plan: BaseModel):
+        if tool.cache_version is None:
+            return
+        entry = {
+            "tool_name": tool.name,
+            "cache_version": tool.cache_version,
+            "plan": plan.model_dump(mode="json"),
+        }
+        await self.store.aput(plan_cache_key(user_prompt), json.dumps(entry, ensure_ascii=False))
+
+
+plan_cache = PlanCache(PersistentLRUCache(
+    settings.PLAN_CACHE_PATH,
+    max_entries=settings.PLAN_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.PLAN_CACHE_TTL_SECONDS,
+))
@@ -0,0 +1,45 @@
+import json
+import logging
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from src.config import settings
+from src.core.base_tool import ToolResult
+from src.services.cache import PersistentLRUCache
+
+log = logging.getLogger(__name__)
+
+
+class ResultStore:
+    """
+    Résultats déjà renvoyés au client, par `result_id` : le plan (`json_content`) et
+    l'outil qui l'a produit. Une requête de suite (« ajoute la hauteur issue de C »)
+    repart de là au lieu de régénérer toute la figure.
+    """
+    def __init__(self, store: PersistentLRUCache):
+        self.store = store
+
+    async def save(self, result: ToolResult, user_prompt: str) -> str:
+        result_id = uuid.uuid4().hex
+        entry = {"tool_name": result.tool_name, "prompt": user_prompt, "plan": result.json_content}
+        await self.store.aput(result_id, json.dumps(entry, ensure_ascii=False))
+        return result_id
+
+    async def load(self, result_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(nom de l'outil, plan) ou None si inconnu / expiré."""
+        raw = await self.store.aget(result_id)
+        if raw is None:
+            return None
+        try:
+            entry = json.loads(raw)
+            return entry["tool_name"], entry["plan"]
+        except (ValueError, KeyError) as e:
+            log.warning(f"Result store: unusable entry '{result_id}' ignored: {e}")
+            return None
+
+
+result_store = ResultStore(PersistentLRUCache(
+    settings.RESULT_STORE_PATH,
+    max_entries=settings.RESULT_STORE_MAX_ENTRIES,
+    ttl_seconds=settings.RESULT_STORE_TTL_SECONDS,
+))
@@ -0,0 +1,37 @@
+import math
+from collections import Counter
+from typing import List, Sequence
+
+
+class BM25Index:
+    """
+    Index BM25 (Okapi) minimal, en mémoire, sur des documents déjà tokenisés.
+    Suffisant pour quelques centaines de sections ; aucune dépendance externe.
+    """
+    def __init__(self, documents: Sequence[Sequence[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(doc) for doc in documents]
+        self.lengths = [len(doc) for doc in documents]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        doc_freq = Counter(word for doc in self.term_freqs for word in doc)
+        count = len(documents)
+        self.idf = {
+            word: math.log(1 + (count - freq + 0.5) / (freq + 0.5))
+            for word, freq in doc_freq.items()
+        }
+
+    def scores(self, query: Sequence[str]) -> List[float]:
+        """Score BM25 de chaque document pour la requête (mots inconnus ignorés)."""
+        terms = [word for word in set(query) if word in self.idf]
+        results = []
+        for freqs, length in zip(self.term_freqs, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self.avg_length or 1.0))
+            score = 0.0
+            for word in terms:
+                tf = freqs.get(word)
+                if tf:
+                    score += self.idf[word] * tf * (self.k1 + 1) / (tf + norm)
+            results.append(score)
+        return results
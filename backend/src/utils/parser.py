@@ -1,48 +1,128 @@
-import json
-import re
 import logging
-from typing import Any, Dict, Union, Type, TypeVar
-from pydantic import BaseModel, ValidationError
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union, Type, TypeVar
+from pydantic import BaseModel, TypeAdapter, ValidationError
 import json_repair
+import orjson
+
+from src.core import metrics
 
 log = logging.getLogger(__name__)
 
 # Generic type for Pydantic models
 T = TypeVar("T", bound=BaseModel)
 
-def extract_json_from_text(text: str) -> Dict[str, Any]:
+_JSON_OPENERS = {"{": "}", "[": "]"}
+_JSON_CLOSERS = {"}": "{", "]": "["}
+_JSON_OPENER_SEARCH = re.compile(r'[{\[]')
+_JSON_STRUCTURAL = re.compile(r'[{}\[\]"]')
+# Fin d'une chaîne JSON (le guillemet ouvrant est déjà consommé)
+_JSON_STRING_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+def iter_json_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """
+    Single pass over `text` yielding the (start, end) slices of every outermost
+    balanced JSON object/array, in order. Strings and escapes are tracked inside
+    structures so braces in labels (`"$\\{A\\}$"`) don't fool the count.
+    A structure still open at the end of the text (truncated output) is yielded too.
+    """
+    stack: List[str] = []
+    start = 0
+    pos = 0
+    while True:
+        match = _JSON_STRUCTURAL.search(text, pos)
+        if match is None:
+            break
+        char = match.group()
+        index = match.start()
+        pos = index + 1
+
+        if char == '"':
+            if stack:
+                # On saute la chaîne d'un coup (échappements compris)
+                string_end = _JSON_STRING_TAIL.match(text, pos)
+                if string_end is None:
+                    break  # Chaîne non terminée : sortie tronquée
+                pos = string_end.end()
+        elif char in _JSON_OPENERS:
+            if not stack:
+                start = index
+            stack.append(char)
+        elif stack:
+            if stack[-1] != _JSON_CLOSERS[char]:
+                stack.clear()  # Structure cassée : on repart de zéro
+                continue
+            stack.pop()
+            if not stack:
+                yield start, index + 1
+        # Sinon : fermante orpheline dans la prose, on ignore
+
+    if stack:
+        yield start, len(text)
+
+def extract_json_from_text(text: str) -> Union[Dict[str, Any], List[Any]]:
     """
     Robustly extracts and parses JSON from a raw LLM string response.
     
     Strategies:
     1. Direct parsing (best case).
-    2. Regex extraction of code blocks (```json ... ```).
-    3. `json_repair` library (for missing quotes, trailing commas, etc.).
+    2. Widest `{...}`/`[...]` slice (Markdown fences, prose around), decoded with orjson.
+    3. Linear scan for balanced JSON objects/arrays, each candidate decoded with orjson.
+       The biggest object wins over smaller ones and over arrays.
+    4. `json_repair` library (for missing quotes, trailing commas, etc.), last resort only.
     """
     text = text.strip()
     
     # Strategy 1: The "Clean" attempt
     # Sometimes the LLM returns just the JSON.
     try:
-        return json.loads(text)
-    except json.JSONDecodeError:
+        decoded = orjson.loads(text)
+        if isinstance(decoded, (dict, list)):
+            return decoded
+    except orjson.JSONDecodeError:
         pass # Continue to Strategy 2
 
-    # Strategy 2: Extract from Markdown Code Blocks
-    # LLMs love to wrap JSON in ```json ... ```
-    match = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.DOTALL)
-    if match:
-        json_str = match.group(1)
+    # Strategy 2: Widest candidate (first opener -> last closer)
+    # LLMs love to wrap JSON in ```json ... ``` or to chat around it: one orjson call covers it
+    opener = _JSON_OPENER_SEARCH.search(text)
+    closer_index = max(text.rfind("}"), text.rfind("]"))
+    if opener is not None and closer_index > opener.start():
         try:
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            pass # Continue to Strategy 3 with the extracted string
+            decoded = orjson.loads(text[opener.start():closer_index + 1])
+            if isinstance(decoded, (dict, list)):
+                return decoded
+        except orjson.JSONDecodeError:
+            pass # Continue to Strategy 3
+
+    # Strategy 3: Balanced-brace scan (several blocks, stray brackets in the prose...)
+    # The biggest object wins (the plan, not an inline example); arrays only if no object.
+    best = None
+    first_list = None
+    first_span = None
+    for span_start, span_end in iter_json_spans(text):
+        candidate = text[span_start:span_end]
+        if first_span is None or (candidate[0] == "{" and first_span[0] != "{"):
+            first_span = candidate
+        try:
+            decoded = orjson.loads(candidate)
+        except orjson.JSONDecodeError:
+            continue
+        if isinstance(decoded, dict):
+            if best is None or span_end - span_start > best[0]:
+                best = (span_end - span_start, decoded)
+        elif first_list is None:
+            first_list = decoded
+    if best is not None:
+        return best[1]
+    if first_list is not None:
+        return first_list
     
-    # Strategy 3: The "Heavy Lifter" (json_repair)
+    # Strategy 4: The "Heavy Lifter" (json_repair)
     # This library fixes trailing commas, missing quotes, comments, etc.
     try:
-        # We try on the regex match if it existed, otherwise on the full text
-        target_text = match.group(1) if match else text
+        # We try on the first (object) candidate if it existed, otherwise on the full text
+        target_text = first_span if first_span is not None else text
         decoded = json_repair.loads(target_text)
         
         # Security check: json_repair sometimes returns a string if it fails hard
@@ -56,20 +136,135 @@ def extract_json_from_text(text: str) -> Dict[str, Any]:
         log.debug(f"Raw output causing failure: {text}")
         raise ValueError(f"CRITICAL: Could not extract valid JSON from LLM response. {e}")
 
-def parse_llm_output_to_model(raw_text: str, model_class: Type[T]) -> T:
+@lru_cache(maxsize=None)
+def get_type_adapter(model_class: Type[T]) -> TypeAdapter:
+    """
+    Returns the (module-level cached) TypeAdapter of a model.
+    Building the validator is costly for big unions like `Geometry2DInput`: do it once.
+    """
+    return TypeAdapter(model_class)
+
+def _is_json_syntax_error(error: ValidationError) -> bool:
+    """True when pydantic-core rejected the text itself (not the data it contains)."""
+    return all(err["type"] == "json_invalid" for err in error.errors())
+
+def parse_llm_output_to_model(raw_text: str, model_class: Type[T], context: Optional[Dict[str, Any]] = None) -> T:
     """
     Helper that extracts JSON and immediately validates it against a Pydantic Model.
     This is the function you will use in your Service.
+    `context` is forwarded to Pydantic validators (e.g. `{"reorder_steps": True}`).
+
+    Fast path: the raw text is validated straight into the model by pydantic-core's
+    JSON parser (no intermediate dict). Extraction/repair only runs if the text is
+    not strict JSON (Markdown fences, prose, trailing commas...).
     """
+    adapter = get_type_adapter(model_class)
     try:
-        # 1. Get the dictionary
-        data_dict = extract_json_from_text(raw_text)
+        # 1. Fast path: strict JSON text -> model
+        try:
+            with metrics.stage("validation"):
+                return adapter.validate_json(raw_text.strip(), context=context)
+        except ValidationError as ve:
+            if not _is_json_syntax_error(ve):
+                raise
+            log.debug("LLM output is not strict JSON, falling back to extraction/repair.")
+
+        # 2. Get the dictionary
+        with metrics.stage("json_extraction"):
+            data_dict = extract_json_from_text(raw_text)
         
-        # 2. Validate with Pydantic
-        return model_class.model_validate(data_dict)
+        # 3. Validate with Pydantic
+        with metrics.stage("validation"):
+            return adapter.validate_python(data_dict, context=context)
         
     except ValidationError as ve:
         log.error(f"JSON Structure matches schema but data is invalid: {ve}")
         raise ve
     except Exception as e:
-        raise e
\ No newline at end of file
+        raise e
+
+class StreamingArrayParser:
+    """
+    Incremental parser for a JSON object streamed by an LLM.
+
+    Fed chunk by chunk, it returns every element of `array_key` (a top-level array,
+    e.g. `construction_steps`) as soon as its closing brace arrives, and sets
+    `closed` once the top-level object itself is complete, so the caller can stop
+    reading the stream. Text before the first `{` (fences, prose) is ignored.
+    Elements that fail to decode are skipped: the final parse of `text` has the last word.
+    """
+    def __init__(self, array_key: str):
+        self.array_key = array_key
+        self.text = ""
+        self.closed = False
+        self.start = None            # Index du `{` racine dans `text`
+        self.end = None              # Index de fin de l'objet racine dans `text`
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_key = None        # Dernière chaîne vue au niveau racine
+        self._array_depth = None     # Profondeur de pile à l'intérieur du tableau suivi
+        self._element_start = None
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Adds a chunk of text and returns the array elements completed by it."""
+        if self.closed or not chunk:
+            self.text += chunk
+            return []
+        self.text += chunk
+        completed = []
+        text, stack = self.text, self._stack
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(stack) == 1:
+                        self._last_key = text[self._string_start:i]
+                continue
+
+            if char == '"':
+                if stack:
+                    self._in_string = True
+                    self._string_start = i + 1
+            elif char in _JSON_OPENERS:
+                if not stack:
+                    if char != "{":
+                        continue  # Tableau dans la prose avant l'objet
+                    self.start = i
+                stack.append(char)
+                if char == "[" and len(stack) == 2 and self._last_key == self.array_key:
+                    self._array_depth = 2
+                elif char == "{" and self._array_depth is not None and len(stack) == self._array_depth + 1:
+                    self._element_start = i
+            elif char in _JSON_CLOSERS and stack:
+                if stack[-1] != _JSON_CLOSERS[char]:
+                    continue  # JSON cassé : on laisse le parse final trancher
+                stack.pop()
+                if self._element_start is not None and len(stack) == self._array_depth:
+                    try:
+                        completed.append(orjson.loads(text[self._element_start:i + 1]))
+                    except orjson.JSONDecodeError:
+                        log.debug("Streamed array element is not strict JSON, skipped.")
+                    self._element_start = None
+                elif self._array_depth is not None and len(stack) == self._array_depth - 1:
+                    self._array_depth = None  # Fin du tableau suivi
+                if not stack:
+                    self.closed = True
+                    self.end = i + 1
+                    break
+        self._pos = len(text) if not self.closed else self.end
+        return completed
+
+    @property
+    def document(self) -> str:
+        """The top-level JSON object once closed (without fences or trailing tokens), else all the text."""
+        if self.closed:
+            return self.text[self.start:self.end]
+        return self.text
@@ -0,0 +1,184 @@
+"""
+Schémas JSON des modèles Pydantic, allégés pour le décodage contraint des fournisseurs
+(`response_format` de type `json_schema`).
+
+Les fournisseurs refusent (ou servent très lentement) les gros schémas : Gemini et
+OpenAI limitent la taille des unions, le nombre de définitions et ignorent ou
+rejettent des mots-clés comme `discriminator` ou `default`. `trim_schema` :
+  - retire ces mots-clés ;
+  - réduit chaque union discriminée trop large aux variantes utiles (`keep_tags`),
+    les autres étant regroupées dans une variante générique (`type` parmi les
+    valeurs retirées) : le modèle garde le droit de s'en servir, sans le détail.
+    Sans `keep_tags`, l'union reste complète (sinon plus aucun champ n'est contraint) ;
+  - remplace les `prefixItems` des tuples par un `items` (Gemini ne connaît que `items`) ;
+  - supprime les `$defs` devenues inutiles.
+
+Les objets libres (`Dict[str, ...]`) n'ont pas d'équivalent côté Gemini (OBJECT sans
+propriétés refusé) : les champs facultatifs de ce type sont retirés du schéma (le
+modèle passe par l'autre forme du champ, cf. `label_points`), et `has_free_form_objects`
+signale les schémas qui en gardent (à ne pas envoyer).
+"""
+import copy
+from functools import lru_cache
+from typing import Any, Collection, Dict, Optional, Set, Type
+
+from pydantic import BaseModel
+
+# Mots-clés sans effet sur la génération, ou rejetés par certains fournisseurs
+DROPPED_KEYWORDS = ("title", "default", "examples", "discriminator")
+
+
+@lru_cache(maxsize=None)
+def _model_schema(model_class: Type[BaseModel]) -> Dict[str, Any]:
+    return model_class.model_json_schema()
+
+
+def clear_schema_cache():
+    """À appeler quand un modèle change après coup (ex: étape tierce ajoutée à une union)."""
+    _model_schema.cache_clear()
+
+
+def _trim_unions(node: Any, max_variants: int, keep_tags: Optional[Collection[str]]):
+    if isinstance(node, list):
+        for item in node:
+            _trim_unions(item, max_variants, keep_tags)
+        return
+    if not isinstance(node, dict):
+        return
+
+    discriminator = node.get("discriminator")
+    union_key = "oneOf" if "oneOf" in node else "anyOf" if "anyOf" in node else None
+    if isinstance(discriminator, dict) and union_key and "mapping" in discriminator:
+        mapping: Dict[str, str] = discriminator["mapping"]
+        if keep_tags is not None and len(mapping) > max_variants:
+            kept = [tag for tag in mapping if tag in keep_tags][:max(max_variants - 1, 0)]
+            dropped = [tag for tag in mapping if tag not in kept]
+            variants = [{"$ref": mapping[tag]} for tag in kept]
+            if dropped:
+                variants.append({
+                    "type": "object",
+                    "properties": {discriminator["propertyName"]: {"type": "string", "enum": dropped}},
+                    "required": [discriminator["propertyName"]],
+                })
+            node[union_key] = variants
+        # Les fournisseurs gèrent `anyOf`, pas toujours `oneOf`
+        node["anyOf"] = node.pop(union_key)
+
+    for key, value in node.items():
+        _trim_unions(value, max_variants, keep_tags)
+
+
+def _tuples_to_items(node: Any):
+    """`prefixItems` (tuples) -> `items` ; la longueur reste fixée par `minItems` / `maxItems`."""
+    if isinstance(node, list):
+        for item in node:
+            _tuples_to_items(item)
+        return
+    if not isinstance(node, dict):
+        return
+    prefix = node.pop("prefixItems", None)
+    if prefix is not None and "items" not in node:
+        distinct = [item for position, item in enumerate(prefix) if item not in prefix[:position]]
+        node["items"] = distinct[0] if len(distinct) == 1 else {"anyOf": distinct}
+    for value in node.values():
+        _tuples_to_items(value)
+
+
+def _is_free_form(node: Any) -> bool:
+    if not isinstance(node, dict):
+        return False
+    if "anyOf" in node:
+        options = [option for option in node["anyOf"] if option != {"type": "null"}]
+        return bool(options) and all(_is_free_form(option) for option in options)
+    return node.get("type") == "object" and not node.get("properties")
+
+
+def _drop_free_form_fields(node: Any):
+    """Retire les champs facultatifs dont la valeur est un objet libre."""
+    if isinstance(node, list):
+        for item in node:
+            _drop_free_form_fields(item)
+        return
+    if not isinstance(node, dict):
+        return
+    properties = node.get("properties")
+    if isinstance(properties, dict):
+        required = set(node.get("required", ()))
+        for name in [name for name, value in properties.items() if name not in required and _is_free_form(value)]:
+            del properties[name]
+    for value in node.values():
+        _drop_free_form_fields(value)
+
+
+def has_free_form_objects(node: Any) -> bool:
+    """Le schéma contient-il un objet sans propriétés déclarées (`Dict[str, Any]`) ?"""
+    if isinstance(node, list):
+        return any(has_free_form_objects(item) for item in node)
+    if not isinstance(node, dict):
+        return False
+    if node.get("type") == "object" and not node.get("properties"):
+        return True
+    return any(has_free_form_objects(value) for value in node.values())
+
+
+def _drop_keywords(node: Any) -> Any:
+    if isinstance(node, list):
+        return [_drop_keywords(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    cleaned = {}
+    for key, value in node.items():
+        if key in ("properties", "$defs"):
+            # Ici les clés sont des noms (un champ peut s'appeler `title`)
+            cleaned[key] = {name: _drop_keywords(item) for name, item in value.items()}
+        elif key not in DROPPED_KEYWORDS:
+            cleaned[key] = _drop_keywords(value)
+    return cleaned
+
+
+def _collect_refs(node: Any, refs: Set[str]):
+    if isinstance(node, list):
+        for item in node:
+            _collect_refs(item, refs)
+    elif isinstance(node, dict):
+        ref = node.get("$ref")
+        if isinstance(ref, str):
+            refs.add(ref.rsplit("/", 1)[-1])
+        for value in node.values():
+            _collect_refs(value, refs)
+
+
+def _prune_defs(schema: Dict[str, Any]):
+    """Ne garde que les `$defs` atteignables depuis la racine."""
+    defs = schema.get("$defs")
+    if not defs:
+        return
+    reachable: Set[str] = set()
+    _collect_refs({k: v for k, v in schema.items() if k != "$defs"}, reachable)
+    pending = list(reachable)
+    while pending:
+        found: Set[str] = set()
+        _collect_refs(defs.get(pending.pop()), found)
+        for name in found - reachable:
+            reachable.add(name)
+            pending.append(name)
+    schema["$defs"] = {name: value for name, value in defs.items() if name in reachable}
+
+
+def trim_schema(
+    model_class: Type[BaseModel],
+    max_variants: int = 32,
+    keep_tags: Optional[Collection[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Schéma JSON de `model_class` prêt pour un `response_format` (voir la docstring du module).
+    `keep_tags` : valeurs du discriminant à garder en détail quand une union dépasse `max_variants`
+    (None : aucune sélection, toutes les unions restent complètes).
+    """
+    schema = copy.deepcopy(_model_schema(model_class))
+    _trim_unions(schema, max_variants, set(keep_tags) if keep_tags is not None else None)
+    _tuples_to_items(schema)
+    schema = _drop_keywords(schema)
+    _drop_free_form_fields(schema)
+    _prune_defs(schema)
+    return schema
@@ -0,0 +1,30 @@
+import re
+import unicodedata
+from typing import List
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Mots vides FR/EN : ils ne disent rien de l'outil à utiliser.
+STOP_WORDS = frozenset({
+    "a", "an", "and", "de", "des", "du", "en", "et", "for", "in", "is", "la", "le", "les",
+    "of", "on", "or", "the", "to", "un", "une", "with", "avec", "dans", "sur", "pour", "par",
+})
+
+
+def fold_accents(text: str) -> str:
+    """Supprime les accents : 'médiatrice' -> 'mediatrice'."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def normalize_text(text: str) -> str:
+    """Minuscules, sans accents, espaces compactés."""
+    return " ".join(fold_accents(text).lower().split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Découpe un texte normalisé en mots (sans les mots vides ni les lettres isolées)."""
+    return [
+        word for word in _WORD_PATTERN.findall(normalize_text(text))
+        if len(word) > 1 and word not in STOP_WORDS
+    ]